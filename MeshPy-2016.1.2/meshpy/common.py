@@ -38,6 +38,210 @@ def _linebreak_list(list, per_line=10, pad=None):
 
 
 
+def _foreign_array_dtype(fa):
+    import numpy as np
+    if type(fa).__name__ == "RealArray":
+        return np.float64
+    else:
+        return np.intc
+
+
+def _foreign_array_shape(fa):
+    if fa.unit == 1:
+        return (len(fa),)
+    else:
+        return (len(fa), fa.unit)
+
+
+def foreign_array_as_numpy(fa):
+    """Return the contents of the foreign array *fa* as a :mod:`numpy`
+    array of shape ``(len(fa), fa.unit)``, or ``(len(fa),)`` if the unit
+    is 1. Returns *None* if *fa* is not allocated.
+
+    If the extension module supports it, the result shares memory with *fa*,
+    so that no per-item copies are made. It then stays valid as long as *fa*
+    is not resized or deallocated, and writing to it writes to *fa*. Otherwise
+    a copy is returned.
+
+    :param fa: a foreign array such as :attr:`MeshInfo.points`. Anything
+      else, e.g. a :mod:`numpy` array or a list, is passed through
+      :func:`numpy.asarray`.
+    """
+    import numpy as np
+
+    if not hasattr(fa, "unit"):
+        return np.asarray(fa)
+
+    dtype = _foreign_array_dtype(fa)
+    shape = _foreign_array_shape(fa)
+
+    if not fa.allocated:
+        if len(fa) == 0 or fa.unit == 0:
+            return np.zeros(shape, dtype=dtype)
+        else:
+            return None
+
+    try:
+        buf = fa._buffer()
+    except (AttributeError, NotImplementedError):
+        return np.array([fa[i] for i in range(len(fa))], dtype=dtype).reshape(shape)
+    else:
+        return np.frombuffer(buf, dtype=dtype).reshape(shape)
+
+
+def _copy_to_foreign_array(fa, values):
+    """Copy *values* into the already allocated foreign array *fa*, in bulk
+    if the extension module supports it.
+    """
+    import numpy as np
+
+    values = np.asarray(values, dtype=_foreign_array_dtype(fa))
+    shape = _foreign_array_shape(fa)
+
+    if len(fa) == 0:
+        return
+
+    try:
+        buf = fa._buffer()
+    except (AttributeError, NotImplementedError):
+        for i, value in enumerate(values.tolist()):
+            fa[i] = value
+    else:
+        np.frombuffer(buf, dtype=values.dtype).reshape(shape)[...] = \
+                values.reshape(shape)
+
+
+
+
+class FaceMarkerTable:
+    """A table of faces to face markers, for looking up many faces at once.
+
+    Each face is keyed by its sorted vertex indices, packed into a single
+    64-bit integer. The keys are kept sorted, so that a lookup is a binary
+    search. This takes a small fraction of the memory of a :class:`dict` of
+    :class:`frozenset` keys.
+
+    If the vertex indices are too large to pack a whole face, they are
+    packed one at a time, each time replacing the key of the vertices
+    before it by its rank among the keys of the table.
+
+    :param faces: the vertex indices of the faces, an array of shape
+      ``(nfaces, nvertices_per_face)``, e.g. :attr:`MeshInfo.faces`.
+    :param face_markers: the marker of each face, e.g.
+      :attr:`MeshInfo.face_markers`.
+    :param npoints: the number of points of the mesh. Defaults to one
+      more than the largest vertex index in *faces*.
+    """
+
+    def __init__(self, faces, face_markers, npoints=None):
+        import numpy as np
+
+        faces = np.asarray(foreign_array_as_numpy(faces), dtype=np.int64)
+        face_markers = np.asarray(
+                foreign_array_as_numpy(face_markers), dtype=np.int64).reshape(-1)
+
+        if faces.ndim != 2:
+            faces = faces.reshape(len(face_markers), -1)
+        assert len(faces) == len(face_markers)
+
+        self.vertices_per_face = faces.shape[1]
+        if npoints is None:
+            npoints = int(faces.max()) + 1 if faces.size else 1
+        self.npoints = max(int(npoints), 1)
+
+        # the packed keys only fit into an int64 for up to
+        # 2**(63/vertices_per_face) points
+        self.packed = self.npoints**self.vertices_per_face < 2**63
+
+        if self.packed:
+            keys = self._keys(faces)
+        else:
+            # the sorted keys of the leading vertices, before each vertex
+            faces = np.sort(faces, axis=1)
+            self.rank_keys = []
+            keys = faces[:, 0].copy()
+            for i in range(1, self.vertices_per_face):
+                self.rank_keys.append(np.unique(keys))
+                keys = np.searchsorted(self.rank_keys[-1], keys)
+                keys *= self.npoints
+                keys += faces[:, i]
+
+        order = np.argsort(keys)
+        self.keys = keys[order]
+        self.markers = face_markers[order]
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _keys(self, faces):
+        import numpy as np
+
+        faces = np.sort(faces, axis=1)
+        keys = faces[:, 0].copy()
+        for i in range(1, faces.shape[1]):
+            keys *= self.npoints
+            keys += faces[:, i]
+        return keys
+
+    def _ranked_keys(self, faces):
+        """Return the keys of *faces* when they can't be packed, and
+        whether their leading vertices are in the table at all.
+        """
+        import numpy as np
+
+        faces = np.sort(faces, axis=1)
+        known = np.ones(len(faces), dtype=bool)
+        keys = faces[:, 0].copy()
+        for i, rank_keys in enumerate(self.rank_keys):
+            rank = np.minimum(
+                    np.searchsorted(rank_keys, keys), len(rank_keys)-1)
+            known &= rank_keys[rank] == keys
+            keys = rank*self.npoints + faces[:, i+1]
+        return keys, known
+
+    def lookup(self, faces, default=None):
+        """Return the markers of *faces*, an array of shape
+        ``(n, vertices_per_face)``, as an :mod:`numpy` array of length *n*.
+
+        The vertex order within each face does not matter. If a face is not
+        in the table, raise :exc:`KeyError` if *default* is *None*, otherwise
+        return *default* as its marker.
+        """
+        import numpy as np
+
+        faces = np.asarray(faces, dtype=np.int64).reshape(
+                -1, self.vertices_per_face)
+
+        if len(faces) == 0:
+            return np.zeros(0, dtype=np.int64)
+
+        found = np.zeros(len(faces), dtype=bool)
+        in_range = np.all((faces >= 0) & (faces < self.npoints), axis=1)
+        pos = np.zeros(len(faces), dtype=np.intp)
+        if len(self.keys):
+            if self.packed:
+                keys = self._keys(faces[in_range])
+            else:
+                keys, known = self._ranked_keys(faces[in_range])
+                in_range[in_range] = known
+                keys = keys[known]
+            pos[in_range] = np.minimum(
+                    np.searchsorted(self.keys, keys), len(self.keys)-1)
+            found[in_range] = self.keys[pos[in_range]] == keys
+
+        if default is None:
+            if not found.all():
+                raise KeyError("face %s not in table"
+                        % faces[np.argmin(found)].tolist())
+            return self.markers[pos]
+        else:
+            result = np.full(len(faces), default, dtype=np.int64)
+            result[found] = self.markers[pos[found]]
+            return result
+
+
+
+
 class MeshInfoBase:
     @property
     def face_vertex_indices_to_face_marker(self):
@@ -52,23 +256,46 @@ class MeshInfoBase:
             self._fvi2fm = result
             return result
 
+    @property
+    def face_marker_table(self):
+        """A :class:`FaceMarkerTable` of :attr:`faces` to
+        :attr:`face_markers`. Use this instead of
+        :attr:`face_vertex_indices_to_face_marker` to look up many faces.
+        """
+        try:
+            return self._fmtable
+        except AttributeError:
+            self._fmtable = FaceMarkerTable(
+                    self.faces, self.face_markers, len(self.points))
+            return self._fmtable
+
+    def face_markers_of(self, faces, default=None):
+        """Return the markers of *faces* as an :mod:`numpy` array, see
+        :meth:`FaceMarkerTable.lookup`.
+        """
+        return self.face_marker_table.lookup(faces, default)
+
 
 
 
 
     def set_points(self, points, point_markers=None):
+        """Set the points, and optionally their markers.
+
+        :param points: a list of points or a :mod:`numpy` array of
+          shape ``(n, dim)``.
+        :param point_markers: Either None or a list of integers of the
+          same length as *points*.
+        """
         if point_markers is not None:
-            assert len(point_markers) == len(point_markers)
+            assert len(point_markers) == len(points)
 
         self.points.resize(len(points))
-
-        for i, pt in enumerate(points):
-            self.points[i] = pt
+        _copy_to_foreign_array(self.points, points)
 
         if point_markers is not None:
             self.point_markers.setup()
-            for i, mark in enumerate(point_markers):
-                self.point_markers[i] = mark
+            _copy_to_foreign_array(self.point_markers, point_markers)
 
 
 
@@ -76,8 +303,7 @@ class MeshInfoBase:
 
     def set_holes(self, hole_starts):
         self.holes.resize(len(hole_starts))
-        for i, hole in enumerate(hole_starts):
-            self.holes[i] = hole
+        _copy_to_foreign_array(self.holes, hole_starts)
 
 
 
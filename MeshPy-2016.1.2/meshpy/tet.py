@@ -1,12 +1,92 @@
 from __future__ import absolute_import
 from __future__ import print_function
-from meshpy.common import MeshInfoBase, dump_array
+from meshpy.common import MeshInfoBase, dump_array, _copy_to_foreign_array
 import meshpy._tetgen as internals
+import numpy as np
 import six
 from six.moves import range
 
 
 class MeshInfo(internals.MeshInfo, MeshInfoBase):
+    # Slave arrays (e.g. point_markers) must come after the array they are
+    # tied to (e.g. points), since resizing that reallocates them.
+    _constituents = [
+            "points", "point_attributes", "point_metric_tensors",
+            "point_markers",
+            "elements", "element_attributes", "element_volumes",
+            "neighbors",
+            "facets", "facet_markers",
+            "holes",
+            "regions",
+            "facet_constraints", "segment_constraints",
+            "faces", "adjacent_elements", "face_markers",
+            "edges", "edge_markers", "edge_adjacent_elements",
+            ]
+
+    # Only cached lookup tables live in the instance dict, and they are
+    # rebuilt on demand.
+    __getstate_manages_dict__ = True
+
+    def _get_facets_state(self):
+        if len(self.facets) == 0:
+            return None
+
+        return [
+                ([list(polygon.vertices) for polygon in facet.polygons],
+                    [list(hole) for hole in facet.holes])
+                for facet in self.facets]
+
+    def __getstate__(self):
+        from meshpy.common import foreign_array_as_numpy
+
+        state = []
+        for name in self._constituents:
+            if name == "facets":
+                state.append((name, self._get_facets_state()))
+                continue
+
+            array = getattr(self, name)
+            if array.allocated:
+                state.append((name, np.array(foreign_array_as_numpy(array))))
+            else:
+                state.append((name, None))
+
+        return self.number_of_point_attributes, \
+               self.number_of_point_metric_tensors, \
+               self.number_of_element_vertices, \
+               self.number_of_element_attributes, \
+               state
+
+    def __setstate__(self, state):
+        (p_attr_count, p_mtr_count, e_vert_count, e_attr_count, state) = state
+        self.number_of_point_attributes = p_attr_count
+        self.number_of_point_metric_tensors = p_mtr_count
+        self.number_of_element_vertices = e_vert_count
+        self.number_of_element_attributes = e_attr_count
+
+        for name, array in state:
+            if name not in self._constituents:
+                raise RuntimeError("Unknown constituent during unpickling")
+
+            if name == "facets":
+                if array is not None:
+                    self.set_facets_ex(
+                            [polygons for polygons, holes in array],
+                            facet_holestarts=[holes for polygons, holes in array])
+                continue
+
+            dest_array = getattr(self, name)
+
+            if array is None:
+                dest_array.deallocate()
+            else:
+                if len(dest_array) != len(array):
+                    dest_array.resize(len(array))
+                if not dest_array.allocated and len(array) > 0:
+                    dest_array.setup()
+
+                _copy_to_foreign_array(dest_array, array)
+
     def set_facets(self, facets, markers=None):
         """Set a list of simple, single-polygon factes. Unlike :meth:`set_facets_ex`,
         :meth:`set_facets` does not allow hole and only lets you use a single
@@ -19,27 +99,39 @@ class MeshInfo(internals.MeshInfo, MeshInfoBase):
           to its corresponding facet.
 
         :note: When the above says "list", any repeatable iterable
-          also accepted instead.
+          also accepted instead. If all facets have the same number of
+          vertices (e.g. a :mod:`numpy` array of shape ``(n, 3)``), they
+          are set in bulk.
         """
 
-        if markers:
+        has_markers = markers is not None and len(markers) > 0
+        if has_markers:
             assert len(markers) == len(facets)
 
-        self.facets.resize(len(facets))
-
-        for i, vlist in enumerate(facets):
-            facet = self.facets[i]
-            polys = facet.polygons
-            polys.resize(1)
-            poly = facet.polygons[0]
-            poly.vertices.resize(len(vlist))
-            for j, pt_idx in enumerate(vlist):
-                poly.vertices[j] = pt_idx
-
-        if markers:
+        try:
+            facet_array = np.ascontiguousarray(facets, dtype=np.intc)
+        except (ValueError, TypeError):
+            facet_array = None
+
+        if (facet_array is not None and facet_array.ndim == 2
+                and facet_array.shape[1] > 0
+                and hasattr(self, "_set_simple_facets")):
+            self._set_simple_facets(facet_array, facet_array.shape[1])
+        else:
+            self.facets.resize(len(facets))
+
+            for i, vlist in enumerate(facets):
+                facet = self.facets[i]
+                polys = facet.polygons
+                polys.resize(1)
+                poly = facet.polygons[0]
+                poly.vertices.resize(len(vlist))
+                for j, pt_idx in enumerate(vlist):
+                    poly.vertices[j] = pt_idx
+
+        if has_markers:
             self.facet_markers.setup()
-            for i, mark in enumerate(markers):
-                self.facet_markers[i] = mark
+            _copy_to_foreign_array(self.facet_markers, markers)
 
     def set_facets_ex(self, facets, facet_holestarts=None, markers=None):
         """Set a list of complicated factes. Unlike :meth:`set_facets`,
@@ -113,9 +205,7 @@ class MeshInfo(internals.MeshInfo, MeshInfoBase):
 
     def set_elements(self, elements):
         self.elements.resize(len(elements))
-
-        for i, element in enumerate(elements):
-            self.elements[i] = element
+        _copy_to_foreign_array(self.elements, elements)
 
     def set_element_constraints(self, element_constraints):
         self.element_volumes.setup()
@@ -134,6 +134,11 @@ class tReadOnlyForeignArray : public tSizeChangeNotifier, public tSizeChangeNoti
       return Contents != NULL;
     }
 
+    ElementT *data()
+    {
+      return Contents;
+    }
+
     void deallocate()
     {
       if (Contents != NULL)
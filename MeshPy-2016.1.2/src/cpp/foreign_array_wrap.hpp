@@ -104,6 +104,28 @@ namespace {
 
       self.setSub(i_main, i_sub, v);
     }
+
+    /* Expose the contents as a flat, writable buffer of bytes, without
+     * copying. The returned memoryview keeps the array alive, but is
+     * invalidated by resizing the array.
+     */
+    static object buffer(FA &self)
+    {
+#if PY_VERSION_HEX >= 0x03030000
+      if (!self.is_allocated())
+        PYTHON_ERROR(ValueError, "array unallocated");
+
+      PyObject *result = PyMemoryView_FromMemory(
+          reinterpret_cast<char *>(self.data()),
+          (Py_ssize_t) self.size() * self.unit() * sizeof(value_type),
+          PyBUF_WRITE);
+      if (result == NULL)
+        throw error_already_set();
+      return object(handle<>(result));
+#else
+      PYTHON_ERROR(NotImplementedError, "buffer access requires Python 3.3 or newer");
+#endif
+    }
   };
 
 
@@ -150,6 +172,7 @@ void exposePODForeignArray(const std::string &name)
     .def("__getitem__", (object (*)(cl &, tuple)) &w_cl::getitem)
     .def("__setitem__", (void (*)(cl &, long, object)) &w_cl::setitem)
     .def("__setitem__", (void (*)(cl &, tuple, const value_type &)) &w_cl::setitem)
+    .def("_buffer", &w_cl::buffer, with_custodian_and_ward_postcall<0, 1>())
     .def("deallocate", &cl::deallocate)
     ;
 }
@@ -129,6 +129,54 @@ namespace
         numberoftetrahedronattributes = attrs;
       }
 
+      /* Set facets consisting of a single polygon each, from a C-contiguous
+       * buffer of C ints holding verts_per_facet point indices per facet.
+       */
+      void setSimpleFacets(py::object vertex_indices, unsigned verts_per_facet)
+      {
+        Py_buffer view;
+        if (PyObject_GetBuffer(vertex_indices.ptr(), &view,
+              PyBUF_C_CONTIGUOUS | PyBUF_FORMAT) != 0)
+          throw py::error_already_set();
+
+        if (view.itemsize != sizeof(int) || view.format == NULL
+            || (std::string(view.format) != "i" && std::string(view.format) != "=i"))
+        {
+          PyBuffer_Release(&view);
+          PyErr_SetString(PyExc_TypeError, "facet vertex indices must be a buffer of C ints");
+          throw py::error_already_set();
+        }
+
+        unsigned n_indices = view.len / sizeof(int);
+        if (verts_per_facet == 0 || n_indices % verts_per_facet != 0)
+        {
+          PyBuffer_Release(&view);
+          PyErr_SetString(PyExc_ValueError, "number of facet vertex indices must be a multiple of verts_per_facet");
+          throw py::error_already_set();
+        }
+
+        unsigned n_facets = n_indices / verts_per_facet;
+        const int *src = reinterpret_cast<const int *>(view.buf);
+
+        Facets.setSize(n_facets);
+        for (unsigned i = 0; i < n_facets; i++)
+        {
+          tetgenio::facet &f = facetlist[i];
+          f.numberofpolygons = 1;
+          f.polygonlist = new tetgenio::polygon[1];
+          f.numberofholes = 0;
+          f.holelist = NULL;
+
+          tetgenio::polygon &poly = f.polygonlist[0];
+          poly.numberofvertices = verts_per_facet;
+          poly.vertexlist = new int[verts_per_facet];
+          for (unsigned j = 0; j < verts_per_facet; j++)
+            poly.vertexlist[j] = src[i*verts_per_facet + j];
+        }
+
+        PyBuffer_Release(&view);
+      }
+
 #define OVERRIDE_LOAD_WITH_ERROR_CHECK(WHAT, POSTPROC) \
       void load_##WHAT(char* filename) \
       { \
@@ -317,6 +365,9 @@ BOOST_PYTHON_MODULE(_tetgen)
       .add_property("number_of_point_attributes",
           &cl::numberOfPointAttributes,
           &cl::setNumberOfPointAttributes)
+      .add_property("number_of_point_metric_tensors",
+          &cl::numberOfPointMetricTensors,
+          &cl::setNumberOfPointMetricTensors)
       .add_property("number_of_element_vertices",
           &cl::numberOfElementVertices,
           &cl::setNumberOfElementVertices)
@@ -324,6 +375,9 @@ BOOST_PYTHON_MODULE(_tetgen)
           &cl::numberOfElementAttributes,
           &cl::setNumberOfElementAttributes)
 
+      .def("_set_simple_facets", &cl::setSimpleFacets,
+          (py::arg("vertex_indices"), py::arg("verts_per_facet")))
+
       .DEF_METHOD(save_nodes)
       .DEF_METHOD(save_elements)
       .DEF_METHOD(save_faces)
@@ -346,7 +400,7 @@ BOOST_PYTHON_MODULE(_tetgen)
          .def("copy", &copyTriangulationParameters,
          return_value_policy<manage_new_object>())
          */
-      //.enable_pickling()
+      .enable_pickling()
       ;
   }
 
@@ -109,6 +109,106 @@ def test_tetgen():
     build(mesh_info)
 
 
+def test_tetgen_face_marker_table():
+    from meshpy.tet import MeshInfo, build, Options
+    import numpy as np
+
+    mesh_info = MeshInfo()
+    mesh_info.set_points([
+        (0, 0, 0), (1, 0, 0), (1, 1, 0), (0, 1, 0),
+        (0, 0, 1), (1, 0, 1), (1, 1, 1), (0, 1, 1),
+        ])
+    mesh_info.set_facets([
+        [0, 1, 2, 3],
+        [4, 5, 6, 7],
+        [0, 4, 5, 1],
+        [1, 5, 6, 2],
+        [2, 6, 7, 3],
+        [3, 7, 4, 0],
+        ], markers=[1, 2, 3, 4, 5, 6])
+
+    mesh = build(mesh_info, options=Options("pqa0.01", facesout=True))
+
+    fvi2fm = mesh.face_vertex_indices_to_face_marker
+    faces = [list(face)[::-1] for face in mesh.faces]
+    markers = mesh.face_markers_of(faces)
+    assert list(markers) == [fvi2fm[frozenset(face)] for face in faces]
+
+    tets = np.array(list(mesh.elements))
+    tet_faces = tets[:, [[0, 1, 2], [0, 1, 3], [0, 2, 3], [1, 2, 3]]]
+    markers = mesh.face_markers_of(tet_faces, default=-1)
+    assert list(markers) == [
+            fvi2fm.get(frozenset(face), -1)
+            for face in tet_faces.reshape(-1, 3).tolist()]
+
+
+def test_face_marker_table_unpacked():
+    from meshpy.common import FaceMarkerTable
+    import numpy as np
+    import pytest
+
+    rng = np.random.RandomState(17)
+    faces = rng.randint(0, 50, size=(500, 3))
+    faces = faces[np.all(np.diff(np.sort(faces, axis=1), axis=1) > 0, axis=1)]
+    faces = np.unique(np.sort(faces, axis=1), axis=0)
+    markers = rng.randint(1, 10, size=len(faces))
+    fvi2fm = dict(
+            (frozenset(face), marker)
+            for face, marker in zip(faces.tolist(), markers.tolist()))
+
+    # indices spread out so that the faces can't be packed into an int64
+    spread = np.arange(50, dtype=np.int64) * (2**40)
+    table = FaceMarkerTable(spread[faces], markers)
+    assert not table.packed
+    assert len(table) == len(faces)
+
+    queries = rng.randint(0, 50, size=(2000, 3))
+    markers = table.lookup(spread[queries][:, ::-1], default=-1)
+    assert list(markers) == [
+            fvi2fm.get(frozenset(face), -1) for face in queries.tolist()]
+    assert list(table.lookup(spread[faces[:, [2, 0, 1]]])) == [
+            fvi2fm[frozenset(face)] for face in faces.tolist()]
+
+    with pytest.raises(KeyError):
+        table.lookup(spread[[[0, 0, 0]]] + 1)
+
+
+def test_tetgen_pickle():
+    from meshpy.tet import MeshInfo, build, Options
+    from pickle import loads, dumps
+    import numpy as np
+
+    mesh_info = MeshInfo()
+    mesh_info.set_points([
+        (0, 0, 0), (1, 0, 0), (1, 1, 0), (0, 1, 0),
+        (0, 0, 1), (1, 0, 1), (1, 1, 1), (0, 1, 1),
+        ])
+    mesh_info.set_facets([
+        [0, 1, 2, 3],
+        [4, 5, 6, 7],
+        [0, 4, 5, 1],
+        [1, 5, 6, 2],
+        [2, 6, 7, 3],
+        [3, 7, 4, 0],
+        ], markers=[1, 2, 3, 4, 5, 6])
+    mesh_info.regions.resize(1)
+    mesh_info.regions[0] = [0.5, 0.5, 0.5, 7, 0.01]
+
+    mesh_info_2 = loads(dumps(mesh_info))
+    assert len(mesh_info_2.facets) == len(mesh_info.facets)
+    assert list(mesh_info_2.facet_markers) == list(mesh_info.facet_markers)
+
+    mesh = build(mesh_info_2, options=Options("pqA", neighout=True,
+        facesout=True, regionattrib=True))
+    mesh_2 = loads(dumps(mesh))
+
+    for name in ["points", "elements", "neighbors", "faces", "face_markers",
+            "element_attributes"]:
+        assert np.array_equal(
+                np.array(list(getattr(mesh, name))),
+                np.array(list(getattr(mesh_2, name)))), name
+
+
 def test_torus():
     from math import pi, cos, sin
     from meshpy.tet import MeshInfo, build
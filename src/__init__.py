@@ -41,35 +41,61 @@ if "bpy" in locals():
     print("Reloading Neuron Launcher")
     import imp
     imp.reload(swc_mesher)
+    imp.reload(swc_morphology)
+    imp.reload(face_graph)
+    imp.reload(spatial_index)
+    imp.reload(tet_parallel)
+    imp.reload(artifact_cache)
     imp.reload(neuron_launcher_gui)
+    imp.reload(cap_triangulation)
     imp.reload(close_open_caps)
     imp.reload(surface_sections)
+    imp.reload(region_validator)
+    imp.reload(check_regions)
     imp.reload(check_connectivity)
     imp.reload(check_double_assignments)
     imp.reload(check_unassigned_faces)
+    imp.reload(mesh_intersect)
+    imp.reload(check_intersecting_faces)
+    imp.reload(check_overlapping_faces)
     imp.reload(color_regions)
     imp.reload(compartmentize_tet)
     imp.reload(compartmentize_cyl)
     imp.reload(compartmentize_sc_only)
     imp.reload(explode)
     imp.reload(regions_to_compartments)
+    imp.reload(voltage_store)
+    imp.reload(voltage_stream)
     imp.reload(timeline_voltage)
 
 else:
     print("Importing Neuron Launcher")
     from . import swc_mesher
+    from . import swc_morphology
+    from . import face_graph
+    from . import spatial_index
+    from . import tet_parallel
+    from . import artifact_cache
     from . import neuron_launcher_gui
+    from . import cap_triangulation
     from . import close_open_caps
     from . import surface_sections
+    from . import region_validator
+    from . import check_regions
     from . import check_connectivity
     from . import check_double_assignments
     from . import check_unassigned_faces
+    from . import mesh_intersect
+    from . import check_intersecting_faces
+    from . import check_overlapping_faces
     from . import color_regions
     from . import compartmentize_tet
     from . import compartmentize_cyl
     from . import compartmentize_sc_only
     from . import explode
     from . import regions_to_compartments
+    from . import voltage_store
+    from . import voltage_stream
     from . import timeline_voltage
 
 # General import
@@ -91,6 +117,9 @@ def unregister():
     
     bpy.utils.unregister_module(__name__)
 
+    # Stop listening for streamed voltages
+    voltage_stream.stop_streams()
+
     print("Neuron Launcher unregistered")
 
 # ?
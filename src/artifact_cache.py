@@ -0,0 +1,147 @@
+import numpy as np
+
+import os
+
+import hashlib
+
+import pickle
+
+import copyreg
+
+import io
+
+# Version of the cached data - change to invalidate all caches when what a stage stores changes
+CACHE_VERSION = 1
+
+# Returned by MN_artifact_cache.load if nothing is cached
+MISS = object()
+
+# Pickling of mathutils.Vector, which does not support it on its own
+# Only used for pickling, the global copyreg table is not changed
+try:
+    import mathutils
+
+    def reduce_vector(v):
+        return (mathutils.Vector, (tuple(v),))
+
+    PICKLE_DISPATCH_TABLE = copyreg.dispatch_table.copy()
+    PICKLE_DISPATCH_TABLE[mathutils.Vector] = reduce_vector
+except ImportError:
+    PICKLE_DISPATCH_TABLE = copyreg.dispatch_table
+
+# Hash of a file's contents
+def hash_file(fname):
+    h = hashlib.sha256()
+    with open(fname, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+# Feed a value into a hash
+# Strings, numbers, bools, None, bytes, NumPy arrays and (nested) lists/tuples are allowed
+def update_hash(h, value):
+    if isinstance(value, np.generic):
+        value = value.item()
+
+    if isinstance(value, np.ndarray):
+        value = np.ascontiguousarray(value)
+        h.update(b"A" + str(value.dtype.str).encode() + str(value.shape).encode())
+        h.update(value.tobytes())
+    elif isinstance(value, (list, tuple)):
+        h.update(b"L" + str(len(value)).encode())
+        for item in value:
+            update_hash(h, item)
+    elif isinstance(value, bytes):
+        h.update(b"B" + str(len(value)).encode() + b":" + value)
+    elif isinstance(value, str):
+        value = value.encode()
+        h.update(b"S" + str(len(value)).encode() + b":" + value)
+    elif value == None or isinstance(value, (bool, int, float)):
+        h.update(b"V" + repr(value).encode())
+    else:
+        raise TypeError("Can't hash a value of type: " + str(type(value)))
+
+# Hash of a sequence of values
+def hash_values(*values):
+    h = hashlib.sha256()
+    for value in values:
+        update_hash(h, value)
+    return h.hexdigest()
+
+# Class for an on-disk cache of the outputs of pipeline stages
+# Outputs are pickled to <cache_dir>/<stage>/<key>.pickle
+# The key of a stage should be made from the key of the stage before it and the stage's own
+# parameters, so that changing anything invalidates this and all later stages
+class MN_artifact_cache:
+
+    # Init
+    # cache_dir = None or "": the cache is disabled, nothing is loaded or saved
+    def __init__(self, cache_dir):
+        if cache_dir:
+            self.cache_dir = os.path.abspath(cache_dir)
+        else:
+            self.cache_dir = None
+
+    # Is the cache enabled?
+    @property
+    def enabled(self):
+        return self.cache_dir != None
+
+    # Key of a stage from its parameters
+    def key(self, stage, *params):
+        return hash_values(CACHE_VERSION, stage, *params)
+
+    # File of a stage output
+    def fname(self, stage, key):
+        return os.path.join(self.cache_dir, stage, key + ".pickle")
+
+    # Is the output of a stage cached?
+    def has(self, stage, key):
+        return self.enabled and os.path.isfile(self.fname(stage, key))
+
+    # Load the output of a stage
+    # Returns MISS if it is not cached, or can't be read
+    def load(self, stage, key):
+        if not self.has(stage, key):
+            return MISS
+
+        try:
+            with open(self.fname(stage, key), "rb") as f:
+                return pickle.load(f)
+        except Exception as e:
+            print("> Cache: could not read: " + str(stage) + ": " + str(e))
+            return MISS
+
+    # Load the output of the last stage in stage_list that is cached
+    # stage_keys = dictionary of stage to key
+    # Returns (index of the stage in stage_list, output), or (-1, MISS) if nothing is cached
+    def load_last(self, stage_list, stage_keys):
+        for i_stage in range(len(stage_list)-1, -1, -1):
+            stage = stage_list[i_stage]
+            value = self.load(stage, stage_keys[stage])
+            if value is not MISS:
+                print("> Cache: resuming after stage: " + str(stage))
+                return i_stage, value
+        return -1, MISS
+
+    # Save the output of a stage
+    # Written to a temporary file first, so that a crash never leaves a half written output
+    def save(self, stage, key, value):
+        if not self.enabled:
+            return
+
+        fname = self.fname(stage, key)
+        os.makedirs(os.path.dirname(fname), exist_ok=True)
+
+        buf = io.BytesIO()
+        pickler = pickle.Pickler(buf, protocol=pickle.HIGHEST_PROTOCOL)
+        pickler.dispatch_table = PICKLE_DISPATCH_TABLE
+        pickler.dump(value)
+
+        # Per process, so that jobs can share a cache directory
+        fname_tmp = fname + "." + str(os.getpid()) + ".tmp"
+        with open(fname_tmp, "wb") as f:
+            f.write(buf.getvalue())
+        os.replace(fname_tmp, fname)
+
+        print("> Cache: saved stage: " + str(stage))
@@ -0,0 +1,95 @@
+# Triangulation of the caps closing the boundary loops of a mesh
+# Independent of Blender: a loop is given as an (n,3) array of its points, in order
+
+import numpy as np
+
+# Minimum angle (degrees) of the cap triangles when refining
+CAP_MIN_ANGLE = 25.0
+
+# Plane of a loop of points: (center, first axis, second axis)
+# The axes are oriented so that the loop's order is counter-clockwise in the plane
+def loop_plane(pts):
+    ctr = pts.mean(axis=0)
+
+    # Newell normal of the loop
+    nxt = np.roll(pts, -1, axis=0)
+    normal = np.cross(pts - ctr, nxt - ctr).sum(axis=0)
+    length = np.linalg.norm(normal)
+    if length == 0.0:
+        normal = np.array([0.0,0.0,1.0])
+    else:
+        normal /= length
+
+    # Any axis orthogonal to the normal
+    ax0 = np.cross(normal, [1.0,0.0,0.0] if abs(normal[0]) < 0.9 else [0.0,1.0,0.0])
+    ax0 /= np.linalg.norm(ax0)
+    ax1 = np.cross(normal, ax0)
+
+    return ctr, ax0, ax1
+
+# Fan triangulation of a loop around its center
+# Returns (new points: the center, triangles with loop indexes, the center being len(loop))
+def triangulate_loop_fan(pts):
+    n = len(pts)
+    tris = np.stack([np.full(n, n), np.arange(n), (np.arange(n) + 1) % n], axis=1)
+    return pts.mean(axis=0).reshape(1,3), tris
+
+# Does a triangulation of a loop of n points (the first n points) have every loop edge (i, i+1)
+# as an edge of a triangle, so that the cap closes the loop
+def keeps_loop_edges(tris, n):
+    tris = np.asarray(tris, dtype=np.int64).reshape(-1,3)
+    n_pts = max(int(tris.max(initial=-1)) + 1, n)
+    edges = np.concatenate([tris[:,[0,1]], tris[:,[1,2]], tris[:,[2,0]]])
+    tri_keys = np.minimum(edges[:,0], edges[:,1])*n_pts + np.maximum(edges[:,0], edges[:,1])
+    i = np.arange(n)
+    loop_keys = np.minimum(i, (i+1) % n)*n_pts + np.maximum(i, (i+1) % n)
+    return bool(np.all(np.isin(loop_keys, tri_keys)))
+
+# Constrained Delaunay triangulation of a loop, projected onto its plane, with meshpy.triangle
+# REFINE = True: add points inside the cap for triangles of bounded size and minimum angle;
+# points are never added on the loop itself, so the cap matches the mesh
+# Falls back to a fan around the center if MeshPy is missing or the projection of the loop is not simple
+# Returns (new points, triangles as indexes into the loop followed by the new points)
+def triangulate_loop(pts, REFINE=False):
+    n = len(pts)
+    if n == 3:
+        return np.zeros((0,3)), np.array([[0,1,2]])
+
+    try:
+        from meshpy.triangle import MeshInfo, build
+    except ImportError:
+        print("MeshPy is not available - closing the cap with a fan")
+        return triangulate_loop_fan(pts)
+
+    ctr, ax0, ax1 = loop_plane(pts)
+    pts_2d = np.stack([(pts - ctr).dot(ax0), (pts - ctr).dot(ax1)], axis=1)
+
+    mesh_info = MeshInfo()
+    mesh_info.set_points(pts_2d.tolist())
+    mesh_info.set_facets([[i, (i+1) % n] for i in range(n)])
+
+    build_kwargs = dict(allow_boundary_steiner=False, quality_meshing=REFINE)
+    if REFINE:
+        # Triangles no larger than those of a fan with evenly spaced points
+        edge_len = np.linalg.norm(np.roll(pts_2d, -1, axis=0) - pts_2d, axis=1).mean()
+        build_kwargs.update(min_angle=CAP_MIN_ANGLE, max_volume=0.5*edge_len*edge_len)
+
+    try:
+        mesh = build(mesh_info, **build_kwargs)
+    except RuntimeError as e:
+        print("Triangle failed: " + str(e) + " - closing the cap with a fan")
+        return triangulate_loop_fan(pts)
+
+    pts_out = np.array(mesh.points, dtype=np.float64).reshape(-1,2)
+    tris = np.array(mesh.elements, dtype=np.int64).reshape(-1,3)
+
+    # The loop must be kept as it is: its points first, unchanged, every loop edge an edge of the cap,
+    # and without refinement no new points (e.g. where a self-crossing loop crosses) and n-2 triangles
+    if len(pts_out) < n or not np.allclose(pts_out[:n], pts_2d) or not keeps_loop_edges(tris, n) or \
+        (not REFINE and (len(pts_out) != n or len(tris) != n-2)):
+        print("Loop of " + str(n) + " points does not project onto a simple polygon - closing the cap with a fan")
+        return triangulate_loop_fan(pts)
+
+    # New points back in 3D, on the plane of the loop
+    pts_new = ctr + np.outer(pts_out[n:,0], ax0) + np.outer(pts_out[n:,1], ax1)
+    return pts_new, tris
@@ -2,6 +2,12 @@ import bpy, bmesh
 from mathutils import Vector
 import math
 
+# Single pass validation of the region assignments
+from . import region_validator
+
+# Selection of problem faces
+from . import check_regions
+
 # Main
 
 def f_check_double_assignments(context):
@@ -11,10 +17,6 @@ def f_check_double_assignments(context):
     # Flag to fix doubles
     FIX_DOUBLES = False
     
-    # Check list
-    f_check = []
-    double_ctr = 0
-
     # Get the active object
     ob_list = context.selected_objects
     
@@ -24,46 +26,31 @@ def f_check_double_assignments(context):
         # Get the region list
         reg_list = ob.mcell.regions.region_list
 
-        # Make sure everything is de-selected before we start
-        bpy.ops.object.mode_set(mode='EDIT')
-        bpy.ops.mesh.select_all(action='DESELECT')
+        # Validate all regions at once
         bpy.ops.object.mode_set(mode='OBJECT')
+        v = region_validator.region_validator_from_object(ob)
+        f_doubles = v.double_faces()
 
-        # Go through the regions
-        for reg in reg_list:
-        
-            print("Checking region: " + str(reg.name))
+        for f in f_doubles.tolist():
+            print("Face: " + str(f) + " is double - regions: " + ", ".join(v.face_reg_names(f)))
 
-            # Get the faces
-            f_list = reg.get_region_faces(ob.data)
+        # Fix?
+        if FIX_DOUBLES:
 
-            # Duplicate list if planning to fix things
-            if FIX_DOUBLES:
-                f_list_new = list(f_list)
-
-            # Go through all faces
-            for f in f_list:
-                if not f in f_check:
-                    f_check.append(f)
-                else:
-                    print("Face: " + str(f) + " is double - one of the regions is: " + str(reg.name))
-                    print("(the other I did not search out)")
-                    ob.data.polygons[f].select = True
-                    double_ctr += 1
-    
-                    # Fix?
-                    if FIX_DOUBLES:
-                        
-                        # De-assign
-                        del f_list_new[f_list_new.index(f)]
-                        reg.set_region_faces(ob.data,f_list_new)
-                        
-                        print("Fixed double for face: " + str(f) + " is now de-assigned from: " + str(reg.name))
+            # De-assign from all but the first region
+            for f in f_doubles.tolist():
+                for name in v.face_reg_names(f)[1:]:
+                    reg = reg_list[name]
+                    f_list_new = list(reg.get_region_faces(ob.data))
+                    del f_list_new[f_list_new.index(f)]
+                    reg.set_region_faces(ob.data,f_list_new)
+                    
+                    print("Fixed double for face: " + str(f) + " is now de-assigned from: " + str(name))
 
         # Return in edit mode to show any doubles
-        bpy.ops.object.mode_set(mode='EDIT')
+        check_regions.select_faces(ob, f_doubles)
 
-        print("Finished - number of doubles: " + str(double_ctr))
+        print("Finished - number of doubles: " + str(len(f_doubles)))
 
     print("> Finished: f_check_double_assignments")
 
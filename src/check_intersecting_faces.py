@@ -2,81 +2,97 @@ import bpy, bmesh
 from mathutils import Vector
 import math
 
-import sys
-
-def intersect3D_RayTriangle(r, t):
-    u = t[1] - t[0]
-    v = t[2] - t[0]
-    n = u.cross(v)
-    if (n == Vector([0,0,0])):
-        return -1 # Degenerate
-
-    direc = r[1] - r[0]
-    w0 = r[0] - t[0]
-    a = -1.0*n.dot(w0)
-    b = n.dot(direc)
-    if (abs(b) < 0.00000000001): # ray is parallel to triangle
-        if (a==0): # lies in triangle plane
-            return 2
-        else: # degenerate
-            return 0
-
-    rl = a / b
-    if rl < 0.0 or rl > 1.0:
-        return 0
-
-    ipt = r[0] + rl * direc
-
-    uu = u.dot(u)
-    uv = u.dot(v)
-    vv = v.dot(v)
-    w = ipt - t[0]
-    wu = w.dot(u)
-    wv = w.dot(v)
-    dist = uv * uv - uu * vv
-
-    s = (uv * wv - vv * wu) / dist
-    if (s < 0.0 or s > 1.0):
-        return 0 # ipt is outside of triangle
-    t = (uv * wu - uu * wv) / dist
-    if (t < 0.0 or (s+t) > 1.0):
-        return 0 # degenerate
-
-    return 1 # intersect
-
-def check_triangles(t1, t2):
-    # Construct all the rays in t1
-    for i,j in [(0,1),(0,2),(1,2)]:
-        val = intersect3D_RayTriangle([t1[i],t1[j]],t2)
-        if val != 0:
-            print(val)
+import numpy as np
+
+# BVH and vectorized triangle-triangle tests
+from . import mesh_intersect
+
+# Selection of problem faces
+from . import check_regions
+
+# Vertices (in world coordinates) and loops of a mesh object
+# Returns (vertex coordinates, loop start and total of every polygon, vertex of every loop)
+def mesh_arrays(ob):
+    mesh = ob.data
+    n_faces = len(mesh.polygons)
+
+    loop_start = np.empty(n_faces, dtype=np.int32)
+    loop_total = np.empty(n_faces, dtype=np.int32)
+    loop_verts = np.empty(len(mesh.loops), dtype=np.int32)
+    co = np.empty(3*len(mesh.vertices), dtype=np.float64)
+
+    mesh.polygons.foreach_get("loop_start", loop_start)
+    mesh.polygons.foreach_get("loop_total", loop_total)
+    mesh.loops.foreach_get("vertex_index", loop_verts)
+    mesh.vertices.foreach_get("co", co)
+
+    # To world coordinates
+    mat = np.array(ob.matrix_world, dtype=np.float64)
+    co = co.reshape(-1,3).dot(mat[:3,:3].T) + mat[:3,3]
+
+    return co, loop_start, loop_total, loop_verts
+
+# Triangles of a mesh object in world coordinates
+# Returns (vertex coordinates, triangles, polygon of every triangle)
+def mesh_triangles(ob):
+    co, loop_start, loop_total, loop_verts = mesh_arrays(ob)
+    tris, tri_face = mesh_intersect.triangulate_fans(loop_start, loop_total, loop_verts)
+    return co, tris, tri_face
+
+# Find the intersecting faces of one object with itself, or of two objects
+# Returns (number of pairs, 2) array of polygon indexes, or of (polygon of ob_a, polygon of ob_b)
+def find_intersecting_faces(ob_a, ob_b=None):
+    co_a, tris_a, tri_face_a = mesh_triangles(ob_a)
+    if ob_b == None:
+        pairs = mesh_intersect.find_intersections(co_a, tris_a)
+        face_pairs = tri_face_a[pairs]
+
+        # Triangles of the same polygon (non planar faces) don't count
+        face_pairs = face_pairs[face_pairs[:,0] != face_pairs[:,1]]
+    else:
+        co_b, tris_b, tri_face_b = mesh_triangles(ob_b)
+        pairs = mesh_intersect.find_intersections(co_a, tris_a, co_b, tris_b)
+        face_pairs = np.stack([tri_face_a[pairs[:,0]], tri_face_b[pairs[:,1]]], axis=1)
+
+    return np.unique(face_pairs.reshape(-1,2), axis=0)
 
 # Main
 
-if __name__ == "__main__":
+def f_check_intersecting_faces(context):
 
-    print("> Running")
-    
-    # Get the objects
-    ob_surf = bpy.data.objects['P40_surface']
-    ob_seg = bpy.data.objects['P40_segment']
+    print("> Running: f_check_intersecting_faces")
 
-    # Get the centers of all faces
-    v_surf_triplets = [tuple(item.vertices) for item in ob_surf.data.polygons]
-    v_surf_co = [[ob_surf.data.vertices[item[0]].co,ob_surf.data.vertices[item[1]].co,ob_surf.data.vertices[item[2]].co] for item in v_surf_triplets]
-    v_seg_triplets = [tuple(item.vertices) for item in ob_seg.data.polygons]
-    v_seg_co = [[ob_seg.data.vertices[item[0]].co,ob_seg.data.vertices[item[1]].co,ob_seg.data.vertices[item[2]].co] for item in v_seg_triplets]
-   
-    # Check if any face in surf list matches seg list
-    l = len(v_surf_co)
-    for i_1, tri_1 in enumerate(v_surf_co):
-        if i_1 % 100 == 0:
-            print(str(i_1) + " / " + str(l))
+    # One object: self-intersections, two objects: intersections between them
+    ob_list = list(context.selected_objects)
 
-        # Check all other centers
-        for i_2, tri_2 in enumerate(v_seg_co):
-            check_triangles(tri_1, tri_2)
+    if len(ob_list) == 1:
+        ob_a, ob_b = ob_list[0], None
+    elif len(ob_list) == 2:
+        ob_a = context.active_object if context.active_object in ob_list else ob_list[0]
+        ob_b = ob_list[1] if ob_a == ob_list[0] else ob_list[0]
+    else:
+        raise TypeError("Please select one or two objects.")
 
-    print("> Finished")
+    bpy.ops.object.mode_set(mode='OBJECT')
+    face_pairs = find_intersecting_faces(ob_a, ob_b)
 
+    if ob_b == None:
+        print("Object: " + str(ob_a.name) + " number of self-intersecting face pairs: " + str(len(face_pairs)))
+    else:
+        print("Objects: " + str(ob_a.name) + ", " + str(ob_b.name) + " number of intersecting face pairs: " + str(len(face_pairs)))
+    for f_a, f_b in face_pairs[:20].tolist():
+        print("Faces: " + str(f_a) + " / " + str(f_b))
+    if len(face_pairs) > 20:
+        print("...")
 
+    # Show the faces of the active object by selecting
+    if ob_b == None:
+        f_show = np.unique(face_pairs)
+    else:
+        f_show = np.unique(face_pairs[:,0])
+    context.scene.objects.active = ob_a
+    check_regions.select_faces(ob_a, f_show)
+
+    print("> Finished: f_check_intersecting_faces")
+
+    return face_pairs
@@ -2,42 +2,63 @@ import bpy, bmesh
 from mathutils import Vector
 import math
 
-import sys
+import numpy as np
+
+# Hashing of coincident faces
+from . import mesh_intersect
+
+# Mesh arrays in world coordinates
+from . import check_intersecting_faces
+
+# Find coincident faces within and across objects
+# Returns a list of groups of coincident faces, every group a list of (object name, face index)
+def find_overlapping_faces(ob_list, tol=mesh_intersect.COINCIDENT_TOL):
+    mesh_list = [check_intersecting_faces.mesh_arrays(ob) for ob in ob_list]
+    groups = mesh_intersect.find_coincident_faces(mesh_list, tol)
+    return [[(ob_list[i_ob].name, f) for i_ob, f in group.tolist()] for group in groups]
 
 # Main
 
-if __name__ == "__main__":
-
-    print("> Running")
-    
-    # Get the objects
-    ob_surf = bpy.data.objects['P40_surface']
-    ob_seg = bpy.data.objects['P40_segment']
-
-    # Get the centers of all faces
-    ctr_surf_list = [item.center for item in ob_surf.data.polygons]
-    ctr_seg_list = [item.center for item in ob_seg.data.polygons]
-
-    # Check if any face in surf list matches seg list
-    l = len(ctr_surf_list)
-    for i,ctr in enumerate(ctr_surf_list):
-        if i % 1000 == 0:
-            print(str(i) + " / " + str(l))
-
-        # Check all other centers
-        for i_o,ctr_o in enumerate(ctr_seg_list):
-            len = (ctr-ctr_o).length
-            if len < 0.0000001:
-                print("These centers match - do the triangles?")
-                print(ctr)
-                print(ctr_o)
-                vs = ob_surf.data.polygons[i]
-                for j in range(0,3):
-                    print(ob_surf.data.vertices[j].co)
-                vs = ob_seg.data.polygons[i_o]
-                for j in range(0,3):
-                    print(ob_seg.data.vertices[j].co)
-
-    print("> Finished")
+def f_check_overlapping_faces(context):
+
+    print("> Running: f_check_overlapping_faces")
+
+    # All selected objects
+    ob_list = [ob for ob in context.selected_objects if ob.type == 'MESH']
+
+    if len(ob_list) == 0:
+        raise TypeError("Please select at least one object.")
+
+    bpy.ops.object.mode_set(mode='OBJECT')
+    groups = find_overlapping_faces(ob_list)
+
+    # Report
+    n_within = 0
+    n_across = 0
+    for group in groups:
+        if len(set([name for name, f in group])) == 1:
+            n_within += 1
+        else:
+            n_across += 1
+    print("Number of groups of coincident faces: " + str(len(groups)) + " within one object: " + str(n_within) + " across objects: " + str(n_across))
+    for group in groups[:20]:
+        print("Coincident: " + ", ".join([name + ":" + str(f) for name, f in group]))
+    if len(groups) > 20:
+        print("...")
+
+    # Select the faces in every object
+    f_sel_dict = dict([(ob.name, []) for ob in ob_list])
+    for group in groups:
+        for name, f in group:
+            f_sel_dict[name].append(f)
+    for ob in ob_list:
+        sel = np.zeros(len(ob.data.polygons), dtype=bool)
+        sel[np.array(f_sel_dict[ob.name], dtype=np.int64)] = True
+        ob.data.polygons.foreach_set("select", sel)
+
+    # Return in edit mode to show them on the active object
+    bpy.ops.object.mode_set(mode='EDIT')
 
+    print("> Finished: f_check_overlapping_faces")
 
+    return groups
@@ -0,0 +1,83 @@
+import bpy, bmesh
+
+import numpy as np
+
+import json
+
+# Shared SWC loader
+from . import swc_morphology
+
+# Single pass validation of the region assignments
+from . import region_validator
+
+# Select the given faces of an object, deselecting all others, and return in edit mode to show them
+def select_faces(ob, f_list):
+    bpy.ops.object.mode_set(mode='EDIT')
+    bpy.ops.mesh.select_all(action='DESELECT')
+    bpy.ops.object.mode_set(mode='OBJECT')
+
+    sel = np.zeros(len(ob.data.polygons), dtype=bool)
+    sel[np.asarray(f_list, dtype=np.int64)] = True
+    ob.data.polygons.foreach_set("select", sel)
+
+    bpy.ops.object.mode_set(mode='EDIT')
+
+# Store a report in a Blender text datablock
+def store_report(ob, report):
+    txt_name = ob.name + "_region_report.json"
+    txt = bpy.data.texts.get(txt_name)
+    if txt == None:
+        txt = bpy.data.texts.new(txt_name)
+    txt.clear()
+    txt.write(json.dumps(report, indent=2))
+    return txt_name
+
+# Main
+
+def f_validate_regions(context, swc_filepath):
+
+    print("> Running: f_validate_regions")
+
+    # Get the object
+    ob_list = context.selected_objects
+
+    if len(ob_list) != 1:
+        raise TypeError("Please select only one object.")
+
+    ob = ob_list[0]
+
+    # Get data from the SWC file
+    pt_connect = None
+    if swc_filepath:
+        pt_connect = swc_morphology.load_swc(swc_filepath).pt_connect()
+
+    # Validate
+    bpy.ops.object.mode_set(mode='OBJECT')
+    v = region_validator.region_validator_from_object(ob)
+    report = v.report(pt_connect)
+
+    # Summary
+    print("Number of faces: " + str(report["n_faces"]) + " regions: " + str(report["n_regions"]))
+    print("Number of doubles: " + str(len(report["double_faces"])))
+    print("Number of unassigned faces: " + str(len(report["unassigned_faces"])))
+    if pt_connect != None:
+        for brdr in report["illegal_borders"]:
+            print("ERROR: Region: " + brdr["region"] + " illegally borders: " + brdr["other"] + " (" + str(brdr["n_edges"]) + " edges)")
+        for brdr in report["missing_borders"]:
+            print("WARNING: Region: " + brdr["region"] + " fails to border: " + brdr["other"])
+
+    # Select all problem faces
+    f_problem = list(v.double_faces()) + list(v.unassigned_faces())
+    reg_idx = dict([(name, i) for i, name in enumerate(v.reg_names)])
+    for brdr in report.get("illegal_borders", []):
+        f_problem += list(v.border_faces(reg_idx[brdr["region"]], reg_idx[brdr["other"]]))
+    select_faces(ob, f_problem)
+    context.tool_settings.mesh_select_mode = (False, False, True)
+
+    print("Report stored in text: " + store_report(ob, report))
+    if report["ok"]:
+        print("- Region assignments are OK!")
+
+    print("> Finished: f_validate_regions")
+
+    return report
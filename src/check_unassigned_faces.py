@@ -2,6 +2,17 @@ import bpy, bmesh
 from mathutils import Vector
 import math
 
+import numpy as np
+
+# Single pass validation of the region assignments
+from . import region_validator
+
+# Selection of problem faces
+from . import check_regions
+
+# Connectivity of the SWC file
+from . import check_connectivity
+
 # Main
 
 def f_check_unassigned_faces(context, RETURN_FLAG):
@@ -15,46 +26,24 @@ def f_check_unassigned_faces(context, RETURN_FLAG):
 	if len(ob_list) == 1:
 		ob = ob_list[0]
 	
-		# Get the region list
-		reg_list = ob.mcell.regions.region_list
-
-		# Store all the face indexes
-		f_list = []
-
-		# Go through the regions
-		for reg in reg_list:
-		
-			# Get the faces
-			f_reg_list = reg.get_region_faces(ob.data)
-
-			# Store
-			f_list += f_reg_list
-
-		# Get the list of faces that exist
-		f_real_list = list(range(0,len(ob.data.polygons)))
+		# Validate all regions at once
+		bpy.ops.object.mode_set(mode='OBJECT')
+		v = region_validator.region_validator_from_object(ob)
 
 		# Which are missing
-		f_missing = list(set(f_real_list)-set(f_list))
+		f_missing = v.unassigned_faces().tolist()
 
 		# Empty?
 		if len(f_missing) == 0:
-			print("No unassigned faces: " + str(len(f_real_list)) + " / " + str(len(f_list)))
+			print("No unassigned faces: " + str(v.graph.n_faces) + " / " + str(len(v.face_reg_idx)))
 		else:
-			print("Number of unassigned faces: " + str(len(f_missing)))
+			print("Number of unassigned faces: " + str(len(f_missing)) + " in patches: " + str(v.unassigned_patches()[1]))
 
 			# Show the faces by selecting
 			if not RETURN_FLAG:
 
-				# Make sure everything is de-selected before we start
-				bpy.ops.object.mode_set(mode='EDIT')
-				bpy.ops.mesh.select_all(action='DESELECT')
-				bpy.ops.object.mode_set(mode='OBJECT')
-
-				for f in f_missing:
-					ob.data.polygons[f].select = True
-
 				# Return in edit mode to show
-				bpy.ops.object.mode_set(mode='EDIT')
+				check_regions.select_faces(ob, f_missing)
 
 			else:
 
@@ -82,46 +71,69 @@ def f_select_unassigned_linked_faces(context):
 		bpy.ops.object.mode_set(mode='OBJECT')
 		face_index = [f.index for f in ob.data.polygons if f.select][0]
 
-		# Get the list of unassigned faces
-		f_missing = f_check_unassigned_faces(context, True)
+		# Label all patches of unassigned faces at once
+		v = region_validator.region_validator_from_object(ob)
+		patch_label, n_patches = v.unassigned_patches()
 
-		# Check that the selected face is in here
-		if not face_index in f_missing:
+		# Check that the selected face is in one
+		if patch_label[face_index] < 0:
 			raise TypeError("Selected face is not unassigned.")
 
-		# Get the edges of all these missing faces
-		e_missing = [set(list(ob.data.polygons[i].edge_keys)) for i in f_missing]
+		# Select the patch
+		f_linked = np.nonzero(patch_label == patch_label[face_index])[0]
+		print("Number of linked unassigned faces: " + str(len(f_linked)) + " (patch " + str(patch_label[face_index]) + " / " + str(n_patches) + ")")
+		sel = np.zeros(len(ob.data.polygons), dtype=bool)
+		sel[f_linked] = True
+		ob.data.polygons.foreach_set("select", sel)
 
-		# Go through and find linked faces
-		f_check = [face_index]
-		f_done = []
+		# Return in edit mode
+		bpy.ops.object.mode_set(mode='EDIT')
 
-		while len(f_check) > 0:
-			# Face to check
-			face_index = f_check[0]
+	print("> Finished: f_select_unassigned_linked_faces")
 
-			# Get edges
-			edges = set(list(ob.data.polygons[face_index].edge_keys))
+def f_repair_unassigned_faces(context, swc_filepath):
 
-			# Check against other edges
-			for i_f, edges_missing in enumerate(e_missing):
-				if len(edges - edges_missing) != 3:
-					# An edge is shared => linked face
-					f_linked = f_missing[i_f]
-					# Check that it hasn't already been done and isn't myself
-					if not f_linked in f_done and not face_index == f_linked:
-						# Select
-						ob.data.polygons[f_linked].select = True
-						# Store for checking
-						f_check.append(f_linked)
+	print("> Running: f_repair_unassigned_faces")
 
-			# Make sure not to double count
-			f_done.append(face_index)
+	# Get the active object
+	ob_list = context.selected_objects
 
-			# Delete
-			del f_check[0]
+	if len(ob_list) != 1:
+		raise TypeError("Please select only one object.")
 
-		# Return in edit mode
-		bpy.ops.object.mode_set(mode='EDIT')
+	ob = ob_list[0]
 
-	print("> Finished: f_select_unassigned_linked_faces")
+	# Get the region list
+	reg_list = ob.mcell.regions.region_list
+
+	# Connectivity of the SWC file
+	pt_connect = check_connectivity.get_connections(swc_filepath)
+
+	# Find the region of every patch of unassigned faces
+	bpy.ops.object.mode_set(mode='OBJECT')
+	v = region_validator.region_validator_from_object(ob)
+	patches = v.repair_unassigned(pt_connect)
+
+	# Faces to add to every region
+	f_add = {}
+	f_unresolved = []
+	for i_patch, patch in enumerate(patches):
+		if patch["region"] != None:
+			f_add.setdefault(patch["region"], []).extend(patch["faces"].tolist())
+		else:
+			f_unresolved.extend(patch["faces"].tolist())
+			brdr_names = [v.reg_names[r] + " (" + str(n) + " edges)" for r, n in patch["borders"].items()]
+			print("Unresolved patch " + str(i_patch) + " of " + str(len(patch["faces"])) + " faces, borders: " + (", ".join(brdr_names) if len(brdr_names) > 0 else "nothing"))
+
+	# Assign
+	for r, f_list in f_add.items():
+		reg = reg_list[v.reg_names[r]]
+		reg.set_region_faces(ob.data, list(reg.get_region_faces(ob.data)) + f_list)
+		print("Assigned " + str(len(f_list)) + " faces to region: " + str(reg.name))
+
+	print("Number of patches: " + str(len(patches)) + " repaired: " + str(len(patches) - len([p for p in patches if p["region"] == None])) + " unresolved: " + str(len([p for p in patches if p["region"] == None])))
+
+	# Return in edit mode to show the unresolved faces
+	check_regions.select_faces(ob, f_unresolved)
+
+	print("> Finished: f_repair_unassigned_faces")
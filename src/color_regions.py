@@ -11,9 +11,33 @@ import cellblender
 
 import random
 
+import numpy as np
+
 # Print to console to delimit
 print("--- Running timeline_voltage.py ---")
 
+# Vertex color mode: one material for all faces, colored by a vertex color layer
+# Name of the vertex color layer, and of the shared material
+VCOL_LAYER = "voltage"
+VCOL_MATERIAL = "voltage_vcol_material"
+
+# Face layer with the index of the region of every face, -1 = no region
+VCOL_REG_LAYER = "sc_region"
+
+# Object property with the compartment ids of the regions, 3 ints per region index
+VCOL_COMP_IDS = "sc_region_comp_ids"
+
+# Color of faces without a voltage
+VCOL_GRAY = (0.5,0.5,0.5)
+
+# Compartment id of an sc_ region: (section point 1, section point 2, segment)
+def sc_comp_id(name):
+    return (int(name[3:5]),int(name[6:8]),int(name[12:14]))
+
+# Is the object set up for the vertex color mode
+def uses_vertex_colors(ob):
+    return VCOL_COMP_IDS in ob and VCOL_LAYER in ob.data.vertex_colors and VCOL_REG_LAYER in ob.data.polygon_layers_int
+
 # Take regions in MCell and make materials for each
 def f_mcell_reg_to_mat(context):
     
@@ -35,6 +59,10 @@ def f_mcell_reg_to_mat(context):
             bpy.ops.object.material_slot_remove()
         ob.data.materials.clear()
 
+        # No longer colored by vertex colors
+        if VCOL_COMP_IDS in ob:
+            del ob[VCOL_COMP_IDS]
+
         # Assign a material to each region
         for i_reg in reg_list:
             
@@ -66,6 +94,61 @@ def f_mcell_reg_to_mat(context):
 
     print("> Finished: f_mcell_reg_to_mat")
 
+# Take regions in MCell and write the region of every face once, for coloring the faces through
+# one shared material and a vertex color layer (instead of a material per region)
+def f_mcell_reg_to_vcol(context):
+
+    print("> Running: f_mcell_reg_to_vcol")
+
+    # Get the active object
+    ob_list = context.selected_objects
+
+    if len(ob_list) == 1:
+        ob = ob_list[0]
+        mesh = ob.data
+
+        bpy.ops.object.mode_set(mode='OBJECT')
+
+        # Region index of every face, regions of the same compartment sharing an index
+        reg_index = {}
+        face_reg = np.full(len(mesh.polygons), -1, dtype=np.int32)
+        for reg in ob.mcell.regions.region_list:
+            if reg.name[0:2] == 'sc':
+                comp_id = sc_comp_id(reg.name)
+                i_reg = reg_index.setdefault(comp_id, len(reg_index))
+                face_reg[np.array(list(reg.get_region_faces(mesh)), dtype=np.int64)] = i_reg
+
+        layer = mesh.polygon_layers_int.get(VCOL_REG_LAYER)
+        if layer == None:
+            layer = mesh.polygon_layers_int.new(name=VCOL_REG_LAYER)
+        layer.data.foreach_set("value", face_reg)
+
+        comp_ids = sorted(reg_index.keys(), key=lambda comp_id: reg_index[comp_id])
+        ob[VCOL_COMP_IDS] = [i for comp_id in comp_ids for i in comp_id]
+
+        # One material for all faces, showing the vertex colors
+        mesh.materials.clear()
+        mat = bpy.data.materials.get(VCOL_MATERIAL)
+        if mat == None:
+            mat = bpy.data.materials.new(name=VCOL_MATERIAL)
+        mat.use_vertex_color_paint = True
+        mesh.materials.append(mat)
+        mesh.polygons.foreach_set("material_index", np.zeros(len(mesh.polygons), dtype=np.int32))
+
+        # Vertex color layer, gray to start
+        vcol = mesh.vertex_colors.get(VCOL_LAYER)
+        if vcol == None:
+            vcol = mesh.vertex_colors.new(name=VCOL_LAYER)
+        mesh.vertex_colors.active = vcol
+        if len(vcol.data) > 0:
+            n_ch = len(vcol.data[0].color)
+            vcol.data.foreach_set("color", np.tile(np.array(VCOL_GRAY + (1.0,)*(n_ch-3), dtype=np.float32), len(vcol.data)))
+        mesh.update()
+
+        print("Number of regions: " + str(len(comp_ids)) + " faces without a region: " + str(int(np.sum(face_reg < 0))))
+
+    print("> Finished: f_mcell_reg_to_vcol")
+
 # Color regions blue
 def f_color_regions(context, col1, col2):
 
@@ -15,6 +15,9 @@ import os
 # To add objects to MCell
 from cellblender.cellblender_utils import preserve_selection_use_operator
 
+# Shared SWC loader
+from . import swc_morphology
+
 # Time
 import time
 
@@ -175,48 +178,18 @@ def project_pt_line(v, w, p):
     
     return v + (v_to_w * t2)
 
-# Deep copy a list
-def unshared_copy(inList):
-    if isinstance(inList, list):
-        return list( map(unshared_copy, inList) )
-    return inList
-
 # Read in the swc file to know what's connected
 def get_connections(fname):
     global mn_section_dict
     
-    # Store the swc data
-    swc_data = []
-    
-    # Read the file
-    f = open(fname,'r')
-    for i_line,line in enumerate(f):
-        line_s = line.split();
-        if len(line_s) > 0 and line_s[0] != "#":
-            line_data = []
-            line_data.append(int(float(line_s[0])))
-            line_data.append(int(float(line_s[1])))
-            line_data.append(float(line_s[2]))
-            line_data.append(float(line_s[3]))
-            line_data.append(float(line_s[4]))
-            line_data.append(float(line_s[5]))
-            line_data.append(int(float(line_s[6])))
-            swc_data.append(line_data)
+    # Load the morphology (cached on the file modification time)
+    morph = swc_morphology.load_swc(fname)
 
     # Find connections
-    pt_connect = []
-    for i in range(0,len(swc_data)):
-        pt_connect.append([])
-
-    for i,data in enumerate(swc_data):
-        if i > 0: # The first is the -1 index
-            pt_connect[data[6]-1].append(i+1)
-
-    pt_connect_dup = unshared_copy(pt_connect) # copy
+    pt_connect = morph.pt_connect()
 
-    for i_list, sub_list in enumerate(pt_connect_dup):
-        for idx in sub_list:
-            pt_connect[idx-1].append(i_list+1)
+    # Vertex coordinates
+    swc_vert_list = morph.vert_co_list()
 
     # Make a new section for all
     for i, sublist in enumerate(pt_connect):
@@ -226,7 +199,7 @@ def get_connections(fname):
                 # New section
                 sec_name = "sc_%02d_%02d"%(pt1,pt2)
                 sec_ids = (pt1,pt2)
-                sec_pts = (Vector(swc_data[pt1-1][2:5]),Vector(swc_data[pt2-1][2:5]))
+                sec_pts = (Vector(swc_vert_list[pt1-1]),Vector(swc_vert_list[pt2-1]))
                 
                 nghbrs_min = []
                 for conn_pt in pt_connect[pt1-1]:
@@ -12,17 +12,65 @@ import itertools
 
 import os
 
+import sys
+
 # To add objects to MCell
 from cellblender.cellblender_utils import preserve_selection_use_operator
 
+# Shared SWC loader
+from . import swc_morphology
+
 # MeshPy
 from meshpy.tet import MeshInfo, build, Options
+from meshpy.common import foreign_array_as_numpy, FaceMarkerTable
+
+# Parallel tetrahedralization of sections
+from . import tet_parallel
+
+# Cache of the outputs of the stages
+from . import artifact_cache
+
+# Self-intersection check of the surface given to TetGen
+from . import mesh_intersect
 
 # Time
 import time
 
+# TetGen switches
+TET_SWITCHES = 'pq'
+
+# Vertices of the stacked surfaces (for TetGen and the planes) closer than this are merged
+# 0 = only identical vertices
+STACK_WELD_TOL = 0.0
+
+# Check the surface given to TetGen for self-intersections first
+TET_CHECK_INTERSECTIONS = True
+
+# Stages of f_compartmentize_tet whose outputs are cached, in order
+CACHE_STAGES = ["swc", "surface_sections", "section_borders", "tetgen", "segments", "reconcile"]
+
+# Check the closed surface made for TetGen for self-intersections
+# TetGen fails on these only after a long run, so fail early with the planes involved
+def check_plc_intersections(vert_list, face_list, face_marker_list):
+    global face_marker_plane_dict
+
+    pairs = mesh_intersect.find_intersections(np.array(vert_list, dtype=np.float64), np.array(face_list, dtype=np.int64))
+    if len(pairs) == 0:
+        print("> No self-intersections in the surface for TetGen")
+        return
+
+    # Names of the planes that intersect
+    face_marker_arr = np.array(face_marker_list, dtype=np.int64)
+    marker_pairs = np.unique(np.sort(face_marker_arr[pairs], axis=1), axis=0)
+    for m0, m1 in marker_pairs.tolist():
+        print("Intersecting planes: " + str(face_marker_plane_dict[m0].name) + " / " + str(face_marker_plane_dict[m1].name))
+
+    raise SystemError("The surface for TetGen has " + str(len(pairs)) + " pairs of intersecting faces - check the mesh and the section borders.")
+
 # Function to make a tetgen mesh from the global mn_section list
-def make_tetgen_mesh():
+# PARALLEL = True: tetrahedralize every section separately in parallel and merge the meshes
+# OUT_OF_PROCESS = True: run TetGen on the whole mesh in a separate Python process
+def make_tetgen_mesh(PARALLEL=False, OUT_OF_PROCESS=False):
     global mn_section_dict
     global face_marker_plane_dict
 
@@ -95,16 +143,41 @@ def make_tetgen_mesh():
                     sec.face_marker_dict[plane_sides_ids_done[plane.sides_ids]] = (i,j)
 
     # Create a correctly indexed closed volume
-    vert_list, face_list, face_marker_list = stack_lists(vert_stack,face_stack,face_marker_stack=face_marker_stack)
+    vert_list, face_list, face_marker_list = stack_lists(vert_stack,face_stack,face_marker_stack=face_marker_stack,weld_tol=STACK_WELD_TOL)
+
+    # Fail early on a self-intersecting surface
+    if TET_CHECK_INTERSECTIONS == True:
+        check_plc_intersections(vert_list, face_list, face_marker_list)
+
+    # Mesh each section on its own
+    if PARALLEL == True:
+        vert_co_arr = np.array(vert_list, dtype=np.float64)
+        face_arr = np.array(face_list, dtype=np.int64)
+        face_marker_arr = np.array(face_marker_list, dtype=np.int64)
+
+        # The closed surface of every section: its surface plane + its border planes
+        plc_list = []
+        for sec_id in mn_section_dict.keys():
+            sec = mn_section_dict[sec_id]
+            sec_face_mask = np.isin(face_marker_arr, list(sec.face_marker_dict.keys()))
+            plc_list.append(tet_parallel.MN_section_plc(sec_id, vert_co_arr, face_arr[sec_face_mask], face_marker_arr[sec_face_mask]))
+
+        print("> Starting TetGen for " + str(len(plc_list)) + " sections in parallel")
+        python_exe = getattr(bpy.app, "binary_path_python", sys.executable)
+        mesh_list = tet_parallel.tetrahedralize_sections(plc_list, python_exe=python_exe)
+        mesh_built = tet_parallel.merge_section_meshes(plc_list, mesh_list, vert_co_arr)
+        print("> Finished TetGen successfully")
+
+        return mesh_built
     
     # Make the tetgen mesh
     mesh_info = MeshInfo()
     
     # Points
-    mesh_info.set_points(vert_list)
+    mesh_info.set_points(np.array(vert_list, dtype=np.float64))
     
-    # Faces
-    mesh_info.set_facets(face_list, markers = face_marker_list)
+    # Faces - all triangles, so they are set in bulk
+    mesh_info.set_facets(np.array(face_list, dtype=np.intc), markers = np.array(face_marker_list, dtype=np.intc))
     
     # --- TEMP ---
     '''
@@ -126,18 +199,102 @@ def make_tetgen_mesh():
     # edgesout = Write out edges
     # regionattrib = Write out element_attributes = unique id for every tet in a distinct volume
     # nobisect = Dont alter surface
-    print("> Starting TetGen")
-    opts = Options(switches='pq', neighout = True, facesout = True, edgesout = True, regionattrib = True, verbose = True, docheck = True)
-    mesh_built = build(mesh_info, options=opts)
+    opts_kwargs = dict(neighout = True, facesout = True, edgesout = True, regionattrib = True, verbose = True, docheck = True)
+    if OUT_OF_PROCESS == True:
+        print("> Starting TetGen in a separate process")
+        python_exe = getattr(bpy.app, "binary_path_python", sys.executable)
+        mesh_built = tet_parallel.build_process(mesh_info, TET_SWITCHES, opts_kwargs, python_exe=python_exe)
+    else:
+        print("> Starting TetGen")
+        opts = Options(switches=TET_SWITCHES, **opts_kwargs)
+        mesh_built = build(mesh_info, options=opts)
     print("> Finished TetGen successfully")
 
     return mesh_built
 
 
 
-# Function to take vertex list, face list and create a single vert/face/edge list
-def stack_lists(vert_stack, face_stack, edge_stack=None, MAKE_EDGE_LIST=False, face_marker_stack=None, RETURN_DICT=False):
+# Minimum number of vertices in a stack for stack_lists to merge them with NumPy
+STACK_LISTS_NUMPY_MIN = 2000
+
+# Merge the vertices of a stack of vertex lists with a hash table
+# Vertices are merged if they are identical, or with weld_tol > 0 if they fall in the
+# same cell of a grid with spacing weld_tol
+# Returns:
+# vert_list = the merged vertices, in order of first occurrence
+# new_idx_stack = for each list in the stack, the index of each vertex in vert_list
+# first_stack = for each list in the stack, the indexes of the vertices that were first occurrences
+def stack_verts_hash(vert_stack, weld_tol=0.0):
     vert_list = []
+    new_idx_stack = []
+    first_stack = []
+
+    # Key -> index in vert_list
+    key_dict = {}
+
+    for vert_list_in in vert_stack:
+        new_idx = []
+        first = []
+        for i_v,v in enumerate(vert_list_in):
+            if weld_tol > 0:
+                key = tuple([int(round(c/weld_tol)) for c in v])
+            else:
+                key = tuple(v)
+
+            idx = key_dict.get(key)
+            if idx == None:
+                # Append this vertex
+                idx = len(vert_list)
+                key_dict[key] = idx
+                vert_list.append(v)
+                first.append(i_v)
+            new_idx.append(idx)
+
+        new_idx_stack.append(new_idx)
+        first_stack.append(first)
+
+    return vert_list, new_idx_stack, first_stack
+
+# Same as stack_verts_hash, but with np.unique on the rows of all vertices at once
+def stack_verts_numpy(vert_stack, weld_tol=0.0):
+    n_verts_stack = [len(vert_list_in) for vert_list_in in vert_stack]
+    verts_all = [v for vert_list_in in vert_stack for v in vert_list_in]
+    if len(verts_all) == 0:
+        return [], [[] for n in n_verts_stack], [[] for n in n_verts_stack]
+
+    keys = np.array([tuple(v) for v in verts_all], dtype=np.float64)
+    if weld_tol > 0:
+        keys = np.round(keys/weld_tol).astype(np.int64)
+
+    # Unique rows; the first occurrence of each row
+    _, first_idx, inverse = np.unique(keys, axis=0, return_index=True, return_inverse=True)
+    inverse = inverse.reshape(-1)
+
+    # Number the unique rows in order of first occurrence, as the hash version does
+    order = np.argsort(first_idx)
+    rank = np.empty(len(order), dtype=np.int64)
+    rank[order] = np.arange(len(order))
+    new_idx_all = rank[inverse]
+
+    vert_list = [verts_all[i] for i in first_idx[order].tolist()]
+
+    is_first = np.zeros(len(verts_all), dtype=bool)
+    is_first[first_idx] = True
+
+    # Split back up per list in the stack
+    new_idx_stack = []
+    first_stack = []
+    i_st = 0
+    for n in n_verts_stack:
+        new_idx_stack.append(new_idx_all[i_st:i_st+n].tolist())
+        first_stack.append(np.nonzero(is_first[i_st:i_st+n])[0].tolist())
+        i_st += n
+
+    return vert_list, new_idx_stack, first_stack
+
+# Function to take vertex list, face list and create a single vert/face/edge list
+# Duplicate vertices are merged (within weld_tol if weld_tol > 0)
+def stack_lists(vert_stack, face_stack, edge_stack=None, MAKE_EDGE_LIST=False, face_marker_stack=None, RETURN_DICT=False, weld_tol=0.0):
     face_list = []
     if MAKE_EDGE_LIST == True:
         edge_list = []
@@ -146,28 +303,25 @@ def stack_lists(vert_stack, face_stack, edge_stack=None, MAKE_EDGE_LIST=False, f
         # Faces are not created/eliminated NOR re-indexed - so just flatten the list!
         face_marker_list = [item for sublist in face_marker_stack for item in sublist]
 
+    # Merge the vertices
+    if sum([len(vert_list_in) for vert_list_in in vert_stack]) >= STACK_LISTS_NUMPY_MIN:
+        vert_list, new_idx_stack, first_stack = stack_verts_numpy(vert_stack, weld_tol)
+    else:
+        vert_list, new_idx_stack, first_stack = stack_verts_hash(vert_stack, weld_tol)
+
     if RETURN_DICT == True:
         # Return a dictionary of indices for each vertex list in the stack to the new vertex list
+        # Only the vertices that were appended (not the duplicates) are included
         idx_dict_ret = []
-        for i in range(0,len(vert_stack)):
-            idx_dict_ret.append({})
+        for i_stack in range(0,len(vert_stack)):
+            new_idx = new_idx_stack[i_stack]
+            idx_dict_ret.append({i_v: new_idx[i_v] for i_v in first_stack[i_stack]})
         
     # Go through all the vertex lists
-    for i_stack,vert_list_in in enumerate(vert_stack):
+    for i_stack in range(0,len(vert_stack)):
         
-        # Go through all verts
-        idx_dict = {}
-        for i_v,v in enumerate(vert_list_in):
-            # Does vertex already exist? (Duplicate vertex)
-            if v in vert_list:
-                idx_dict[i_v] = vert_list.index(v)
-            else:
-                # Append this vertex
-                idx_dict[i_v] = len(vert_list)
-                if RETURN_DICT == True:
-                    idx_dict_ret[i_stack][i_v] = len(vert_list)
-
-                vert_list.append(v)
+        # Index of every vert in the new vertex list
+        idx_dict = new_idx_stack[i_stack]
 
         # Face list / marker list
         face_list_in = face_stack[i_stack]
@@ -336,48 +490,29 @@ class MN_plane:
 
         return obj_new
 
+    # Faces as sorted point triplets, hashable so that faces of different planes can be matched
+    def face_trip_list(self):
+        return [tuple(sorted([tuple(self.vert_list[f[0]]),tuple(self.vert_list[f[1]]),tuple(self.vert_list[f[2]])])) for f in self.face_list]
+
     # Check for overlap with another plane
     def overlap(self, op):
-        # Convert all of my faces into sorted point triplets
-        self_face_trip = []
-        for f in self.face_list:
-            # Figure out the triplet of points
-            pt_trip = [self.vert_list[f[0]],self.vert_list[f[1]],self.vert_list[f[2]]]
-            pt_trip.sort()
-            self_face_trip.append(pt_trip)
-        
-        # And the other guys
-        op_face_trip = []
-        for f in op.face_list:
-            # Figure out the triplet of points
-            pt_trip = [op.vert_list[f[0]],op.vert_list[f[1]],op.vert_list[f[2]]]
-            pt_trip.sort()
-            op_face_trip.append(pt_trip)
-        
-        # Go through all faces in one, search
-        shared_face_trip = []
-        for trip in self_face_trip:
-            # Easy check
-            if trip in op_face_trip:
-                shared_face_trip.append(trip)
-        # Hard check
-        '''
-        for op_trip in op_face_trip:
-            d0 = (Vector(trip[0])-Vector(op_trip[0])).length
-            d1 = (Vector(trip[1])-Vector(op_trip[1])).length
-            d2 = (Vector(trip[2])-Vector(op_trip[2])).length
-            if max(d0,d1,d2) < 1e-5:
-                shared_face_trip.append(trip)
-        '''
+        # Set of the other guy's faces
+        op_face_trip_set = set(op.face_trip_list())
+
+        # Go through all my faces, search
+        shared_face_trip = [trip for trip in self.face_trip_list() if trip in op_face_trip_set]
     
         if len(shared_face_trip) == 0:
             return None, None
         
         # Convert to vert list / face list
-        v_list = list(set([item for sublist in shared_face_trip for item in sublist]))
-        f_list = []
+        v_dict = {}
         for trip in shared_face_trip:
-            f_list.append([v_list.index(trip[0]),v_list.index(trip[1]),v_list.index(trip[2])])
+            for v in trip:
+                if not v in v_dict:
+                    v_dict[v] = len(v_dict)
+        v_list = list(v_dict.keys())
+        f_list = [[v_dict[trip[0]],v_dict[trip[1]],v_dict[trip[2]]] for trip in shared_face_trip]
                 
         return v_list, f_list
     
@@ -442,6 +577,9 @@ class MN_plane:
             self.face_list = []
             self.edge_list = []
 
+# Vertex index triplets of the four faces of a tet, same order as itertools.combinations(tet,3)
+tet_face_idxs = np.array([[0,1,2],[0,1,3],[0,2,3],[1,2,3]])
+
 # Function to project point onto line
 def project_pt_line(v, w, p):
     v_to_p = p-v
@@ -461,48 +599,18 @@ def project_pt_line(v, w, p):
     
     return v + (v_to_w * t2)
 
-# Deep copy a list
-def unshared_copy(inList):
-    if isinstance(inList, list):
-        return list( map(unshared_copy, inList) )
-    return inList
-
 # Read in the swc file to know what's connected
 def get_connections(fname):
     global mn_section_dict
     
-    # Store the swc data
-    swc_data = []
-    
-    # Read the file
-    f = open(fname,'r')
-    for i_line,line in enumerate(f):
-        line_s = line.split();
-        if len(line_s) > 0 and line_s[0] != "#":
-            line_data = []
-            line_data.append(int(float(line_s[0])))
-            line_data.append(int(float(line_s[1])))
-            line_data.append(float(line_s[2]))
-            line_data.append(float(line_s[3]))
-            line_data.append(float(line_s[4]))
-            line_data.append(float(line_s[5]))
-            line_data.append(int(float(line_s[6])))
-            swc_data.append(line_data)
+    # Load the morphology (cached on the file modification time)
+    morph = swc_morphology.load_swc(fname)
 
     # Find connections
-    pt_connect = []
-    for i in range(0,len(swc_data)):
-        pt_connect.append([])
-
-    for i,data in enumerate(swc_data):
-        if i > 0: # The first is the -1 index
-            pt_connect[data[6]-1].append(i+1)
+    pt_connect = morph.pt_connect()
 
-    pt_connect_dup = unshared_copy(pt_connect) # copy
-
-    for i_list, sub_list in enumerate(pt_connect_dup):
-        for idx in sub_list:
-            pt_connect[idx-1].append(i_list+1)
+    # Vertex coordinates
+    swc_vert_list = morph.vert_co_list()
 
     # Make a new section for all
     for i, sublist in enumerate(pt_connect):
@@ -512,7 +620,7 @@ def get_connections(fname):
                 # New section
                 sec_name = "sc_%02d_%02d"%(pt1,pt2)
                 sec_ids = (pt1,pt2)
-                sec_pts = (Vector(swc_data[pt1-1][2:5]),Vector(swc_data[pt2-1][2:5]))
+                sec_pts = (Vector(swc_vert_list[pt1-1]),Vector(swc_vert_list[pt2-1]))
                 
                 nghbrs_min = []
                 for conn_pt in pt_connect[pt1-1]:
@@ -530,26 +638,27 @@ def get_connections(fname):
     return
 
 # Make segements from mesh object
-def segment_meshpy(mesh_vert_co_list, mesh_tet_vert_list, sc_tet_list, mesh_tet_nghbr_list, mesh_face_vert_marker_dict, mn_sec, n_seg_plen):
+def segment_meshpy(mesh_vert_co_list, mesh_vert_co_arr, mesh_tet_vert_arr, sc_tet_list, mesh_tet_nghbr_arr, mesh_face_table, tet_sg_label_arr, mn_sec, n_seg_plen):
     
     global mn_segment_dict
     
+    # Tets in this section
+    sc_tet_arr = np.asarray(sc_tet_list, dtype=np.int64)
+
     # Number of tets in this section
-    n_tets = len(sc_tet_list)
+    n_tets = len(sc_tet_arr)
     
     # Get the distance of projected center points from the endpoint [0] of line seg of all the tets
-    tet_proj_dist_list = []
-    for tet in sc_tet_list:
-        ctr_pt = Vector([0,0,0])
-        for vert_id in mesh_tet_vert_list[tet]:
-            ctr_pt += Vector(mesh_vert_co_list[vert_id])
-        ctr_pt /= 4.0
-        tet_proj_dist_list.append((mn_sec.sc_pts[0] - project_pt_line(mn_sec.sc_pts[0],mn_sec.sc_pts[1],ctr_pt)).length)
+    ctr_pts = mesh_vert_co_arr[mesh_tet_vert_arr[sc_tet_arr]].mean(axis=1)
+    sc_pt_0 = np.array(mn_sec.sc_pts[0])
+    sc_dir = np.array(mn_sec.sc_pts[1]) - sc_pt_0
+    sc_dir /= np.sqrt(sc_dir.dot(sc_dir))
+    tet_proj_dist_arr = np.abs((ctr_pts - sc_pt_0).dot(sc_dir))
             
     # Bin them into segments
     # Bin by distance
-    min_dist = min(tet_proj_dist_list)
-    max_dist = max(tet_proj_dist_list)
+    min_dist = tet_proj_dist_arr.min()
+    max_dist = tet_proj_dist_arr.max()
     # Number of segments
     n_seg = int((max_dist - min_dist)*n_seg_plen) # int => round down
 
@@ -563,16 +672,19 @@ def segment_meshpy(mesh_vert_co_list, mesh_tet_vert_list, sc_tet_list, mesh_tet_
     # Store the number of segments
     mn_sec.n_seg = n_seg
 
-    # Create a dictionary of segment index to tet indeces
-    seg_to_tet_dict = {}
-    for i_seg in range(1,n_seg+1):
-        seg_to_tet_dict[i_seg] = []
-    for i_tet,tet in enumerate(sc_tet_list):
-        dist = tet_proj_dist_list[i_tet]
-        j = int((dist - min_dist) / d_dist) + 1
-        if j>n_seg: # max-distance tet
-            j=n_seg
-        seg_to_tet_dict[j] += [tet]
+    # Segment index of every tet (1-based)
+    # The max-distance tets go into the last segment
+    seg_edges = min_dist + d_dist*np.arange(1,n_seg)
+    tet_seg_arr = np.digitize(tet_proj_dist_arr, seg_edges) + 1
+
+    # Tets of this section sorted by segment, keeping their order within each segment
+    order = np.argsort(tet_seg_arr, kind='stable')
+    sc_tet_sorted_arr = sc_tet_arr[order]
+    sc_seg_sorted_arr = tet_seg_arr[order]
+
+    # Label the tets of this section with their segment
+    # All other entries of tet_sg_label_arr are 0
+    tet_sg_label_arr[sc_tet_sorted_arr] = sc_seg_sorted_arr
 
     ###
     # Create the segments in the dictionary
@@ -590,30 +702,27 @@ def segment_meshpy(mesh_vert_co_list, mesh_tet_vert_list, sc_tet_list, mesh_tet_
     # Segment-segment boundaries
     ###
 
+    # Tet-neighbor pairs where the neighbor is in the next segment of this section
+    nghbrs = mesh_tet_nghbr_arr[sc_tet_sorted_arr]
+    nghbr_labels = np.where(nghbrs >= 0, tet_sg_label_arr[nghbrs], 0)
+    pair_rows, pair_cols = np.nonzero(nghbr_labels == (sc_seg_sorted_arr[:,None] + 1))
+
+    # The shared face of each pair = the verts of the tet that are also in the neighbor
+    # Verts are sorted ascending within each face, as for the surface border faces: the orientation
+    # of the faces doesn't matter here, it is set when the planes are made into regions
+    # (normals_make_consistent, then made to point toward the bigger segment index)
+    this_verts = mesh_tet_vert_arr[sc_tet_sorted_arr[pair_rows]]
+    nghbr_verts = mesh_tet_vert_arr[nghbrs[pair_rows,pair_cols]]
+    in_nghbr = (this_verts[:,:,None] == nghbr_verts[:,None,:]).any(axis=2)
+    sg_brdr_face_arr = np.sort(this_verts[in_nghbr].reshape(-1,3), axis=1)
+
+    # Faces are grouped by segment, since the tets are sorted by segment
+    sg_brdr_face_ptr = np.searchsorted(sc_seg_sorted_arr[pair_rows], np.arange(1,n_seg+2))
+
     # Go through all the segments
-    for i_this_seg in list(seg_to_tet_dict.keys())[:-1]:
+    for i_this_seg in range(1,n_seg):
         # Segement boundary face list for this segment
-        sg_brdr_face_list = []
-        
-        # Tets in this and the next section
-        this_tet_ids = seg_to_tet_dict[i_this_seg]
-        next_tet_ids = seg_to_tet_dict[i_this_seg+1]
-        
-        # Go through all the tets in this seg
-        for this_tet_id in this_tet_ids:
-
-            # Get this tet's neighbors
-            for nghbr_tet_id in mesh_tet_nghbr_list[this_tet_id]:
-                # Surfaces ignored
-                if nghbr_tet_id != -1:
-                    # Is it a boundary tet
-                    if nghbr_tet_id in next_tet_ids:
-                        # Get the shared verts
-                        this_verts = mesh_tet_vert_list[this_tet_id]
-                        nghbr_verts = mesh_tet_vert_list[nghbr_tet_id]
-                        shared_verts = list(set(this_verts).intersection(set(nghbr_verts)))
-                        # Add face
-                        sg_brdr_face_list.append(shared_verts)
+        sg_brdr_face_list = sg_brdr_face_arr[sg_brdr_face_ptr[i_this_seg-1]:sg_brdr_face_ptr[i_this_seg]].tolist()
         
         # Make plane for this segment boundary
         if len(sg_brdr_face_list) > 0:
@@ -628,37 +737,42 @@ def segment_meshpy(mesh_vert_co_list, mesh_tet_vert_list, sc_tet_list, mesh_tet_
     ###
 
     # All face markers possible
-    face_markers_possible = mn_sec.face_marker_dict.keys()
+    face_markers_possible = np.array(list(mn_sec.face_marker_dict.keys()), dtype=np.int64)
+
+    # All faces of all tets of this section, with their markers
+    tet_faces = mesh_tet_vert_arr[sc_tet_sorted_arr][:,tet_face_idxs].reshape(-1,3)
+    tet_face_markers = mesh_face_table.lookup(tet_faces)
+
+    # Find the faces that constitute the border of the section
+    keep = np.isin(tet_face_markers, face_markers_possible)
+    brdr_faces = np.sort(tet_faces[keep], axis=1)
+    brdr_markers = tet_face_markers[keep]
+    brdr_segs = np.repeat(sc_seg_sorted_arr, 4)[keep]
+
+    # Faces are grouped by segment
+    brdr_ptr = np.searchsorted(brdr_segs, np.arange(1,n_seg+2))
+    brdr_faces = brdr_faces.tolist()
+    brdr_markers = brdr_markers.tolist()
 
     # Go through all the segments
-    for i_this_seg in seg_to_tet_dict.keys():
+    for i_this_seg in range(1,n_seg+1):
         # Plane surface face list for this segment
         sg_plane_surf_face_list = []
         # Section surface face dict for this segment, for all the different markers
         sg_sc_surf_face_dict = {}
         
-        # Tets in this section
-        this_tet_ids = seg_to_tet_dict[i_this_seg]
-
-        # Go through all the tets in this seg
-        zero_marker_face_list = []
-        for this_tet_id in this_tet_ids:
-
-            # Check all the faces
-            this_verts = mesh_tet_vert_list[this_tet_id]
-            for triplet in list(itertools.combinations(this_verts,3)):
-                face_marker = mesh_face_vert_marker_dict[frozenset(triplet)]
-                
-                # Find the faces that constitute the border of the section
-                striplet = sorted(triplet)
-                if face_marker in face_markers_possible:
-                    # This face is one of the border faces - but what type of face?
-                    if face_marker < 0:
-                        sg_plane_surf_face_list.append(striplet)
-                    elif face_marker in sg_sc_surf_face_dict:
-                        sg_sc_surf_face_dict[face_marker].append(striplet)
-                    else:
-                        sg_sc_surf_face_dict[face_marker] = [striplet]
+        # Go through all the border faces in this seg
+        for i_face in range(brdr_ptr[i_this_seg-1],brdr_ptr[i_this_seg]):
+            striplet = brdr_faces[i_face]
+            face_marker = brdr_markers[i_face]
+
+            # This face is one of the border faces - but what type of face?
+            if face_marker < 0:
+                sg_plane_surf_face_list.append(striplet)
+            elif face_marker in sg_sc_surf_face_dict:
+                sg_sc_surf_face_dict[face_marker].append(striplet)
+            else:
+                sg_sc_surf_face_dict[face_marker] = [striplet]
 
         # Make the surface plane for this segment
         if len(sg_plane_surf_face_list) > 0:
@@ -697,6 +811,9 @@ def segment_meshpy(mesh_vert_co_list, mesh_tet_vert_list, sc_tet_list, mesh_tet_
                 plane = MN_plane(name=sg_surf_name, sides_names=sg_surf_sides_names, sides_ids=sg_surf_sides_ids, vert_list=mesh_vert_co_list, face_list=sg_sc_surf_face_list, CONV=True)
                 mn_segment_dict[(mn_sec.sc_id[0],mn_sec.sc_id[1],i_this_seg)].planes_sc.append(plane)
 
+    # Clear the labels for the next section
+    tet_sg_label_arr[sc_tet_sorted_arr] = 0
+
     # Fin!
     return
 
@@ -725,9 +842,50 @@ def new_obj_meshpy(obj_name, mesh_built):
     scene = bpy.context.scene
     scene.objects.link(obj_new)
 
+# Arrays describing a mesh object and its section regions, for hashing
+# Includes everything the outputs of the surface_sections stage depend on
+def mesh_region_arrays(ob):
+    mesh = ob.data
+
+    vert_co_arr = np.zeros(3*len(mesh.vertices), dtype=np.float32)
+    mesh.vertices.foreach_get("co", vert_co_arr)
+    edge_vert_arr = np.zeros(2*len(mesh.edges), dtype=np.int32)
+    mesh.edges.foreach_get("vertices", edge_vert_arr)
+    loop_vert_arr = np.zeros(len(mesh.loops), dtype=np.int32)
+    mesh.loops.foreach_get("vertex_index", loop_vert_arr)
+    poly_loop_start_arr = np.zeros(len(mesh.polygons), dtype=np.int32)
+    mesh.polygons.foreach_get("loop_start", poly_loop_start_arr)
+    poly_loop_total_arr = np.zeros(len(mesh.polygons), dtype=np.int32)
+    mesh.polygons.foreach_get("loop_total", poly_loop_total_arr)
+
+    reg_list = []
+    for reg in ob.mcell.regions.region_list:
+        if len(reg.name) == 8 and reg.name[0:3] == 'sc_':
+            reg_list.append((reg.name, np.array(sorted(reg.get_region_faces(mesh)), dtype=np.int64)))
+
+    return [vert_co_arr, edge_vert_arr, loop_vert_arr, poly_loop_start_arr, poly_loop_total_arr, reg_list]
+
+# Cache keys of all stages of f_compartmentize_tet
+# Every key is made from the key of the stage before it, so changing an input invalidates
+# the first stage that depends on it and all stages after it
+def make_stage_keys(cache, ob, swc_filepath, n_seg_plen, TET_PARALLEL):
+    stage_keys = {}
+    stage_keys["swc"] = cache.key("swc", artifact_cache.hash_file(swc_filepath))
+    stage_keys["surface_sections"] = cache.key("surface_sections", stage_keys["swc"], mesh_region_arrays(ob))
+    stage_keys["section_borders"] = cache.key("section_borders", stage_keys["surface_sections"])
+    stage_keys["tetgen"] = cache.key("tetgen", stage_keys["section_borders"], TET_SWITCHES, STACK_WELD_TOL, bool(TET_PARALLEL), tet_parallel.TET_PARALLEL_SWITCHES)
+    stage_keys["segments"] = cache.key("segments", stage_keys["tetgen"], float(n_seg_plen))
+    stage_keys["reconcile"] = cache.key("reconcile", stage_keys["segments"])
+    return stage_keys
+
+# Save the outputs of a stage to the cache, if it is enabled
+def save_stage(cache, stage_keys, stage, **outputs):
+    if cache.enabled:
+        cache.save(stage, stage_keys[stage], outputs)
+
 # Main
 
-def f_compartmentize_tet(context, swc_filepath, n_seg_plen):
+def f_compartmentize_tet(context, swc_filepath, n_seg_plen, TET_PARALLEL=False, TET_OUT_OF_PROCESS=False, CACHE_DIR=None):
 
     print("> Running: f_compartmentize_tet")
 
@@ -737,13 +895,14 @@ def f_compartmentize_tet(context, swc_filepath, n_seg_plen):
 
     global mn_section_dict
     global mn_segment_dict
+    global face_marker_plane_dict
     
     mn_section_dict = {}
     mn_segment_dict = {}
-    
-    # Get data from the SWC file
-    get_connections(swc_filepath)
 
+    # Global list of tet face marker to plane it belongs to
+    face_marker_plane_dict = {}
+    
     # Get the active object
     ob_list = context.selected_objects
 
@@ -752,60 +911,85 @@ def f_compartmentize_tet(context, swc_filepath, n_seg_plen):
     else:
         ob = ob_list[0]
         ob_name = ob.name
-    
+
+    # Resume after the last stage whose outputs are cached for the same inputs
+    cache = artifact_cache.MN_artifact_cache(CACHE_DIR)
+    if cache.enabled:
+        stage_keys = make_stage_keys(cache, ob, swc_filepath, n_seg_plen, TET_PARALLEL)
+        i_done, cached = cache.load_last(CACHE_STAGES, stage_keys)
+    else:
+        stage_keys = {}
+        i_done, cached = -1, artifact_cache.MISS
+    if i_done >= 0:
+        mn_section_dict = cached["mn_section_dict"]
+        mn_segment_dict = cached.get("mn_segment_dict", {})
+        face_marker_plane_dict = cached.get("face_marker_plane_dict", {})
+
+    # Get data from the SWC file
+    if i_done < CACHE_STAGES.index("swc"):
+        get_connections(swc_filepath)
+        save_stage(cache, stage_keys, "swc", mn_section_dict=mn_section_dict)
+
     # All vertices
-    ob_vert_list = [tuple(item.co) for item in ob.data.vertices]
+    if i_done < CACHE_STAGES.index("section_borders"):
+        ob_vert_list = [tuple(item.co) for item in ob.data.vertices]
 
     # Make sure everything is de-selected before we start
     bpy.ops.object.mode_set(mode='EDIT')
     bpy.ops.mesh.select_all(action='DESELECT')
     bpy.ops.object.mode_set(mode='OBJECT')
 
-    # Get the regions of the cube object
-    reg_list = ob.mcell.regions.region_list
+    if i_done < CACHE_STAGES.index("surface_sections"):
 
-    # Go over all sections, get the border edges
-    sc_edge_dict = {}
-    for sec in reg_list:
-        # Get the name
-        sec_name = sec.name
+        # Get the regions of the cube object
+        reg_list = ob.mcell.regions.region_list
+
+        # Go over all sections, get the border edges
+        sc_edge_dict = {}
+        for sec in reg_list:
+            # Get the name
+            sec_name = sec.name
         
-        # Check that it is a section
-        if len(sec_name) == 8 and sec_name[0:3] == 'sc_':
+            # Check that it is a section
+            if len(sec_name) == 8 and sec_name[0:3] == 'sc_':
             
-            print("Section: " + str(sec_name))
+                print("Section: " + str(sec_name))
 
-            # Get the vert indeces
-            pt1 = int(sec_name[3:5])
-            pt2 = int(sec_name[6:8])
-            pt_min = min(pt1,pt2)
-            pt_max = max(pt1,pt2)
+                # Get the vert indeces
+                pt1 = int(sec_name[3:5])
+                pt2 = int(sec_name[6:8])
+                pt_min = min(pt1,pt2)
+                pt_max = max(pt1,pt2)
             
-            # Get the faces
-            bpy.ops.object.mode_set(mode='EDIT')
-            sec.select_region_faces(context)
+                # Get the faces
+                bpy.ops.object.mode_set(mode='EDIT')
+                sec.select_region_faces(context)
             
-            # Store the surface as a new plane
-            bpy.ops.object.mode_set(mode='OBJECT')
-            surf_face_list = [i.vertices for i in ob.data.polygons if i.select]
-            surf_name = 'sc_%02d_%02d'%(pt_min,pt_max)
-            surf_sides_names = (surf_name,-1)
-            surf_sides_ids = ((pt_min,pt_max),(-1))
-            # Make the plane
-            plane_surf = MN_plane(name=surf_name, sides_names=surf_sides_names, sides_ids=surf_sides_ids, vert_list=ob_vert_list, face_list=surf_face_list, CONV=True)
-            # Store the plane as the surface for this section
-            mn_section_dict[(pt_min,pt_max)].plane_surf = plane_surf
+                # Store the surface as a new plane
+                bpy.ops.object.mode_set(mode='OBJECT')
+                surf_face_list = [i.vertices for i in ob.data.polygons if i.select]
+                surf_name = 'sc_%02d_%02d'%(pt_min,pt_max)
+                surf_sides_names = (surf_name,-1)
+                surf_sides_ids = ((pt_min,pt_max),(-1))
+                # Make the plane
+                plane_surf = MN_plane(name=surf_name, sides_names=surf_sides_names, sides_ids=surf_sides_ids, vert_list=ob_vert_list, face_list=surf_face_list, CONV=True)
+                # Store the plane as the surface for this section
+                mn_section_dict[(pt_min,pt_max)].plane_surf = plane_surf
             
-            # Get the edges
-            bpy.ops.object.mode_set(mode='EDIT')
-            bpy.ops.mesh.region_to_loop()
-            bpy.ops.object.mode_set(mode='OBJECT')
-            sc_edge_dict[(pt_min,pt_max)] = [i.index for i in ob.data.edges if i.select]
+                # Get the edges
+                bpy.ops.object.mode_set(mode='EDIT')
+                bpy.ops.mesh.region_to_loop()
+                bpy.ops.object.mode_set(mode='OBJECT')
+                sc_edge_dict[(pt_min,pt_max)] = [i.index for i in ob.data.edges if i.select]
+
+                # Deselect all
+                bpy.ops.object.mode_set(mode='EDIT')
+                bpy.ops.mesh.select_all(action='DESELECT')
+                bpy.ops.object.mode_set(mode='OBJECT')
 
-            # Deselect all
-            bpy.ops.object.mode_set(mode='EDIT')
-            bpy.ops.mesh.select_all(action='DESELECT')
-            bpy.ops.object.mode_set(mode='OBJECT')
+        save_stage(cache, stage_keys, "surface_sections", mn_section_dict=mn_section_dict, sc_edge_dict=sc_edge_dict)
+    elif i_done == CACHE_STAGES.index("surface_sections"):
+        sc_edge_dict = cached["sc_edge_dict"]
 
     # Make sure the main guy is not selected
     ob.select = False
@@ -819,62 +1003,68 @@ def f_compartmentize_tet(context, swc_filepath, n_seg_plen):
     # Make SECTION boundaries
     ###
 
-    # Go through all of the sections
-    for this_sc_id in mn_section_dict.keys():
-        this_sc = mn_section_dict[this_sc_id]
+    if i_done < CACHE_STAGES.index("section_borders"):
+
+        # Go through all of the sections
+        for this_sc_id in mn_section_dict.keys():
+            this_sc = mn_section_dict[this_sc_id]
         
-        # Border
-        this_sc_edge = sc_edge_dict[this_sc_id]
+            # Border
+            this_sc_edge = sc_edge_dict[this_sc_id]
         
-        # Go through both of end verts
-        for i_end,nghbr_sc_ids in enumerate(this_sc.nghbr_sc_ids):
+            # Go through both of end verts
+            for i_end,nghbr_sc_ids in enumerate(this_sc.nghbr_sc_ids):
             
-            # Go through all of the neighboring sections
-            for nghbr_sc_id in nghbr_sc_ids:
+                # Go through all of the neighboring sections
+                for nghbr_sc_id in nghbr_sc_ids:
                 
-                # Don't double count
-                if nghbr_sc_id > this_sc_id:
+                    # Don't double count
+                    if nghbr_sc_id > this_sc_id:
                     
-                    # Border
-                    nghbr_sc_edge = sc_edge_dict[nghbr_sc_id]
+                        # Border
+                        nghbr_sc_edge = sc_edge_dict[nghbr_sc_id]
 
-                    # Get the elements they share
-                    edge_share = list(set(this_sc_edge).intersection(set(nghbr_sc_edge)))
+                        # Get the elements they share
+                        edge_share = list(set(this_sc_edge).intersection(set(nghbr_sc_edge)))
 
-                    if len(edge_share) > 0: # Do they share any?
+                        if len(edge_share) > 0: # Do they share any?
                         
-                        # Vertices
-                        plane_vert_list = ob_vert_list + [tuple(this_sc.sc_pts[i_end])]
+                            # Vertices
+                            plane_vert_list = ob_vert_list + [tuple(this_sc.sc_pts[i_end])]
                         
-                        # Index of the ctr pt
-                        ctr_pt_id = len(plane_vert_list)-1
+                            # Index of the ctr pt
+                            ctr_pt_id = len(plane_vert_list)-1
                         
-                        # Convert the edges to vertices
-                        verts_share = [[ob.data.edges[edge].vertices[0],ob.data.edges[edge].vertices[1]] for edge in edge_share]
+                            # Convert the edges to vertices
+                            verts_share = [[ob.data.edges[edge].vertices[0],ob.data.edges[edge].vertices[1]] for edge in edge_share]
 
-                        # Faces
-                        plane_face_list = [[ctr_pt_id, item[0], item[1]] for item in verts_share]
+                            # Faces
+                            plane_face_list = [[ctr_pt_id, item[0], item[1]] for item in verts_share]
 
-                        # Get the actual neighboring section
-                        nghbr_sc = mn_section_dict[nghbr_sc_id]
+                            # Get the actual neighboring section
+                            nghbr_sc = mn_section_dict[nghbr_sc_id]
 
-                        # Make a new plane
-                        name_plane = this_sc.name + "_B_" + nghbr_sc.name
-                        plane = MN_plane(name=name_plane,sides_names=(this_sc.name,nghbr_sc.name),sides_ids=(this_sc_id,nghbr_sc_id),vert_list=plane_vert_list,face_list=plane_face_list,CONV=True)
+                            # Make a new plane
+                            name_plane = this_sc.name + "_B_" + nghbr_sc.name
+                            plane = MN_plane(name=name_plane,sides_names=(this_sc.name,nghbr_sc.name),sides_ids=(this_sc_id,nghbr_sc_id),vert_list=plane_vert_list,face_list=plane_face_list,CONV=True)
                         
-                        # Add the plane to both section boundaries
-                        this_sc.planes_sc_brdrs[i_end].append(plane)
-                        if nghbr_sc_id[0] == this_sc_id[i_end]:
-                            nghbr_sc.planes_sc_brdrs[0].append(plane)
-                        elif nghbr_sc_id[1] == this_sc_id[i_end]:
-                            nghbr_sc.planes_sc_brdrs[1].append(plane)
-                        else:
-                            print("Something went wrong!")
+                            # Add the plane to both section boundaries
+                            this_sc.planes_sc_brdrs[i_end].append(plane)
+                            if nghbr_sc_id[0] == this_sc_id[i_end]:
+                                nghbr_sc.planes_sc_brdrs[0].append(plane)
+                            elif nghbr_sc_id[1] == this_sc_id[i_end]:
+                                nghbr_sc.planes_sc_brdrs[1].append(plane)
+                            else:
+                                print("Something went wrong!")
 
-                        print("Made plane: " + str(name_plane))
+                            print("Made plane: " + str(name_plane))
+
+        save_stage(cache, stage_keys, "section_borders", mn_section_dict=mn_section_dict)
 
     # # # Free memory
     del ob
+    if i_done < CACHE_STAGES.index("section_borders"):
+        del ob_vert_list
 
     # Time
     t_st.append(time.time())
@@ -884,71 +1074,82 @@ def f_compartmentize_tet(context, swc_filepath, n_seg_plen):
     # Mesh errr thang
     ###
 
-    # Global list of tet face marker to plane it belongs to
-    global face_marker_plane_dict
-    face_marker_plane_dict = {}
-
-    mesh_built = make_tetgen_mesh()
-
-    # Make it an object
-    #print("> Creating a Blender object from a TetGen mesh....")
-    #new_obj_meshpy("tetgen", mesh_built);
-
-    # Get the coordinates of the tet points
-    mesh_vert_co_list = [tuple(item) for item in list(mesh_built.points)]
-
-    # List of tets to vertex indices
-    mesh_tet_vert_list = list(mesh_built.elements)
-
-    # List of neighbours of each tet
-    mesh_tet_nghbr_list = list(mesh_built.neighbors)
-
-    # List of face vertex ids to face markers
-    mesh_face_vert_marker_dict = dict(mesh_built.face_vertex_indices_to_face_marker)
-
-    # Tet attributes - every index is a unique (but unknown :'( ) region
-    mesh_tet_att = list(mesh_built.element_attributes)
-
-    # # # Reclaim memory
-    del mesh_built
-
-    # Dictionary of section attribute to tet id
-    sc_att_tet_dict = {}
-    for i_tet, sc_att in enumerate(mesh_tet_att):
-        if int(sc_att) in sc_att_tet_dict:
-            sc_att_tet_dict[int(sc_att)].append(i_tet)
-        else:
-            sc_att_tet_dict[int(sc_att)] = [i_tet]
-
-    # Figure out what attribute indices correspond to which section
-    sc_tet_dict = {}
-    for sc_att in sc_att_tet_dict.keys():
-        sc_tets = sc_att_tet_dict[sc_att]
-        
-        # Find surface tets
-        DONE = False
-        for tet in sc_tets:
-            if -1 in mesh_tet_nghbr_list[tet]:
-                # Get its verts
-                tet_verts = mesh_tet_vert_list[tet]
-                # Get the triplets of face vertex indices
-                for triplet in list(itertools.combinations(tet_verts,3)):
-                    # Get the face marker
-                    face_marker = mesh_face_vert_marker_dict[frozenset(triplet)]
-                    # Is it a surface?
-                    if face_marker < 0:
-                        # What plane corresponds to this marker
-                        plane = face_marker_plane_dict[face_marker]
-                        # What is the section key for this plane
-                        sc_id = plane.sides_ids[0]
-                        # Store
-                        sc_tet_dict[sc_id] = sc_tets
-                        # Stop for this section
-                        DONE = True
-                        break
-                            
-                if DONE == True:
-                    break
+    if i_done < CACHE_STAGES.index("tetgen"):
+
+        mesh_built = make_tetgen_mesh(PARALLEL=TET_PARALLEL, OUT_OF_PROCESS=TET_OUT_OF_PROCESS)
+
+        # Make it an object
+        #print("> Creating a Blender object from a TetGen mesh....")
+        #new_obj_meshpy("tetgen", mesh_built);
+
+        # Get the coordinates of the tet points
+        # The MeshPy arrays are read as NumPy views, without a Python object per item
+        mesh_vert_co_arr = np.array(foreign_array_as_numpy(mesh_built.points), dtype=np.float64).reshape(-1,3)
+
+        # Tets to vertex indices
+        mesh_tet_vert_arr = np.array(foreign_array_as_numpy(mesh_built.elements), dtype=np.int64).reshape(-1,4)
+
+        # Neighbours of each tet
+        mesh_tet_nghbr_arr = np.array(foreign_array_as_numpy(mesh_built.neighbors), dtype=np.int64).reshape(-1,4)
+
+        # Faces and their markers
+        mesh_face_arr = np.array(foreign_array_as_numpy(mesh_built.faces), dtype=np.int64).reshape(-1,3)
+        mesh_face_marker_arr = np.array(foreign_array_as_numpy(mesh_built.face_markers), dtype=np.int64).reshape(-1)
+
+        # Table of face vertex ids to face markers
+        # Faces are looked up in bulk by their packed, sorted vertex ids
+        mesh_face_table = FaceMarkerTable(mesh_face_arr, mesh_face_marker_arr, len(mesh_vert_co_arr))
+
+        # Tet attributes - every index is a unique (but unknown :'( ) region
+        mesh_tet_att = np.array(foreign_array_as_numpy(mesh_built.element_attributes)).reshape(-1).astype(np.int64)
+
+        # # # Reclaim memory
+        del mesh_built
+
+        # Group the tets by section attribute, keeping their order
+        att_order = np.argsort(mesh_tet_att, kind='stable')
+        att_sorted = mesh_tet_att[att_order]
+        att_starts = np.nonzero(np.diff(att_sorted))[0] + 1
+        att_ptr = np.concatenate(([0], att_starts, [len(att_sorted)]))
+
+        # Figure out what attribute indices correspond to which section
+        sc_tet_dict = {}
+        for i_att in range(0,len(att_ptr)-1):
+            sc_tets = att_order[att_ptr[i_att]:att_ptr[i_att+1]]
+
+            # Find surface tets
+            surf_tets = sc_tets[(mesh_tet_nghbr_arr[sc_tets] == -1).any(axis=1)]
+            if len(surf_tets) == 0:
+                continue
+
+            # Get the face markers of all their faces
+            face_markers = mesh_face_table.lookup(mesh_tet_vert_arr[surf_tets][:,tet_face_idxs].reshape(-1,3))
+
+            # The first surface face
+            is_surf = face_markers < 0
+            if np.any(is_surf):
+                face_marker = int(face_markers[np.argmax(is_surf)])
+                # What plane corresponds to this marker
+                plane = face_marker_plane_dict[face_marker]
+                # What is the section key for this plane
+                sc_id = plane.sides_ids[0]
+                # Store
+                sc_tet_dict[sc_id] = sc_tets
+
+        # # # Reclaim memory
+        del mesh_face_table
+        del mesh_tet_att
+
+        save_stage(cache, stage_keys, "tetgen", mn_section_dict=mn_section_dict, face_marker_plane_dict=face_marker_plane_dict,
+            mesh_vert_co_arr=mesh_vert_co_arr, mesh_tet_vert_arr=mesh_tet_vert_arr, mesh_tet_nghbr_arr=mesh_tet_nghbr_arr,
+            mesh_face_arr=mesh_face_arr, mesh_face_marker_arr=mesh_face_marker_arr, sc_tet_dict=sc_tet_dict)
+    elif i_done == CACHE_STAGES.index("tetgen"):
+        mesh_vert_co_arr = cached["mesh_vert_co_arr"]
+        mesh_tet_vert_arr = cached["mesh_tet_vert_arr"]
+        mesh_tet_nghbr_arr = cached["mesh_tet_nghbr_arr"]
+        mesh_face_arr = cached["mesh_face_arr"]
+        mesh_face_marker_arr = cached["mesh_face_marker_arr"]
+        sc_tet_dict = cached["sc_tet_dict"]
 
     # Time
     t_st.append(time.time())
@@ -958,26 +1159,42 @@ def f_compartmentize_tet(context, swc_filepath, n_seg_plen):
     # Segment each of the sections
     ###
     
-    for sec_id in list(mn_section_dict.keys()):
+    if i_done < CACHE_STAGES.index("segments"):
+
+        mesh_vert_co_list = [tuple(item) for item in mesh_vert_co_arr.tolist()]
+
+        # Table of face vertex ids to face markers
+        mesh_face_table = FaceMarkerTable(mesh_face_arr, mesh_face_marker_arr, len(mesh_vert_co_arr))
+
+        # Segment label of every tet of the section being segmented (0 = not in the section)
+        tet_sg_label_arr = np.zeros(len(mesh_tet_vert_arr), dtype=np.int64)
+
+        for sec_id in list(mn_section_dict.keys()):
         
-        # if sec_id in sc_tet_dict: # Why should this not be the case? This occurs for some reason....
+            # if sec_id in sc_tet_dict: # Why should this not be the case? This occurs for some reason....
         
-        sec = mn_section_dict[sec_id]
-        print("Dividing tets into segments for section: " + str(sec_id))
+            sec = mn_section_dict[sec_id]
+            print("Dividing tets into segments for section: " + str(sec_id))
 
-        # Make the dividing planes
-        segment_meshpy(mesh_vert_co_list, mesh_tet_vert_list, sc_tet_dict[sec_id], mesh_tet_nghbr_list, mesh_face_vert_marker_dict, sec, n_seg_plen)
+            # Make the dividing planes
+            segment_meshpy(mesh_vert_co_list, mesh_vert_co_arr, mesh_tet_vert_arr, sc_tet_dict[sec_id], mesh_tet_nghbr_arr, mesh_face_table, tet_sg_label_arr, sec, n_seg_plen)
+
+        save_stage(cache, stage_keys, "segments", mn_section_dict=mn_section_dict, mn_segment_dict=mn_segment_dict)
 
     # Time
     t_st.append(time.time())
     print("> Created segment borders for each section: time: " + str(t_st[-1]-t_st[-2]))
 
-    # # # Free memory
-    del mesh_vert_co_list
-    del mesh_tet_vert_list
-    del mesh_tet_nghbr_list
-    del mesh_face_vert_marker_dict
-    del mesh_tet_att
+    if i_done < CACHE_STAGES.index("segments"):
+        # # # Free memory
+        del mesh_vert_co_list
+        del mesh_vert_co_arr
+        del mesh_tet_vert_arr
+        del mesh_tet_nghbr_arr
+        del mesh_face_table
+        del mesh_face_arr
+        del mesh_face_marker_arr
+        del tet_sg_label_arr
 
     ###
     # After making all the segments: Convert segment->section boundaries into segment->segment boundaries!
@@ -986,72 +1203,77 @@ def f_compartmentize_tet(context, swc_filepath, n_seg_plen):
     # Time
     t_st.append(time.time())
 
-    # Go through all of the segments
-    for mn_seg_id in mn_segment_dict.keys():
-        mn_seg = mn_segment_dict[mn_seg_id]
+    if i_done < CACHE_STAGES.index("reconcile"):
+
+        # Index of the segment->section planes
+        # Key: (section of the segment, section on the other side of the plane)
+        # Value: list of (segment id, plane), in the order of mn_segment_dict
+        seg_sc_plane_dict = {}
+        # All of them as (segment id, plane, section on the other side of the plane)
+        seg_sc_plane_list = []
+        for mn_seg_id in mn_segment_dict.keys():
+            mn_seg = mn_segment_dict[mn_seg_id]
+
+            # Go through all of the section bounding planes
+            for plane_sc in mn_seg.planes_sc:
+
+                # What's on the other side of this plane?
+                sides_ids = plane_sc.sides_ids
+                if len(sides_ids[0]) == 2 and len(sides_ids[1]) == 3:
+                    other_side_sc = sides_ids[0]
+                elif len(sides_ids[1]) == 2 and len(sides_ids[0]) == 3:
+                    other_side_sc = sides_ids[1]
+                else:
+                    # Not a section -> segment plane - somehow?
+                    print("Warning! This isn't a segment->section plane! Should this be possible?")
+                    continue
 
-        # Go through all of the section bounding planes
-        for plane_sc in mn_seg.planes_sc:
+                seg_sc_plane_list.append((mn_seg_id,plane_sc,other_side_sc))
 
-            # What's on the other side of this plane?
-            sides_ids = plane_sc.sides_ids
-            if len(sides_ids[0]) == 2 and len(sides_ids[1]) == 3:
-                other_side_sc = sides_ids[0]
-            elif len(sides_ids[1]) == 2 and len(sides_ids[0]) == 3:
-                other_side_sc = sides_ids[1]
-            else:
-                # Not a section -> segment plane - somehow?
-                print("Warning! This isn't a segment->section plane! Should this be possible?")
-            
-            # Get all the segments that are in the other side's section
-            for other_mn_seg_id in mn_segment_dict.keys():
+                key = (mn_seg_id[0:2],other_side_sc)
+                if key in seg_sc_plane_dict:
+                    seg_sc_plane_dict[key].append((mn_seg_id,plane_sc))
+                else:
+                    seg_sc_plane_dict[key] = [(mn_seg_id,plane_sc)]
+
+        # Sides ids of all segment->segment planes that exist
+        plane_sg_sides_ids_done = set([plane0.sides_ids for seg0 in mn_segment_dict.values() for plane0 in seg0.planes_sg])
+
+        # Go through all of the segment->section planes
+        for mn_seg_id, plane_sc, other_side_sc in seg_sc_plane_list:
+            mn_seg = mn_segment_dict[mn_seg_id]
+
+            # Check all the planes of the segments in the other side's section, that face this section
+            for other_mn_seg_id, other_plane_sc in seg_sc_plane_dict.get((other_side_sc,mn_seg_id[0:2]),[]):
 
                 # Obviously, check yourself before you wreck yourself
-                if mn_seg_id != other_mn_seg_id:
-                    # Is this segment in the section we care about
-                    if other_mn_seg_id[0:2] == other_side_sc:
-
-                        # Get the segment
-                        other_mn_seg = mn_segment_dict[other_mn_seg_id]
-
-                        # Check all the planes in this segment for overlap
-                        for other_plane_sc in other_mn_seg.planes_sc:
-                            
-                            # What's on the other side of this plane?
-                            other_sides_ids = other_plane_sc.sides_ids
-                            if len(other_sides_ids[0]) == 2 and len(other_sides_ids[1]) == 3:
-                                other_other_side_sc = other_sides_ids[0]
-                            elif len(other_sides_ids[1]) == 2 and len(other_sides_ids[0]) == 3:
-                                other_other_side_sc = other_sides_ids[1]
-                            else:
-                                # Not a section -> segment plane - somehow?
-                                print("Warning! This isn't a segment->section plane! Should this be possible?")
-
-                            # Is the section on the other side of this plane to original one?
-                            if mn_seg_id[0:2] == other_other_side_sc:
-                                
-                                # The would be plane id
-                                min_id = min(mn_seg_id,other_mn_seg_id)
-                                max_id = max(mn_seg_id,other_mn_seg_id)
-                                p_sides_ids = (min_id,max_id)
-
-                                # Make sure we didn't check this already
-                                if not p_sides_ids in [plane0.sides_ids for seg0 in mn_segment_dict.values() for plane0 in seg0.planes_sg]:
-                                
-                                    # Check for overlap
-                                    vert_list, face_list = plane_sc.overlap(other_plane_sc)
-                                    if vert_list != None:
-                                        
-                                        # Yes! there's overlap
-                                        # Make yet another plane
-                                        p_name = 'sc_%02d_%02d_sg_%02d'%min_id + '_B_' + 'sc_%02d_%02d_sg_%02d'%max_id
-                                        p_sides_names = ('sc_%02d_%02d_sg_%02d'%min_id, 'sc_%02d_%02d_sg_%02d'%max_id)
-                                        plane = MN_plane(name=p_name, sides_names=p_sides_names, sides_ids=p_sides_ids, vert_list=vert_list, face_list=face_list, CONV=True)
-                                        
-                                        # Add the plane to both segments
-                                        mn_seg.planes_sg.append(plane)
-                                        other_mn_seg.planes_sg.append(plane)
+                if mn_seg_id == other_mn_seg_id:
+                    continue
+
+                # The would be plane id
+                min_id = min(mn_seg_id,other_mn_seg_id)
+                max_id = max(mn_seg_id,other_mn_seg_id)
+                p_sides_ids = (min_id,max_id)
+
+                # Make sure we didn't check this already
+                if not p_sides_ids in plane_sg_sides_ids_done:
+            
+                    # Check for overlap
+                    vert_list, face_list = plane_sc.overlap(other_plane_sc)
+                    if vert_list != None:
+                    
+                        # Yes! there's overlap
+                        # Make yet another plane
+                        p_name = 'sc_%02d_%02d_sg_%02d'%min_id + '_B_' + 'sc_%02d_%02d_sg_%02d'%max_id
+                        p_sides_names = ('sc_%02d_%02d_sg_%02d'%min_id, 'sc_%02d_%02d_sg_%02d'%max_id)
+                        plane = MN_plane(name=p_name, sides_names=p_sides_names, sides_ids=p_sides_ids, vert_list=vert_list, face_list=face_list, CONV=True)
+                    
+                        # Add the plane to both segments
+                        mn_seg.planes_sg.append(plane)
+                        mn_segment_dict[other_mn_seg_id].planes_sg.append(plane)
+                        plane_sg_sides_ids_done.add(p_sides_ids)
 
+        save_stage(cache, stage_keys, "reconcile", mn_section_dict=mn_section_dict, mn_segment_dict=mn_segment_dict)
 
     # Time
     t_st.append(time.time())
@@ -1080,7 +1302,7 @@ def f_compartmentize_tet(context, swc_filepath, n_seg_plen):
                 plane_sides_ids_done.append(mn_seg.plane_surf.sides_ids)
 
     # Correct the lists
-    plane_surf_vert_list, plane_surf_face_list = stack_lists(plane_surf_vert_stack, plane_surf_face_stack)
+    plane_surf_vert_list, plane_surf_face_list = stack_lists(plane_surf_vert_stack, plane_surf_face_stack, weld_tol=STACK_WELD_TOL)
 
     # Make the plane
     mn_surface_plane = MN_plane(name=ob_name+"_surface",vert_list = plane_surf_vert_list, face_list = plane_surf_face_list, CONV=True)
@@ -1154,7 +1376,7 @@ def f_compartmentize_tet(context, swc_filepath, n_seg_plen):
                 plane_sides_ids_done.append(plane_sg.sides_ids)
 
     # Correct the lists
-    seg_surf_vert_list, seg_surf_face_list = stack_lists(seg_surf_vert_stack, seg_surf_face_stack)
+    seg_surf_vert_list, seg_surf_face_list = stack_lists(seg_surf_vert_stack, seg_surf_face_stack, weld_tol=STACK_WELD_TOL)
 
     # Make the plane
     mn_seg_plane = MN_plane(name=ob_name+"_segment",vert_list = seg_surf_vert_list, face_list = seg_surf_face_list, CONV=True)
@@ -18,50 +18,19 @@ import time
 # Bisect
 import bisect
 
-# Deep copy a list
-def unshared_copy(inList):
-    if isinstance(inList, list):
-        return list( map(unshared_copy, inList) )
-    return inList
+# Shared SWC loader
+from . import swc_morphology
 
 # Read in the swc file to know what's connected
 def get_connections(fname):
-    global mn_section_dict
-    
-    # Store the swc data
-    swc_data = []
-    
-    # Read the file
-    f = open(fname,'r')
-    for i_line,line in enumerate(f):
-        line_s = line.split();
-        if len(line_s) > 0 and line_s[0] != "#":
-            line_data = []
-            line_data.append(int(float(line_s[0])))
-            line_data.append(int(float(line_s[1])))
-            line_data.append(float(line_s[2]))
-            line_data.append(float(line_s[3]))
-            line_data.append(float(line_s[4]))
-            line_data.append(float(line_s[5]))
-            line_data.append(int(float(line_s[6])))
-            swc_data.append(line_data)
 
-    # Find connections
-    pt_connect = []
-    for i in range(0,len(swc_data)):
-        pt_connect.append([])
-
-    for i,data in enumerate(swc_data):
-        if i > 0: # The first is the -1 index
-            pt_connect[data[6]-1].append(i+1)
+    # Load the morphology (cached on the file modification time)
+    morph = swc_morphology.load_swc(fname)
 
-    pt_connect_dup = unshared_copy(pt_connect) # copy
-
-    for i_list, sub_list in enumerate(pt_connect_dup):
-        for idx in sub_list:
-            pt_connect[idx-1].append(i_list+1)
+    # Find connections
+    pt_connect = morph.pt_connect()
 
-    swc_vert_list = [Vector(item[2:5]) for item in swc_data]
+    swc_vert_list = [Vector(item) for item in morph.vert_co_list()]
 
     return pt_connect, swc_vert_list
 
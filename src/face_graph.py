@@ -0,0 +1,213 @@
+import numpy as np
+
+# Gather the entries of the given rows of a CSR structure into one array
+def csr_gather(ptr, idx, rows):
+    starts = ptr[rows]
+    counts = ptr[rows+1] - starts
+    offs = np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+    return idx[offs]
+
+# Loops of all faces, face after face, from the first loop and number of loops of every face
+# The loops of a face are consecutive, but the faces need not be stored in order (loop_start
+# may not be increasing)
+def face_loops(loop_start, loop_total):
+    return np.repeat(loop_start - np.cumsum(loop_total) + loop_total, loop_total) + np.arange(loop_total.sum())
+
+# Build CSR pointers + indices grouping "vals" by "keys" (keys in [0,n_keys))
+def csr_from_pairs(keys, vals, n_keys):
+    order = np.argsort(keys, kind='stable')
+    ptr = np.zeros(n_keys+1, dtype=np.int64)
+    np.cumsum(np.bincount(keys, minlength=n_keys), out=ptr[1:])
+    return ptr, vals[order]
+
+# Class for the face adjacency of a polygon mesh
+# Independent of Blender: built from the loop arrays of a mesh
+# (loop_start, loop_total per face, vertex index per loop)
+class MN_face_graph:
+
+    # Init
+    def __init__(self, loop_start, loop_total, loop_verts, n_verts):
+        loop_start = np.asarray(loop_start, dtype=np.int64)
+        loop_total = np.asarray(loop_total, dtype=np.int64)
+        loop_verts = np.asarray(loop_verts, dtype=np.int64)
+
+        self.n_faces = len(loop_start)
+        self.n_verts = n_verts
+
+        # Face of each loop
+        f_loops = face_loops(loop_start, loop_total)
+        self.loop_face = np.zeros(len(loop_verts), dtype=np.int64)
+        self.loop_face[f_loops] = np.repeat(np.arange(self.n_faces), loop_total)
+        self.loop_verts = loop_verts
+
+        # Next loop around each face, wrapping at the end
+        loop_next = np.arange(len(loop_verts)) + 1
+        face_end = (loop_start + loop_total)[self.loop_face]
+        loop_next[loop_next == face_end] = loop_start[self.loop_face][loop_next == face_end]
+        self.loop_next = loop_next
+
+        # Edge keys: (min vert, max vert) packed into one int
+        v0 = loop_verts
+        v1 = loop_verts[loop_next]
+        keys = np.minimum(v0,v1)*n_verts + np.maximum(v0,v1)
+
+        # Unique edges, and the edge of every loop
+        edge_keys, self.loop_edge = np.unique(keys, return_inverse=True)
+        self.loop_edge = self.loop_edge.ravel()
+        self.n_edges = len(edge_keys)
+        self.edge_verts = np.stack([edge_keys // n_verts, edge_keys % n_verts], axis=1)
+
+        # Edge -> faces
+        self.edge_face_ptr, self.edge_face_idx = csr_from_pairs(self.loop_edge, self.loop_face, self.n_edges)
+        self.edge_degree = np.diff(self.edge_face_ptr)
+
+        # Vertex -> faces
+        self.vert_face_ptr, self.vert_face_idx = csr_from_pairs(loop_verts, self.loop_face, n_verts)
+
+        # Face -> verts
+        self.face_vert_ptr = np.zeros(self.n_faces+1, dtype=np.int64)
+        np.cumsum(loop_total, out=self.face_vert_ptr[1:])
+        self.face_vert_idx = loop_verts[f_loops]
+
+        # Face -> faces sharing an edge
+        # Every loop is paired with all faces of its edge, minus itself
+        src = np.repeat(self.loop_face, self.edge_degree[self.loop_edge])
+        dst = csr_gather(self.edge_face_ptr, self.edge_face_idx, self.loop_edge)
+        keep = src != dst
+        pair_keys = np.unique(src[keep]*self.n_faces + dst[keep])
+        self.face_face_ptr, self.face_face_idx = csr_from_pairs(pair_keys // self.n_faces, pair_keys % self.n_faces, self.n_faces)
+
+    # Faces neighboring the given faces
+    # face_step = True: faces sharing a vertex (as bpy.ops.mesh.select_more does)
+    # face_step = False: faces sharing an edge
+    def neighbors(self, faces, face_step=True):
+        faces = np.asarray(faces, dtype=np.int64)
+        if face_step:
+            verts = csr_gather(self.face_vert_ptr, self.face_vert_idx, faces)
+            return csr_gather(self.vert_face_ptr, self.vert_face_idx, np.unique(verts))
+        else:
+            return csr_gather(self.face_face_ptr, self.face_face_idx, faces)
+
+    # Grow a region from the seed faces, only over faces in the candidate mask
+    # Returns the faces of the region in the order they were reached
+    def grow_region(self, seeds, cand_mask, face_step=True):
+        seeds = np.asarray(seeds, dtype=np.int64)
+
+        # Faces that may still be added
+        free_mask = np.array(cand_mask, dtype=bool, copy=True)
+
+        # Seeds must be candidates themselves
+        frontier = np.unique(seeds[free_mask[seeds]])
+        free_mask[frontier] = False
+
+        region = [frontier]
+        while len(frontier) > 0:
+            nghbrs = self.neighbors(frontier, face_step)
+            frontier = np.unique(nghbrs[free_mask[nghbrs]])
+            free_mask[frontier] = False
+            region.append(frontier)
+
+        return np.concatenate(region)
+
+    # Label the connected components of the faces in the mask, connected by sharing an edge
+    # Union-find over all neighbor pairs at once: roots are hooked onto the smaller root,
+    # then paths are compressed by pointer jumping, until every pair has the same root
+    # Returns (label of every face, -1 outside the mask, number of components)
+    def label_components(self, face_mask):
+        face_mask = np.asarray(face_mask, dtype=bool)
+
+        # Neighbor pairs inside the mask
+        src = np.repeat(np.arange(self.n_faces), np.diff(self.face_face_ptr))
+        dst = self.face_face_idx
+        keep = face_mask[src] & face_mask[dst] & (src < dst)
+        src, dst = src[keep], dst[keep]
+
+        parent = np.arange(self.n_faces)
+        while True:
+            r_src, r_dst = parent[src], parent[dst]
+            diff = r_src != r_dst
+            if not np.any(diff):
+                break
+            np.minimum.at(parent, np.maximum(r_src[diff], r_dst[diff]), np.minimum(r_src[diff], r_dst[diff]))
+            while True:
+                grand = parent[parent]
+                if np.array_equal(grand, parent):
+                    break
+                parent = grand
+
+        # Number the roots consecutively
+        labels = np.full(self.n_faces, -1, dtype=np.int64)
+        roots, labels[face_mask] = np.unique(parent[face_mask], return_inverse=True)
+        return labels, len(roots)
+
+    # Vertices on the border loop of the region of faces in the mask
+    # (equivalent of bpy.ops.mesh.region_to_loop + taking the edge vertices)
+    def border_verts(self, face_mask):
+        in_region = np.asarray(face_mask, dtype=bool)[self.loop_face]
+        n_in_region = np.bincount(self.loop_edge[in_region], minlength=self.n_edges)
+        return np.unique(self.edge_verts[n_in_region == 1])
+
+    # Edges on the border loop of the region of faces in the mask
+    def border_edges(self, face_mask):
+        in_region = np.asarray(face_mask, dtype=bool)[self.loop_face]
+        n_in_region = np.bincount(self.loop_edge[in_region], minlength=self.n_edges)
+        return np.nonzero(n_in_region == 1)[0]
+
+    # Boundary loops: cycles of the edges used by only one face, for all holes at once
+    # Every loop is ordered against the direction of its faces, so that a cap with the loop's
+    # vertex order has the same orientation as the mesh
+    # Returns a list of arrays of vertex indexes
+    def boundary_loops(self):
+        bnd = np.nonzero(self.edge_degree[self.loop_edge] == 1)[0]
+
+        # Boundary edges walked backwards: from the end of the face's loop to its start
+        src = self.loop_verts[self.loop_next[bnd]]
+        dst = self.loop_verts[bnd]
+
+        # Boundary edges leaving every vertex
+        out_ptr, out_idx = csr_from_pairs(src, np.arange(len(bnd)), self.n_verts)
+
+        # Follow the edges, each used once; linear in the number of boundary edges
+        # Plain lists, as this walks one edge at a time
+        src, dst, out_ptr, out_idx = src.tolist(), dst.tolist(), out_ptr.tolist(), out_idx.tolist()
+        n_out_used = dict()
+        used = [False]*len(src)
+        loops = []
+        for e_start in range(len(src)):
+            if used[e_start]:
+                continue
+            loop = []
+            e = e_start
+            while True:
+                used[e] = True
+                loop.append(src[e])
+                v = dst[e]
+                if v == src[e_start]:
+                    break
+
+                # Next unused edge leaving v (more than one at a vertex shared by two holes)
+                i_out = out_ptr[v] + n_out_used.get(v, 0)
+                while i_out < out_ptr[v+1] and used[out_idx[i_out]]:
+                    i_out += 1
+                n_out_used[v] = i_out - out_ptr[v]
+                if i_out == out_ptr[v+1]:
+                    break
+                e = out_idx[i_out]
+            loops.append(np.array(loop, dtype=np.int64))
+
+        return loops
+
+# Build the face graph of a Blender mesh (ob.data)
+def face_graph_from_mesh(mesh):
+    n_faces = len(mesh.polygons)
+    n_loops = len(mesh.loops)
+
+    loop_start = np.empty(n_faces, dtype=np.int32)
+    loop_total = np.empty(n_faces, dtype=np.int32)
+    loop_verts = np.empty(n_loops, dtype=np.int32)
+
+    mesh.polygons.foreach_get("loop_start", loop_start)
+    mesh.polygons.foreach_get("loop_total", loop_total)
+    mesh.loops.foreach_get("vertex_index", loop_verts)
+
+    return MN_face_graph(loop_start, loop_total, loop_verts, len(mesh.vertices))
@@ -0,0 +1,269 @@
+import numpy as np
+
+# Tolerance of the triangle-triangle tests, relative to the triangle (barycentric coordinates)
+# Triangles that only touch along an edge or at a vertex do not intersect
+INTERSECT_EPS = 1e-9
+
+# Maximum number of leaf pairs expanded into triangle pairs at once (bounds the memory used)
+LEAF_PAIR_CHUNK = 20000
+
+# Triangulate polygons as fans, given their loops (as in face_graph.MN_face_graph)
+# Returns (triangles as vertex indexes, polygon of every triangle)
+def triangulate_fans(loop_start, loop_total, loop_verts):
+    loop_start = np.asarray(loop_start, dtype=np.int64)
+    loop_total = np.asarray(loop_total, dtype=np.int64)
+    loop_verts = np.asarray(loop_verts, dtype=np.int64)
+
+    n_tris = np.maximum(loop_total - 2, 0)
+    tri_face = np.repeat(np.arange(len(loop_start)), n_tris)
+    i_fan = np.arange(n_tris.sum()) - np.repeat(np.cumsum(n_tris) - n_tris, n_tris)
+    first = loop_start[tri_face]
+    tris = np.stack([loop_verts[first], loop_verts[first + i_fan + 1], loop_verts[first + i_fan + 2]], axis=1)
+    return tris, tri_face
+
+# Tolerance of the coincident faces check, in the units of the coordinates
+COINCIDENT_TOL = 1e-6
+
+# Morton code of points in the unit cube, 10 bits per axis
+def morton_codes(pts):
+    q = np.clip((pts * 1023.0).astype(np.int64), 0, 1023)
+    code = np.zeros(len(pts), dtype=np.int64)
+    for bit in range(10):
+        for axis in range(3):
+            code |= ((q[:,axis] >> bit) & 1) << (3*bit + 2 - axis)
+    return code
+
+# Class for a bounding volume hierarchy of axis aligned bounding boxes over triangles
+# Triangles are sorted along a Morton curve and grouped into leaves of leaf_size consecutive
+# triangles; every level above merges pairs of nodes of the level below, so the whole tree
+# is built with array operations
+class MN_aabb_tree:
+
+    # Init
+    # tri_co = (number of triangles, 3, 3) coordinates
+    def __init__(self, tri_co, leaf_size=8):
+        self.tri_co = np.asarray(tri_co, dtype=np.float64).reshape(-1,3,3)
+        self.leaf_size = leaf_size
+        n_tris = len(self.tri_co)
+
+        self.tri_lo = self.tri_co.min(axis=1)
+        self.tri_hi = self.tri_co.max(axis=1)
+
+        # Sort along the Morton curve
+        if n_tris > 0:
+            ctr = 0.5*(self.tri_lo + self.tri_hi)
+            lo, hi = ctr.min(axis=0), ctr.max(axis=0)
+            self.order = np.argsort(morton_codes((ctr - lo) / np.maximum(hi - lo, 1e-300)), kind='stable')
+        else:
+            self.order = np.zeros(0, dtype=np.int64)
+
+        # Leaves: ranges of leaf_size sorted triangles
+        self.leaf_start = np.arange(0, n_tris, leaf_size)
+        self.leaf_end = np.minimum(self.leaf_start + leaf_size, n_tris)
+
+        # Levels from the leaves up to the root, as (lo, hi) of every node
+        # The children of node i are nodes 2i and 2i+1 of the level below
+        if n_tris > 0:
+            levels = [(np.minimum.reduceat(self.tri_lo[self.order], self.leaf_start, axis=0),
+                np.maximum.reduceat(self.tri_hi[self.order], self.leaf_start, axis=0))]
+        else:
+            levels = [(np.zeros((0,3)), np.zeros((0,3)))]
+        while len(levels[-1][0]) > 1:
+            lo, hi = levels[-1]
+            if len(lo) % 2 == 1:
+                lo, hi = np.append(lo, lo[-1:], axis=0), np.append(hi, hi[-1:], axis=0)
+            levels.append((np.minimum(lo[0::2], lo[1::2]), np.maximum(hi[0::2], hi[1::2])))
+        self.levels = levels[::-1]
+
+    # Depth of the leaf level
+    @property
+    def depth(self):
+        return len(self.levels) - 1
+
+    # Pairs of leaves of this tree and another one whose boxes overlap
+    # other = None: pairs of leaves of this tree itself, with leaf a <= leaf b
+    # Both trees are descended together, breadth first, one level of all node pairs at a time
+    def leaf_pairs(self, other=None):
+        SELF = other == None
+        if SELF:
+            other = self
+        if len(self.leaf_start) == 0 or len(other.leaf_start) == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+        lev_a, lev_b = 0, 0
+        idx_a, idx_b = np.zeros(1, dtype=np.int64), np.zeros(1, dtype=np.int64)
+        while True:
+            # Keep the pairs whose boxes overlap
+            lo_a, hi_a = self.levels[lev_a]
+            lo_b, hi_b = other.levels[lev_b]
+            keep = np.all((lo_a[idx_a] <= hi_b[idx_b]) & (lo_b[idx_b] <= hi_a[idx_a]), axis=1)
+            idx_a, idx_b = idx_a[keep], idx_b[keep]
+
+            down_a = lev_a < self.depth
+            down_b = lev_b < other.depth
+            if not down_a and not down_b:
+                return idx_a, idx_b
+
+            # Replace every node by its children
+            if down_a:
+                lev_a += 1
+                idx_a = np.repeat(2*idx_a, 2) + np.tile([0,1], len(idx_a))
+                idx_b = np.repeat(idx_b, 2)
+            if down_b:
+                lev_b += 1
+                idx_b = np.repeat(2*idx_b, 2) + np.tile([0,1], len(idx_b))
+                idx_a = np.repeat(idx_a, 2)
+            keep = (idx_a < len(self.levels[lev_a][0])) & (idx_b < len(other.levels[lev_b][0]))
+            if SELF:
+                keep &= idx_a <= idx_b
+            idx_a, idx_b = idx_a[keep], idx_b[keep]
+
+    # Pairs of triangles (original indexes) of this tree and another whose boxes overlap, for some leaf pairs
+    def tri_pairs(self, other, leaf_a, leaf_b):
+        n_a = (self.leaf_end - self.leaf_start)[leaf_a]
+        n_b = (other.leaf_end - other.leaf_start)[leaf_b]
+
+        # Every triangle of leaf a with every triangle of leaf b
+        n_pairs = n_a * n_b
+        pair_leaf = np.repeat(np.arange(len(leaf_a)), n_pairs)
+        i_pair = np.arange(n_pairs.sum()) - np.repeat(np.cumsum(n_pairs) - n_pairs, n_pairs)
+        tri_a = self.order[self.leaf_start[leaf_a][pair_leaf] + i_pair // n_b[pair_leaf]]
+        tri_b = other.order[other.leaf_start[leaf_b][pair_leaf] + i_pair % n_b[pair_leaf]]
+
+        keep = np.all((self.tri_lo[tri_a] <= other.tri_hi[tri_b]) & (other.tri_lo[tri_b] <= self.tri_hi[tri_a]), axis=1)
+        return tri_a[keep], tri_b[keep]
+
+# Do segments p0-p1 cross the interior of triangles t (vectorized Moller-Trumbore)
+def segments_cross_triangles(p0, p1, t, eps=INTERSECT_EPS):
+    e1 = t[:,1] - t[:,0]
+    e2 = t[:,2] - t[:,0]
+    d = p1 - p0
+    p = np.cross(d, e2)
+    det = (e1*p).sum(axis=1)
+
+    # Segments parallel to the triangle plane (incl. coplanar) do not cross it
+    scale = np.linalg.norm(e1, axis=1) * np.linalg.norm(e2, axis=1) * np.linalg.norm(d, axis=1)
+    valid = np.abs(det) > eps * scale
+    inv = np.zeros(len(det))
+    inv[valid] = 1.0 / det[valid]
+
+    s = p0 - t[:,0]
+    u = (s*p).sum(axis=1) * inv
+    q = np.cross(s, e1)
+    v = (d*q).sum(axis=1) * inv
+    w = (e2*q).sum(axis=1) * inv
+
+    return valid & (u > eps) & (v > eps) & (u + v < 1.0 - eps) & (w > eps) & (w < 1.0 - eps)
+
+# Do pairs of triangles intersect
+# True if an edge of either triangle crosses the interior of the other
+# Coplanar overlaps are not detected (see check_overlapping_faces for coincident faces)
+def triangles_intersect(t_a, t_b, eps=INTERSECT_EPS):
+    hit = np.zeros(len(t_a), dtype=bool)
+    for i, j in [(0,1),(1,2),(2,0)]:
+        hit |= segments_cross_triangles(t_a[:,i], t_a[:,j], t_b, eps)
+        hit |= segments_cross_triangles(t_b[:,i], t_b[:,j], t_a, eps)
+    return hit
+
+# Do pairs of triangles that share one vertex intersect
+# Away from the shared vertex, they can only cross where the edge opposite of it in one triangle
+# crosses the interior of the other
+# shared_a, shared_b = (number of pairs, 3) masks of the shared vertex in either triangle
+def vertex_neighbors_intersect(t_a, t_b, shared_a, shared_b, eps=INTERSECT_EPS):
+    rows = np.arange(len(t_a))
+    k_a = np.argmax(shared_a, axis=1)
+    k_b = np.argmax(shared_b, axis=1)
+    hit = segments_cross_triangles(t_a[rows,(k_a+1)%3], t_a[rows,(k_a+2)%3], t_b, eps)
+    hit |= segments_cross_triangles(t_b[rows,(k_b+1)%3], t_b[rows,(k_b+2)%3], t_a, eps)
+    return hit
+
+# Find the intersecting pairs of triangles of two meshes, or of one mesh with itself
+# co_a, tris_a = vertex coordinates and triangles (vertex indexes) of the first mesh
+# co_b, tris_b = None: self-intersections of the first mesh; triangles sharing an edge are skipped,
+# triangles sharing one vertex are tested with the edges opposite of it
+# Returns (number of pairs, 2) array of triangle indexes
+def find_intersections(co_a, tris_a, co_b=None, tris_b=None, eps=INTERSECT_EPS, leaf_size=8):
+    SELF = co_b is None
+    co_a = np.asarray(co_a, dtype=np.float64).reshape(-1,3)
+    tris_a = np.asarray(tris_a, dtype=np.int64).reshape(-1,3)
+    tree_a = MN_aabb_tree(co_a[tris_a], leaf_size)
+    if SELF:
+        tris_b = tris_a
+        tree_b = tree_a
+    else:
+        co_b = np.asarray(co_b, dtype=np.float64).reshape(-1,3)
+        tris_b = np.asarray(tris_b, dtype=np.int64).reshape(-1,3)
+        tree_b = MN_aabb_tree(co_b[tris_b], leaf_size)
+
+    # Position of every triangle in the Morton order
+    if SELF:
+        tri_rank = np.empty(len(tris_a), dtype=np.int64)
+        tri_rank[tree_a.order] = np.arange(len(tris_a))
+
+    # Broad phase
+    leaf_a, leaf_b = tree_a.leaf_pairs(None if SELF else tree_b)
+
+    # Narrow phase, in chunks of leaf pairs
+    pairs = [np.zeros((0,2), dtype=np.int64)]
+    for i_st in range(0, len(leaf_a), LEAF_PAIR_CHUNK):
+        tri_a, tri_b = tree_a.tri_pairs(tree_b, leaf_a[i_st:i_st+LEAF_PAIR_CHUNK], leaf_b[i_st:i_st+LEAF_PAIR_CHUNK])
+
+        if SELF:
+            # Every pair once (in Morton order), and not neighbors sharing an edge
+            keep = tri_rank[tri_a] < tri_rank[tri_b]
+            ta, tb = tris_a[tri_a[keep]], tris_a[tri_b[keep]]
+            shared_a = np.any(ta[:,:,None] == tb[:,None,:], axis=2)
+            shared_b = np.any(tb[:,:,None] == ta[:,None,:], axis=2)
+            n_shared = shared_a.sum(axis=1)
+            tri_a, tri_b = tri_a[keep][n_shared < 2], tri_b[keep][n_shared < 2]
+            shared_a, shared_b, n_shared = shared_a[n_shared < 2], shared_b[n_shared < 2], n_shared[n_shared < 2]
+        else:
+            n_shared = np.zeros(len(tri_a), dtype=np.int64)
+
+        t_a, t_b = tree_a.tri_co[tri_a], tree_b.tri_co[tri_b]
+        hit = np.zeros(len(tri_a), dtype=bool)
+        free = n_shared == 0
+        hit[free] = triangles_intersect(t_a[free], t_b[free], eps)
+        if SELF:
+            # Folds at a shared vertex
+            one = n_shared == 1
+            hit[one] = vertex_neighbors_intersect(t_a[one], t_b[one], shared_a[one], shared_b[one], eps)
+        pairs.append(np.stack([tri_a[hit], tri_b[hit]], axis=1))
+
+    pairs = np.concatenate(pairs)
+    if SELF:
+        pairs = np.sort(pairs, axis=1)
+    return pairs[np.lexsort((pairs[:,1], pairs[:,0]))]
+
+# Find coincident faces: faces with the same vertex coordinates (up to tol), in any order or orientation,
+# within and across meshes
+# The center and the sorted vertex coordinates of every face are quantized to a grid of spacing tol,
+# and faces with the same key are coincident
+# Vertices closer than tol that fall in different grid cells are not matched
+# mesh_list = list of (vertex coordinates, loop start and total of every face, vertex of every loop)
+# Returns a list of groups of coincident faces, as (number of faces, 2) arrays of (mesh index, face index)
+def find_coincident_faces(mesh_list, tol=COINCIDENT_TOL):
+    keys = {}
+    for i_mesh, (co, loop_start, loop_total, loop_verts) in enumerate(mesh_list):
+        co = np.asarray(co, dtype=np.float64).reshape(-1,3)
+        loop_start = np.asarray(loop_start, dtype=np.int64)
+        loop_total = np.asarray(loop_total, dtype=np.int64)
+        loop_verts = np.asarray(loop_verts, dtype=np.int64)
+        q_co = np.round(co / tol).astype(np.int64)
+
+        # Faces with the same number of vertices at once
+        for n in np.unique(loop_total).tolist():
+            faces = np.nonzero(loop_total == n)[0]
+            verts = loop_verts[loop_start[faces][:,None] + np.arange(n)]
+
+            # Quantized center, then the quantized vertices in sorted order
+            q_ctr = np.round(co[verts].mean(axis=1) / tol).astype(np.int64)
+            q_verts = q_co[verts]
+            order = np.lexsort((q_verts[:,:,2], q_verts[:,:,1], q_verts[:,:,0]), axis=-1)
+            q_verts = np.take_along_axis(q_verts, order[:,:,None], axis=1)
+            rows = np.ascontiguousarray(np.concatenate([q_ctr, q_verts.reshape(len(faces),-1)], axis=1))
+
+            for f, key in zip(faces.tolist(), rows.view(np.dtype((np.void, rows.dtype.itemsize*rows.shape[1]))).ravel().tolist()):
+                keys.setdefault((n, key), []).append((i_mesh, f))
+
+    return [np.array(group, dtype=np.int64) for group in keys.values() if len(group) > 1]
@@ -0,0 +1,295 @@
+# Headless batch processing of one neuron: SWC + surface mesh -> compartments
+#
+# All stages, in Blender without the UI:
+#   blender --background --python neuron_launcher_batch.py -- --swc cell.swc --mesh cell.obj --out out_dir
+# The mesh may also be an object in a .blend file opened by Blender:
+#   blender cell.blend --background --python neuron_launcher_batch.py -- --swc cell.swc --object cell --out out_dir
+# Stages that do not need Blender, in plain Python:
+#   python neuron_launcher_batch.py --swc cell.swc --out out_dir --stages sections
+
+import argparse
+
+import json
+
+import os
+
+import sys
+
+import time
+
+import importlib
+
+# Blender is optional - without it only the bpy-free stages can run
+try:
+    import bpy
+    HAVE_BPY = True
+except ImportError:
+    HAVE_BPY = False
+
+# Stages in the order they are run
+STAGES_BPY_FREE = ["sections"]
+STAGES_BPY = ["close_caps", "surface_sections", "validate_regions", "compartmentize", "regions_to_compartments"]
+STAGES_ALL = STAGES_BPY_FREE + STAGES_BPY
+
+# Compartmentize methods
+METHODS = ["tet", "cyl", "sc_only"]
+
+# Mesh formats that can be imported, by extension
+MESH_IMPORTERS = {
+    ".obj": lambda fname: bpy.ops.import_scene.obj(filepath=fname),
+    ".ply": lambda fname: bpy.ops.import_mesh.ply(filepath=fname),
+    ".stl": lambda fname: bpy.ops.import_mesh.stl(filepath=fname)
+}
+
+# Directory of this package
+PKG_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Parse the command line
+# Under Blender, only the arguments after "--" are ours
+def parse_args(argv):
+    if "--" in argv:
+        argv = argv[argv.index("--")+1:]
+    elif HAVE_BPY:
+        argv = []
+    else:
+        argv = argv[1:]
+
+    parser = argparse.ArgumentParser(description="Run the Neuron Launcher pipeline on one neuron without the UI.")
+    parser.add_argument("--swc", required=True, help="SWC file of the cable model")
+    parser.add_argument("--mesh", default=None, help="Surface mesh to import (.obj, .ply, .stl)")
+    parser.add_argument("--object", default=None, help="Name of the surface mesh object in the opened .blend file")
+    parser.add_argument("--out", required=True, help="Output directory")
+    parser.add_argument("--name", default=None, help="Base name of the output files (default: name of the SWC file)")
+    parser.add_argument("--method", default="tet", choices=METHODS, help="Compartmentize method")
+    parser.add_argument("--segment-density", type=float, default=1.0, help="Segment density (segments per unit length)")
+    parser.add_argument("--tet-parallel", action="store_true", help="Tetrahedralize every section separately in parallel (tet method)")
+    parser.add_argument("--tet-out-of-process", action="store_true", help="Run TetGen in a separate Python process (tet method)")
+    parser.add_argument("--cache-dir", default=None, help="Cache the outputs of every stage of the tet method here, and resume from them")
+    parser.add_argument("--stages", default=None, help="Comma separated stages to run (default: all available). Options: " + ",".join(STAGES_ALL))
+    parser.add_argument("--no-close-caps", action="store_true", help="Skip closing open caps (the mesh is already closed)")
+    parser.add_argument("--refine-caps", action="store_true", help="Add points inside the closed caps for well shaped faces")
+
+    args = parser.parse_args(argv)
+
+    # Stages
+    if args.stages == None:
+        if HAVE_BPY:
+            args.stages = list(STAGES_ALL)
+        else:
+            args.stages = list(STAGES_BPY_FREE)
+    else:
+        args.stages = [item.strip() for item in args.stages.split(",") if item.strip() != ""]
+        for stage in args.stages:
+            if not stage in STAGES_ALL:
+                parser.error("Unknown stage: " + str(stage))
+    if args.no_close_caps and "close_caps" in args.stages:
+        args.stages.remove("close_caps")
+
+    if not HAVE_BPY:
+        for stage in args.stages:
+            if stage in STAGES_BPY:
+                parser.error("Stage " + str(stage) + " needs Blender: run with blender --background --python")
+
+    if args.name == None:
+        args.name = os.path.splitext(os.path.basename(args.swc))[0]
+
+    return args
+
+# Import a module of this package that does not depend on bpy
+def import_bpy_free(mod_name):
+    if not PKG_DIR in sys.path:
+        sys.path.insert(0, PKG_DIR)
+    return importlib.import_module(mod_name)
+
+# Import this package as the Neuron Launcher add-on, with CellBlender enabled
+def import_addon():
+    import addon_utils
+    addon_utils.enable("cellblender", default_set=True)
+
+    pkg_parent = os.path.dirname(PKG_DIR)
+    if not pkg_parent in sys.path:
+        sys.path.insert(0, pkg_parent)
+    return importlib.import_module(os.path.basename(PKG_DIR))
+
+# Make the given objects the only selected ones, the first one active
+def select_only(context, ob_list):
+    if context.object != None and context.object.mode != 'OBJECT':
+        bpy.ops.object.mode_set(mode='OBJECT')
+    for ob_tmp in bpy.data.objects:
+        ob_tmp.select = False
+    for ob in ob_list:
+        ob.select = True
+    context.scene.objects.active = ob_list[0]
+
+# Get the surface mesh object: import it, or find it in the opened .blend file
+def get_mesh_object(args):
+    if args.mesh != None:
+        ext = os.path.splitext(args.mesh)[1].lower()
+        if not ext in MESH_IMPORTERS:
+            raise SystemError("Unknown mesh format: " + str(ext) + " - use one of: " + ", ".join(sorted(MESH_IMPORTERS.keys())))
+
+        names_before = set(bpy.data.objects.keys())
+        MESH_IMPORTERS[ext](os.path.abspath(args.mesh))
+        ob_list = [bpy.data.objects[name] for name in bpy.data.objects.keys() if not name in names_before and bpy.data.objects[name].type == 'MESH']
+        if len(ob_list) != 1:
+            raise SystemError("The mesh file must contain exactly one mesh object, found: " + str(len(ob_list)))
+        return ob_list[0]
+
+    elif args.object != None:
+        ob = bpy.data.objects.get(args.object)
+        if ob == None or ob.type != 'MESH':
+            raise SystemError("No mesh object named: " + str(args.object))
+        return ob
+
+    else:
+        raise SystemError("Please give a mesh file (--mesh) or an object in the opened .blend file (--object)")
+
+# Stage: write the sections of the SWC file to disk (bpy-free)
+def run_sections(args, summary):
+    swc_morphology = import_bpy_free("swc_morphology")
+    morph = swc_morphology.load_swc(args.swc)
+
+    data = {
+        "swc": os.path.abspath(args.swc),
+        "n_pts": len(morph),
+        "sections": morph.sections().tolist(),
+        "endpoints": morph.endpoints().tolist(),
+        "xyz": morph.xyz.tolist(),
+        "radius": morph.radius.tolist()
+    }
+
+    fname = os.path.join(args.out, args.name + "_sections.json")
+    with open(fname, "w") as f:
+        json.dump(data, f)
+
+    summary["outputs"].append(fname)
+    summary["n_sections"] = len(data["sections"])
+
+# Run all stages that need Blender
+def run_bpy_stages(args, summary, t_stage):
+    nl = import_addon()
+    context = bpy.context
+
+    # CellBlender normally initializes the scene when the UI is drawn
+    if not context.scene.mcell.initialized:
+        bpy.ops.mcell.init_cellblender()
+
+    ob = get_mesh_object(args)
+    print("> Batch: mesh object: " + str(ob.name))
+
+    # Close caps
+    if "close_caps" in args.stages:
+        t_st = time.time()
+        select_only(context, [ob])
+        nl.close_open_caps.f_close_open_caps(context, REFINE=args.refine_caps)
+        ob = bpy.data.objects[ob.name + "_closed"]
+        t_stage("close_caps", t_st)
+
+    # Assign surface sections
+    if "surface_sections" in args.stages:
+        t_st = time.time()
+        select_only(context, [ob])
+        nl.surface_sections.f_surface_sections(context, args.swc)
+        t_stage("surface_sections", t_st)
+
+    # Validate the region assignments
+    if "validate_regions" in args.stages:
+        t_st = time.time()
+        select_only(context, [ob])
+        v = nl.region_validator.region_validator_from_object(ob)
+        report = v.report(nl.swc_morphology.load_swc(args.swc).pt_connect())
+        fname = os.path.join(args.out, args.name + "_region_report.json")
+        nl.region_validator.write_report(report, fname)
+        summary["outputs"].append(fname)
+        summary["regions_ok"] = report["ok"]
+        t_stage("validate_regions", t_st)
+
+    # Compartmentize
+    ob_surf = None
+    ob_seg = None
+    if "compartmentize" in args.stages:
+        t_st = time.time()
+        select_only(context, [ob])
+        if args.method == "tet":
+            nl.compartmentize_tet.f_compartmentize_tet(context, args.swc, args.segment_density, TET_PARALLEL=args.tet_parallel, TET_OUT_OF_PROCESS=args.tet_out_of_process, CACHE_DIR=args.cache_dir)
+            ob_surf = bpy.data.objects.get(ob.name + "_surface")
+            ob_seg = bpy.data.objects.get(ob.name + "_segment")
+        elif args.method == "cyl":
+            nl.compartmentize_cyl.f_compartmentize_cyl(context, args.swc, args.segment_density)
+            ob_surf = bpy.data.objects.get(ob.name + "_Surface")
+            ob_seg = bpy.data.objects.get(ob.name + "_Segment")
+        elif args.method == "sc_only":
+            nl.compartmentize_sc_only.f_compartmentize_sc_only(context, args.swc)
+            ob_surf = bpy.data.objects.get(ob.name + "_Surface")
+            ob_seg = bpy.data.objects.get(ob.name + "_Segment")
+        t_stage("compartmentize", t_st)
+
+    # Regions to compartments
+    if "regions_to_compartments" in args.stages:
+        if ob_surf == None or ob_seg == None:
+            raise SystemError("Regions to compartments needs the surface and segment objects from the compartmentize stage")
+        t_st = time.time()
+        select_only(context, [ob_surf, ob_seg])
+        nl.regions_to_compartments.f_regions_to_compartments(context)
+        t_stage("regions_to_compartments", t_st)
+
+    # Write everything to disk
+    if context.object != None and context.object.mode != 'OBJECT':
+        bpy.ops.object.mode_set(mode='OBJECT')
+    fname = os.path.join(args.out, args.name + ".blend")
+    bpy.ops.wm.save_as_mainfile(filepath=os.path.abspath(fname))
+    summary["outputs"].append(fname)
+
+# Main
+def main(argv):
+    args = parse_args(argv)
+
+    if not os.path.isdir(args.out):
+        os.makedirs(args.out)
+
+    summary = {
+        "name": args.name,
+        "swc": os.path.abspath(args.swc),
+        "method": args.method,
+        "stages": args.stages,
+        "times": {},
+        "outputs": [],
+        "status": "running"
+    }
+
+    # Store the time of a stage
+    def t_stage(stage, t_st):
+        summary["times"][stage] = time.time() - t_st
+        print("> Batch: finished stage: " + stage + ": time: " + str(summary["times"][stage]))
+
+    # Write the summary, also if something failed
+    fname_summary = os.path.join(args.out, args.name + "_summary.json")
+    try:
+        if "sections" in args.stages:
+            t_st = time.time()
+            run_sections(args, summary)
+            t_stage("sections", t_st)
+
+        if len([stage for stage in args.stages if stage in STAGES_BPY]) > 0:
+            run_bpy_stages(args, summary, t_stage)
+
+        summary["status"] = "done"
+    except Exception as e:
+        summary["status"] = "failed"
+        summary["error"] = str(e)
+        raise
+    finally:
+        with open(fname_summary, "w") as f:
+            json.dump(summary, f, indent=2)
+
+    return 0
+
+if __name__ == "__main__":
+    try:
+        ret = main(sys.argv)
+    except Exception as e:
+        print("> Batch: failed: " + str(e))
+        ret = 1
+
+    # Blender does not exit on its own with a non-zero code in background mode
+    sys.exit(ret)
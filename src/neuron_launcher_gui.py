@@ -12,6 +12,9 @@ from . import close_open_caps
 # Assign surface regions to a mesh
 from . import surface_sections
 
+# Validate all region assignments in a single pass
+from . import check_regions
+
 # Check for faces that may border other faces in regions not allowed by the connectivity of the SWC file
 from . import check_connectivity
 
@@ -21,6 +24,15 @@ from . import check_double_assignments
 # Check for unassigned faces
 from . import check_unassigned_faces
 
+# Check for intersecting faces
+from . import check_intersecting_faces
+
+# Check for coincident faces
+from . import check_overlapping_faces
+
+# Memory mapped store of voltage data
+from . import voltage_store
+
 # Color regions randomly
 from . import color_regions
 
@@ -42,6 +54,9 @@ from . import regions_to_compartments
 # Visualize voltage data using the timeline
 from . import timeline_voltage
 
+# Voltages streamed from a running simulation
+from . import voltage_stream
+
 import os
 
 # Register
@@ -106,12 +121,12 @@ class CloseOpenCaps(bpy.types.Operator):
 
     def execute ( self, context ):
         print ( "Execute CloseOpenCaps" )
-        close_open_caps.f_close_open_caps(context)
+        close_open_caps.f_close_open_caps(context, REFINE=context.scene.nrnlauncher.cap_refine)
         return {"FINISHED"}
     
     def invoke ( self, context, event ):
         print ( "Invoke CloseOpenCaps" )
-        close_open_caps.f_close_open_caps(context)
+        close_open_caps.f_close_open_caps(context, REFINE=context.scene.nrnlauncher.cap_refine)
         return {"FINISHED"}
 
 # Class to make surface regions
@@ -145,6 +160,31 @@ class MakeSurfaceRegions(bpy.types.Operator):
 #######################################################
 #######################################################
 
+# Class to run all checks of the region assignments at once
+class ValidateRegions(bpy.types.Operator):
+    bl_idname = "nrnlauncher.validate_regions"
+    bl_label = "Validate surface region assignments"
+
+    def execute ( self, context ):
+        print ( "Execute ValidateRegions" )
+        res = context.scene.nrnlauncher.get_swc_filepath(context)
+        if res[0] == 0:
+            check_regions.f_validate_regions(context, res[1])
+        else:
+            raise SystemError(res[1])
+
+        return {"FINISHED"}
+    
+    def invoke ( self, context, event ):
+        print ( "Invoke ValidateRegions" )
+        res = context.scene.nrnlauncher.get_swc_filepath(context)
+        if res[0] == 0:
+            check_regions.f_validate_regions(context, res[1])
+        else:
+            raise SystemError(res[1])
+
+        return {"FINISHED"}
+
 # Class to check the neighbors of faces against the connections in the cable model
 class CheckConnectivityFacesRegions(bpy.types.Operator):
     bl_idname = "nrnlauncher.check_connectivity"
@@ -215,6 +255,61 @@ class SelectUnassignedLinkedFaces(bpy.types.Operator):
         check_unassigned_faces.f_select_unassigned_linked_faces(context)
         return {"FINISHED"}
 
+# Class to assign all patches of unassigned faces to their bordering regions
+class RepairUnassignedFaces(bpy.types.Operator):
+    bl_idname = "nrnlauncher.repair_unassigned_faces"
+    bl_label = "Repair unassigned faces"
+
+    def execute ( self, context ):
+        print ( "Execute RepairUnassignedFaces" )
+        res = context.scene.nrnlauncher.get_swc_filepath(context)
+        if res[0] == 0:
+            check_unassigned_faces.f_repair_unassigned_faces(context, res[1])
+        else:
+            raise SystemError(res[1])
+
+        return {"FINISHED"}
+    
+    def invoke ( self, context, event ):
+        print ( "Invoke RepairUnassignedFaces" )
+        res = context.scene.nrnlauncher.get_swc_filepath(context)
+        if res[0] == 0:
+            check_unassigned_faces.f_repair_unassigned_faces(context, res[1])
+        else:
+            raise SystemError(res[1])
+
+        return {"FINISHED"}
+
+# Class to check for faces intersecting other faces of the same object, or of a second selected object
+class CheckIntersectingFaces(bpy.types.Operator):
+    bl_idname = "nrnlauncher.check_intersecting_faces"
+    bl_label = "Check for intersecting faces"
+
+    def execute ( self, context ):
+        print ( "Execute CheckIntersectingFaces" )
+        check_intersecting_faces.f_check_intersecting_faces(context)
+        return {"FINISHED"}
+    
+    def invoke ( self, context, event ):
+        print ( "Invoke CheckIntersectingFaces" )
+        check_intersecting_faces.f_check_intersecting_faces(context)
+        return {"FINISHED"}
+
+# Class to check for coincident faces within and across the selected objects
+class CheckOverlappingFaces(bpy.types.Operator):
+    bl_idname = "nrnlauncher.check_overlapping_faces"
+    bl_label = "Check for coincident faces"
+
+    def execute ( self, context ):
+        print ( "Execute CheckOverlappingFaces" )
+        check_overlapping_faces.f_check_overlapping_faces(context)
+        return {"FINISHED"}
+    
+    def invoke ( self, context, event ):
+        print ( "Invoke CheckOverlappingFaces" )
+        check_overlapping_faces.f_check_overlapping_faces(context)
+        return {"FINISHED"}
+
 #######################################################
 #######################################################
 # Visualization of voltages, materials and colors
@@ -236,6 +331,41 @@ def timeline_voltage_handler(scene):
     frame = scene.frame_current
     timeline_voltage.f_timeline_voltage(scene, frame)
 
+# Frame plans hold materials: rebuild them after a file load or an undo
+@persistent
+def timeline_voltage_reset_handler(dummy):
+    timeline_voltage.clear_frame_plans()
+
+# A loaded file may show other voltages: also stop reading ahead and empty the frame cache
+@persistent
+def timeline_voltage_load_handler(dummy):
+    timeline_voltage.clear_frame_plans()
+    voltage_store.prefetcher.cancel()
+    voltage_store.frame_cache.drop()
+    voltage_stream.stop_streams()
+
+# Attach the timeline: frame change handlers, materials (or vertex colors), and the first frame
+def attach_voltage_timeline(context):
+    # Append frame change handler
+    append_function_unique(bpy.app.handlers.frame_change_post, timeline_voltage_handler)
+    append_function_unique(bpy.app.handlers.load_post, timeline_voltage_load_handler)
+    append_function_unique(bpy.app.handlers.undo_post, timeline_voltage_reset_handler)
+    # Delete all other handlers and append
+    # bpy.app.handlers.frame_change_pre.clear()
+    # bpy.app.handlers.frame_change_pre.append(timeline_voltage_handler)
+
+    if context.scene.nrnlauncher.voltage_vertex_colors:
+        color_regions.f_mcell_reg_to_vcol(context)
+    else:
+        color_regions.f_mcell_reg_to_mat(context)
+
+    # Materials were remade: compile the frame plans on the first update
+    timeline_voltage.clear_frame_plans()
+
+    # Trigger a frame update to draw the first time
+    frame = context.scene.frame_current
+    timeline_voltage.f_timeline_voltage(context.scene, frame)
+
 # Class to read voltage data
 class VoltageTimeline(bpy.types.Operator, ImportHelper):
     bl_idname = "nrnlauncher.voltage_timeline"
@@ -258,8 +388,8 @@ class VoltageTimeline(bpy.types.Operator, ImportHelper):
         # Store the voltage directory
         mesh_list = context.scene.nrnlauncher.mesh_obj_list
         if len(mesh_list) > 0:
-            f_list = os.listdir(self.directory)
-            if len(f_list) > 0:
+            f_dict = voltage_store.voltage_files(self.directory)
+            if len(f_dict) > 0:
 
                 # Check if the selected object is already in the list
                 ob = context.scene.objects.active
@@ -271,20 +401,19 @@ class VoltageTimeline(bpy.types.Operator, ImportHelper):
                 context.scene.nrnlauncher.active_object_index = name_list.index(ob.name)
                 ac = context.scene.nrnlauncher.active_object_index                    
                 mesh_list[ac].v_dir = self.directory
-                mesh_list[ac].v_zero_pad = len(f_list[0])-6
-                mesh_list[ac].v_n_files = len(f_list)
-
-        # Append frame change handler
-        append_function_unique(bpy.app.handlers.frame_change_post, timeline_voltage_handler)
-        # Delete all other handlers and append
-        # bpy.app.handlers.frame_change_pre.clear()
-        # bpy.app.handlers.frame_change_pre.append(timeline_voltage_handler)
+                mesh_list[ac].v_zero_pad = len(os.path.basename(f_dict[min(f_dict.keys())]))-6
+                mesh_list[ac].v_n_files = len(f_dict)
 
-        color_regions.f_mcell_reg_to_mat(context)
+                # Pack the voltage files into a memory mapped store, once
+                # A directory that can't be written to (e.g. shared simulation output) is read from the text files
+                if voltage_store.store_is_stale(self.directory):
+                    try:
+                        voltage_store.convert_voltage_dir(self.directory)
+                    except OSError as e:
+                        print("Could not write the voltage store - reading the text files: " + str(e))
+                voltage_store.frame_cache.drop(self.directory)
 
-        # Trigger a frame update to draw the first time
-        frame = context.scene.frame_current
-        timeline_voltage.f_timeline_voltage(context.scene, frame)
+        attach_voltage_timeline(context)
 
         return {"FINISHED"}
     
@@ -294,6 +423,46 @@ class VoltageTimeline(bpy.types.Operator, ImportHelper):
 
         return {'RUNNING_MODAL'}
 
+# Class to show voltages streamed from a running simulation
+class StreamVoltageTimeline(bpy.types.Operator):
+    bl_idname = "nrnlauncher.stream_voltage_timeline"
+    bl_label = "Stream voltage data for timeline"
+
+    def execute ( self, context ):
+        print ( "Execute StreamVoltageTimeline" )
+
+        # Check if the selected object is already in the list
+        ob = context.scene.objects.active
+        if ob == None:
+            self.report({'WARNING'}, "Please select an object")
+            return {"CANCELLED"}
+        name_list = [item.name for item in context.scene.nrnlauncher.mesh_obj_list]
+        if not ob.name in name_list:
+            context.scene.nrnlauncher.add_mesh_object(context)
+            name_list = [item.name for item in context.scene.nrnlauncher.mesh_obj_list]
+
+        # Listen on the address
+        address = context.scene.nrnlauncher.stream_address
+        try:
+            voltage_stream.start_stream(address)
+        except (OSError, ValueError) as e:
+            self.report({'ERROR'}, "Cannot listen on " + address + ": " + str(e))
+            return {"CANCELLED"}
+
+        context.scene.nrnlauncher.active_object_index = name_list.index(ob.name)
+        ac = context.scene.nrnlauncher.active_object_index
+        mesh_obj = context.scene.nrnlauncher.mesh_obj_list[ac]
+        mesh_obj.v_dir = voltage_stream.STREAM_PREFIX + address
+        mesh_obj.v_n_files = 0
+
+        attach_voltage_timeline(context)
+
+        return {"FINISHED"}
+
+    def invoke ( self, context, event ):
+        print ( "Invoke StreamVoltageTimeline" )
+        return self.execute(context)
+
 # Class to make a material for each MCell region
 class MCellRegionsToMaterials(bpy.types.Operator):
     bl_idname = "nrnlauncher.mcell_regions_to_materials"
@@ -339,7 +508,7 @@ class CompartmentizeTet(bpy.types.Operator):
         print ( "Execute CompartmentizeTet" )
         res = context.scene.nrnlauncher.get_swc_filepath(context)
         if res[0] == 0:
-            compartmentize_tet.f_compartmentize_tet(context, res[1], context.scene.nrnlauncher.segment_density)
+            compartmentize_tet.f_compartmentize_tet(context, res[1], context.scene.nrnlauncher.segment_density, TET_PARALLEL=context.scene.nrnlauncher.tet_parallel, CACHE_DIR=bpy.path.abspath(context.scene.nrnlauncher.cache_dir))
         else:
             raise SystemError(res[1])
 
@@ -349,7 +518,7 @@ class CompartmentizeTet(bpy.types.Operator):
         print ( "Invoke CompartmentizeTet" )
         res = context.scene.nrnlauncher.get_swc_filepath(context)
         if res[0] == 0:
-            compartmentize_tet.f_compartmentize_tet(context, res[1], context.scene.nrnlauncher.segment_density)
+            compartmentize_tet.f_compartmentize_tet(context, res[1], context.scene.nrnlauncher.segment_density, TET_PARALLEL=context.scene.nrnlauncher.tet_parallel, CACHE_DIR=bpy.path.abspath(context.scene.nrnlauncher.cache_dir))
         else:
             raise SystemError(res[1])        
 
@@ -523,12 +692,27 @@ class NeuronLauncherPropGroup(bpy.types.PropertyGroup):
     mesh_obj_list = CollectionProperty(type=NeuronLauncherMeshObject, name="Mesh List")
     active_object_index = IntProperty(name="Active Object Index", default=0)
 
+    # Refine the triangulation of closed caps
+    cap_refine = BoolProperty( default=False, description="Add points inside the caps for well shaped faces")
+
+    # Address (host:port) to listen on for voltages streamed from a running simulation
+    stream_address = StringProperty( default="127.0.0.1:5555", description="Address (host:port) to listen on for voltages streamed from a running simulation")
+
+    # Color the voltages through one material and a vertex color layer, instead of a material per region
+    voltage_vertex_colors = BoolProperty( default=False, description="Color the voltages through one shared material and a vertex color layer, instead of one material per region")
+
     # The explode factor
     explode_factor = FloatProperty ( default=1.0, precision=2, description="Explode scale factor")
 
     # The density of segments to create
     segment_density = FloatProperty( default=1.0, precision=2, description="Segment density")
 
+    # Tetrahedralize every section separately in parallel
+    tet_parallel = BoolProperty( default=False, description="Tetrahedralize each section separately, in parallel processes")
+
+    # Directory for caching the outputs of the stages of compartmentizing, empty = no cache
+    cache_dir = StringProperty( default="", subtype='DIR_PATH', description="Cache the outputs of every stage here, so that reruns resume from the first changed stage. Leave empty to not cache")
+
     # Booleans for showing things
     show_swc_files = BoolProperty( default = False )
     show_surf_mesh_tools = BoolProperty( default = False )
@@ -596,6 +780,7 @@ class NeuronLauncherPropGroup(bpy.types.PropertyGroup):
             col = split.column(align=True)
             col.label("Close open caps on the mesh")
             col.operator("nrnlauncher.close_open_caps")
+            col.prop(self, "cap_refine", text="Refine caps")
                    
             row = box.row()
             split = box.split()
@@ -607,10 +792,19 @@ class NeuronLauncherPropGroup(bpy.types.PropertyGroup):
             split = box.split()
             col = split.column(align=True)
             col.label("Check surface region assignments")
+            col.operator("nrnlauncher.validate_regions")
             col.operator("nrnlauncher.check_connectivity")
             col.operator("nrnlauncher.check_double_assignments")
             col.operator("nrnlauncher.check_unassigned_faces")
             col.operator("nrnlauncher.select_unassigned_linked_faces")
+            col.operator("nrnlauncher.repair_unassigned_faces")
+
+            row = box.row()
+            split = box.split()
+            col = split.column(align=True)
+            col.label("Check the surface mesh")
+            col.operator("nrnlauncher.check_intersecting_faces")
+            col.operator("nrnlauncher.check_overlapping_faces")
 
         ###
         # Tools to divide a surface mesh into compartments
@@ -637,6 +831,8 @@ class NeuronLauncherPropGroup(bpy.types.PropertyGroup):
             col.label("Create section and segment compartments")
             col.label("Method: tetrahedralization of the volume (SLOW)")
             col.operator("nrnlauncher.compartmentize_tet")
+            col.prop(self, "tet_parallel", text="Tetrahedralize sections in parallel")
+            col.prop(self, "cache_dir", text="Cache")
             col.label("Method: cylinder segmentation (FAST)")
             col.operator("nrnlauncher.compartmentize_cyl")
 
@@ -677,6 +873,11 @@ class NeuronLauncherPropGroup(bpy.types.PropertyGroup):
 
             row = box.row()
             row.operator("nrnlauncher.voltage_timeline")
+            row = box.row()
+            row.operator("nrnlauncher.stream_voltage_timeline")
+            row.prop(self, "stream_address", text="")
+            row = box.row()
+            row.prop(self, "voltage_vertex_colors", text="Vertex colors (one material)")
 
             row = box.row()
             row.label("Materials and Colors", icon='COLOR')
@@ -0,0 +1,259 @@
+# Batch processing of many neurons in parallel
+# Every neuron (SWC + surface mesh) is an independent job running neuron_launcher_batch.py
+# in its own Blender process; jobs are distributed over a pool of worker threads, each only
+# waiting on the process of its job
+#
+#   python neuron_launcher_pool.py --swc-dir swc/ --mesh-dir meshes/ --out out_dir -- --method tet
+#   python neuron_launcher_pool.py --jobs jobs.json --out out_dir --workers 16 --timeout 7200
+#
+# jobs.json is a list of {"name": ..., "swc": ..., "mesh": ...}
+# Arguments after "--" are passed on to neuron_launcher_batch.py for every job
+# Progress is stored in <out_dir>/manifest.json - rerunning the same command resumes,
+# skipping the jobs that are done
+
+import argparse
+
+import concurrent.futures
+
+import json
+
+import os
+
+import subprocess
+
+import sys
+
+import time
+
+# The single-neuron batch script
+BATCH_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "neuron_launcher_batch.py")
+
+# Stages that can be run without Blender
+STAGES_BPY_FREE = ["sections"]
+
+# Mesh file extensions to look for
+MESH_EXTS = [".obj", ".ply", ".stl"]
+
+# Parse the command line
+def parse_args(argv):
+    batch_args = []
+    if "--" in argv:
+        batch_args = argv[argv.index("--")+1:]
+        argv = argv[:argv.index("--")]
+
+    parser = argparse.ArgumentParser(description="Run the Neuron Launcher pipeline on many neurons in parallel.")
+    parser.add_argument("--jobs", default=None, help="JSON file with a list of jobs: {\"name\", \"swc\", \"mesh\"}")
+    parser.add_argument("--swc-dir", default=None, help="Directory of SWC files; meshes are matched by name")
+    parser.add_argument("--mesh-dir", default=None, help="Directory of mesh files (default: same as --swc-dir)")
+    parser.add_argument("--out", required=True, help="Output directory; every job writes to a subdirectory")
+    parser.add_argument("--blender", default="blender", help="Blender executable")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Number of jobs to run at the same time")
+    parser.add_argument("--timeout", type=float, default=None, help="Time limit per job in seconds")
+    parser.add_argument("--retries", type=int, default=1, help="Number of times to retry a failed job")
+    parser.add_argument("--redo-failed", action="store_true", help="Also rerun jobs that failed in a previous run")
+
+    args = parser.parse_args(argv[1:])
+    args.batch_args = batch_args
+
+    if args.jobs == None and args.swc_dir == None:
+        parser.error("Please give a jobs file (--jobs) or a directory of SWC files (--swc-dir)")
+    if args.workers < 1:
+        parser.error("Number of workers must be at least 1")
+
+    return args
+
+# Make the list of jobs
+def get_jobs(args):
+    if args.jobs != None:
+        with open(args.jobs) as f:
+            job_list = json.load(f)
+        for job in job_list:
+            if not "name" in job:
+                job["name"] = os.path.splitext(os.path.basename(job["swc"]))[0]
+        return job_list
+
+    # Pair up SWC files and meshes by name
+    mesh_dir = args.mesh_dir if args.mesh_dir != None else args.swc_dir
+    mesh_dict = {}
+    for fname in sorted(os.listdir(mesh_dir)):
+        name, ext = os.path.splitext(fname)
+        if ext.lower() in MESH_EXTS and not name in mesh_dict:
+            mesh_dict[name] = os.path.join(mesh_dir, fname)
+
+    job_list = []
+    for fname in sorted(os.listdir(args.swc_dir)):
+        name, ext = os.path.splitext(fname)
+        if ext.lower() == ".swc":
+            job = {"name": name, "swc": os.path.join(args.swc_dir, fname)}
+            if name in mesh_dict:
+                job["mesh"] = mesh_dict[name]
+            elif not is_bpy_free(args.batch_args):
+                print("> Pool: no mesh for: " + str(name))
+            job_list.append(job)
+
+    return job_list
+
+# Do the batch arguments only ask for stages that don't need Blender?
+def is_bpy_free(batch_args):
+    if not "--stages" in batch_args:
+        return False
+    i = batch_args.index("--stages")
+    stages = batch_args[i+1].split(",") if i+1 < len(batch_args) else []
+    return len(stages) > 0 and all([stage.strip() in STAGES_BPY_FREE for stage in stages])
+
+# Command line for one job
+def job_command(job, out_dir, blender, batch_args):
+    args = ["--swc", os.path.abspath(job["swc"]), "--out", out_dir, "--name", job["name"]]
+    if "mesh" in job:
+        args += ["--mesh", os.path.abspath(job["mesh"])]
+    args += batch_args
+
+    if is_bpy_free(batch_args):
+        return [sys.executable, BATCH_SCRIPT] + args
+    else:
+        return [blender, "--background", "--python", BATCH_SCRIPT, "--"] + args
+
+# Run one job, waiting on its process in a worker thread
+# Returns a dict with the result; never raises, so that one job can't take down the pool
+def run_job(job, out_dir, cmd, timeout):
+    t_st = time.time()
+    result = {"name": job["name"], "cmd": cmd}
+
+    try:
+        if not os.path.isdir(out_dir):
+            os.makedirs(out_dir)
+
+        # Don't pick up the summary of an earlier attempt
+        fname_summary = os.path.join(out_dir, job["name"] + "_summary.json")
+        if os.path.isfile(fname_summary):
+            os.remove(fname_summary)
+
+        with open(os.path.join(out_dir, job["name"] + ".log"), "w") as f_log:
+            try:
+                proc = subprocess.run(cmd, stdout=f_log, stderr=subprocess.STDOUT, timeout=timeout)
+                result["status"] = "done" if proc.returncode == 0 else "failed"
+                result["returncode"] = proc.returncode
+            except subprocess.TimeoutExpired:
+                result["status"] = "timeout"
+
+        # Per stage times from the batch script
+        if os.path.isfile(fname_summary):
+            try:
+                with open(fname_summary) as f:
+                    summary = json.load(f)
+                result["stage_times"] = summary.get("times", {})
+                if "error" in summary:
+                    result["error"] = summary["error"]
+            except ValueError:
+                pass
+
+    except Exception as e:
+        result["status"] = "failed"
+        result["error"] = str(e)
+
+    result["time"] = time.time() - t_st
+
+    return result
+
+# Load the manifest of a previous run
+def load_manifest(fname):
+    if os.path.isfile(fname):
+        with open(fname) as f:
+            return json.load(f)
+    return {"jobs": {}}
+
+# Write the manifest, without ever leaving a half written file
+def write_manifest(fname, manifest):
+    fname_tmp = fname + ".tmp"
+    with open(fname_tmp, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(fname_tmp, fname)
+
+# Print the aggregated timing of the jobs run this time
+def print_timing(manifest, run_names, t_wall):
+    done = [manifest["jobs"][name] for name in run_names if manifest["jobs"][name]["status"] == "done"]
+    not_done = [item for item in manifest["jobs"].values() if item["status"] != "done"]
+
+    print("> Pool: finished: " + str(len(done)) + " done, " + str(len(not_done)) + " not done")
+    print("> Pool: done in previous runs: " + str(len(manifest["jobs"]) - len(not_done) - len(done)))
+    print("> Pool: wall time: " + str(t_wall))
+
+    if len(done) > 0:
+        t_jobs = [item["time"] for item in done]
+        print("> Pool: job time: total: " + str(sum(t_jobs)) + " mean: " + str(sum(t_jobs)/len(t_jobs)) + " max: " + str(max(t_jobs)))
+        if t_wall > 0:
+            print("> Pool: throughput: " + str(3600.0*len(done)/t_wall) + " neurons per hour")
+
+        stage_times = {}
+        for item in done:
+            for stage, t in item.get("stage_times", {}).items():
+                stage_times[stage] = stage_times.get(stage, 0.0) + t
+        for stage, t in stage_times.items():
+            print("> Pool: stage: " + stage + ": total time: " + str(t))
+
+    for item in not_done:
+        print("> Pool: " + item["status"] + ": " + item["name"] + " (see " + item["log"] + ")")
+
+# Main
+def main(argv):
+    args = parse_args(argv)
+
+    if not os.path.isdir(args.out):
+        os.makedirs(args.out)
+
+    fname_manifest = os.path.join(args.out, "manifest.json")
+    manifest = load_manifest(fname_manifest)
+
+    # Jobs still to do
+    job_todo = []
+    for job in get_jobs(args):
+        prev = manifest["jobs"].get(job["name"])
+        if prev != None and (prev["status"] == "done" or (prev["status"] != "pending" and not args.redo_failed)):
+            continue
+        job_todo.append(job)
+        manifest["jobs"][job["name"]] = {"name": job["name"], "status": "pending", "attempts": 0, "log": os.path.join(args.out, job["name"], job["name"] + ".log")}
+
+    print("> Pool: jobs to run: " + str(len(job_todo)) + " on " + str(args.workers) + " workers")
+    write_manifest(fname_manifest, manifest)
+
+    t_st = time.time()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=args.workers) as executor:
+
+        # Submit a job
+        def submit(job):
+            out_dir = os.path.join(args.out, job["name"])
+            cmd = job_command(job, out_dir, args.blender, args.batch_args)
+            manifest["jobs"][job["name"]]["attempts"] += 1
+            return executor.submit(run_job, job, out_dir, cmd, args.timeout)
+
+        future_dict = {}
+        for job in job_todo:
+            future_dict[submit(job)] = job
+
+        while len(future_dict) > 0:
+            done_set, _ = concurrent.futures.wait(list(future_dict.keys()), return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done_set:
+                job = future_dict.pop(future)
+                # The entry is made from this attempt only, so nothing of a failed attempt before it
+                # (error, returncode, ...) is kept
+                prev = manifest["jobs"][job["name"]]
+                entry = {"name": prev["name"], "attempts": prev["attempts"], "log": prev["log"]}
+                entry.update(future.result())
+                manifest["jobs"][job["name"]] = entry
+
+                print("> Pool: " + entry["status"] + ": " + job["name"] + ": time: " + str(entry["time"]))
+
+                # Retry
+                if entry["status"] != "done" and entry["attempts"] <= args.retries:
+                    print("> Pool: retrying: " + job["name"])
+                    future_dict[submit(job)] = job
+
+            write_manifest(fname_manifest, manifest)
+
+    print_timing(manifest, [job["name"] for job in job_todo], time.time() - t_st)
+
+    n_not_done = len([item for item in manifest["jobs"].values() if item["status"] != "done"])
+    return 0 if n_not_done == 0 else 1
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
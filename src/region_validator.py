@@ -0,0 +1,240 @@
+import numpy as np
+
+import json
+
+# Face adjacency of the mesh
+from . import face_graph
+
+# Name of the region of the section between two SWC points
+def sc_name(pt1, pt2):
+    return "sc_%02d_%02d" % (min(pt1,pt2), max(pt1,pt2))
+
+# SWC points of a section region name, or None if the name is not a section
+def sc_pts(name):
+    if len(name) == 8 and name[0:3] == 'sc_':
+        try:
+            return (int(name[3:5]), int(name[6:8]))
+        except ValueError:
+            return None
+    return None
+
+# Section regions allowed to border a section region: all sections sharing an end point
+# pt_connect = list of connected 1-based points of every point
+def allowed_neighbors(name, pt_connect):
+    allowed = []
+    for i_pt in sc_pts(name):
+        if i_pt-1 >= len(pt_connect):
+            continue
+        for j_pt in pt_connect[i_pt-1]:
+            allowed_name = sc_name(i_pt, j_pt)
+            if i_pt != j_pt and allowed_name != name and not allowed_name in allowed:
+                allowed.append(allowed_name)
+    return allowed
+
+# Class for checking the assignment of the faces of a mesh to regions, in a single pass
+# Independent of Blender: built from the face graph of the mesh and the face list of every region
+class MN_region_validator:
+
+    # Init
+    # graph = MN_face_graph of the mesh
+    # reg_names = names of the regions
+    # reg_faces_list = face indexes of every region
+    def __init__(self, graph, reg_names, reg_faces_list):
+        self.graph = graph
+        self.reg_names = list(reg_names)
+        n_faces = graph.n_faces
+        n_regs = len(self.reg_names)
+
+        # Face -> regions it is assigned to, as CSR
+        reg_faces_list = [np.asarray(list(f_list), dtype=np.int64).reshape(-1) for f_list in reg_faces_list]
+        pair_face = np.concatenate(reg_faces_list + [np.zeros(0, dtype=np.int64)])
+        pair_reg = np.repeat(np.arange(n_regs), [len(f_list) for f_list in reg_faces_list])
+        self.face_reg_ptr, self.face_reg_idx = face_graph.csr_from_pairs(pair_face, pair_reg, n_faces)
+        self.face_n_regs = np.diff(self.face_reg_ptr)
+
+        # Region label of every face: -1 = unassigned, -2 = assigned more than once
+        self.face_label = np.full(n_faces, -1, dtype=np.int64)
+        single = self.face_n_regs == 1
+        self.face_label[single] = self.face_reg_idx[self.face_reg_ptr[:-1][single]]
+        self.face_label[self.face_n_regs > 1] = -2
+
+        # Region adjacency: pairs of regions of faces sharing an edge
+        # Every loop is paired with the other faces of its edge, then both faces with all their regions
+        g = graph
+        src = np.repeat(g.loop_face, g.edge_degree[g.loop_edge])
+        dst = face_graph.csr_gather(g.edge_face_ptr, g.edge_face_idx, g.loop_edge)
+        edge = np.repeat(g.loop_edge, g.edge_degree[g.loop_edge])
+        keep = src != dst
+        src, dst, edge = src[keep], dst[keep], edge[keep]
+
+        n_src = self.face_n_regs[src]
+        reg_src = face_graph.csr_gather(self.face_reg_ptr, self.face_reg_idx, src)
+        dst, edge = np.repeat(dst, n_src), np.repeat(edge, n_src)
+        n_dst = self.face_n_regs[dst]
+        reg_src = np.repeat(reg_src, n_dst)
+        reg_dst = face_graph.csr_gather(self.face_reg_ptr, self.face_reg_idx, dst)
+        edge = np.repeat(edge, n_dst)
+
+        keep = reg_src != reg_dst
+        reg_src, reg_dst, edge = reg_src[keep], reg_dst[keep], edge[keep]
+
+        # Number of edges shared by every pair of bordering regions
+        reg_edge_keys = np.unique((np.minimum(reg_src,reg_dst)*n_regs + np.maximum(reg_src,reg_dst))*max(g.n_edges,1) + edge)
+        reg_keys, self.reg_pair_n_edges = np.unique(reg_edge_keys // max(g.n_edges,1), return_counts=True)
+        self.reg_pairs = np.stack([reg_keys // max(n_regs,1), reg_keys % max(n_regs,1)], axis=1)
+
+    # Faces assigned to more than one region
+    def double_faces(self):
+        return np.nonzero(self.face_n_regs > 1)[0]
+
+    # Faces not assigned to any region
+    def unassigned_faces(self):
+        return np.nonzero(self.face_n_regs == 0)[0]
+
+    # Names of the regions a face is assigned to
+    def face_reg_names(self, f):
+        return [self.reg_names[r] for r in self.face_reg_idx[self.face_reg_ptr[f]:self.face_reg_ptr[f+1]]]
+
+    # Dictionary of region name -> names of the regions it borders
+    def adjacency(self):
+        adj_dict = dict([(name, []) for name in self.reg_names])
+        for r0, r1 in self.reg_pairs.tolist():
+            adj_dict[self.reg_names[r0]].append(self.reg_names[r1])
+            adj_dict[self.reg_names[r1]].append(self.reg_names[r0])
+        return adj_dict
+
+    # Faces of region r0 that share an edge with a face of region r1
+    def border_faces(self, r0, r1):
+        in_r1 = np.zeros(self.graph.n_faces, dtype=bool)
+        in_r1[self.reg_faces(r1)] = True
+        faces = self.reg_faces(r0)
+        if len(faces) == 0:
+            return faces
+        nghbrs = self.graph.neighbors(faces, face_step=False)
+        counts = np.diff(self.graph.face_face_ptr)[faces]
+        src = np.repeat(faces, counts)
+        return np.unique(src[in_r1[nghbrs]])
+
+    # Faces of a region
+    def reg_faces(self, r):
+        entry_face = np.repeat(np.arange(self.graph.n_faces), self.face_n_regs)
+        return entry_face[self.face_reg_idx == r]
+
+    # Check the region borders against the connectivity of the SWC file
+    # pt_connect = list of connected 1-based points of every point
+    # Returns (illegal, missing): lists of (region name, other region name)
+    # Only section regions (sc_XX_YY) are checked
+    def check_connectivity(self, pt_connect):
+        adj_dict = self.adjacency()
+
+        illegal = []
+        missing = []
+        for name in self.reg_names:
+            if sc_pts(name) == None:
+                continue
+            allowed = allowed_neighbors(name, pt_connect)
+
+            for other in adj_dict[name]:
+                if sc_pts(other) != None and not other in allowed:
+                    illegal.append((name, other))
+            for other in allowed:
+                if not other in adj_dict[name]:
+                    missing.append((name, other))
+
+        return illegal, missing
+
+    # Patches of unassigned faces: connected components of the unassigned faces
+    # Returns (patch label of every face, -1 if assigned, number of patches)
+    def unassigned_patches(self):
+        return self.graph.label_components(self.face_n_regs == 0)
+
+    # Find the section region to assign every patch of unassigned faces to
+    # Each patch goes to the bordering section region it shares the most edges with, as long as
+    # all other section regions bordering the patch are allowed neighbors of it in the SWC file
+    # Faces assigned to more than one region are not counted as borders
+    # pt_connect = None: the connectivity is not checked
+    # Returns a list of one dictionary for every patch:
+    # "faces": faces of the patch, "region": index of the region or None if unresolved,
+    # "n_edges": edges shared with the region, "borders": dictionary of bordering region index -> shared edges
+    def repair_unassigned(self, pt_connect=None):
+        patch_label, n_patches = self.unassigned_patches()
+        n_regs = len(self.reg_names)
+        g = self.graph
+
+        # Loops of patch faces paired with the assigned faces across their edge
+        src = np.repeat(g.loop_face, g.edge_degree[g.loop_edge])
+        dst = face_graph.csr_gather(g.edge_face_ptr, g.edge_face_idx, g.loop_edge)
+        edge = np.repeat(g.loop_edge, g.edge_degree[g.loop_edge])
+        keep = (patch_label[src] >= 0) & (self.face_label[dst] >= 0)
+        patch, reg, edge = patch_label[src][keep], self.face_label[dst][keep], edge[keep]
+
+        # Number of edges shared by every patch and region
+        n_e = max(g.n_edges,1)
+        keys, n_edges = np.unique(np.unique((patch*n_regs + reg)*n_e + edge) // n_e, return_counts=True)
+        borders = [dict() for i in range(n_patches)]
+        for key, n in zip(keys.tolist(), n_edges.tolist()):
+            borders[key // n_regs][key % n_regs] = n
+
+        # Faces of every patch
+        order = np.argsort(patch_label, kind='stable')
+        patch_ptr = np.searchsorted(patch_label[order], np.arange(n_patches+1))
+
+        patches = []
+        for i_patch in range(n_patches):
+            brdr = borders[i_patch]
+            sc_brdr = [r for r in brdr if sc_pts(self.reg_names[r]) != None]
+
+            # Candidates by decreasing shared border
+            region = None
+            for r in sorted(sc_brdr, key=lambda r: -brdr[r]):
+                if pt_connect != None:
+                    allowed = allowed_neighbors(self.reg_names[r], pt_connect)
+                    if any([other != r and not self.reg_names[other] in allowed for other in sc_brdr]):
+                        continue
+                region = r
+                break
+
+            patches.append({
+                "faces": order[patch_ptr[i_patch]:patch_ptr[i_patch+1]],
+                "region": region,
+                "n_edges": brdr[region] if region != None else 0,
+                "borders": brdr
+                })
+
+        return patches
+
+    # Machine readable report of all checks
+    # pt_connect = None: skip the SWC connectivity check
+    def report(self, pt_connect=None):
+        reg_idx = dict([(name, i) for i, name in enumerate(self.reg_names)])
+        pair_n_edges = dict([(tuple(pair), n) for pair, n in zip(self.reg_pairs.tolist(), self.reg_pair_n_edges.tolist())])
+
+        report = {
+            "n_faces": int(self.graph.n_faces),
+            "n_regions": len(self.reg_names),
+            "double_faces": [{"face": int(f), "regions": self.face_reg_names(f)} for f in self.double_faces().tolist()],
+            "unassigned_faces": self.unassigned_faces().tolist(),
+            "adjacency": self.adjacency(),
+            "borders": [{"regions": [self.reg_names[r0], self.reg_names[r1]], "n_edges": n} for (r0, r1), n in sorted(pair_n_edges.items())]
+        }
+
+        if pt_connect != None:
+            illegal, missing = self.check_connectivity(pt_connect)
+            report["illegal_borders"] = [{"region": name, "other": other, "n_edges": pair_n_edges[tuple(sorted([reg_idx[name], reg_idx[other]]))]} for name, other in illegal]
+            report["missing_borders"] = [{"region": name, "other": other, "other_exists": other in reg_idx} for name, other in missing]
+
+        # As with the old connectivity check, missing borders (only a warning) also make it not OK
+        report["ok"] = len(report["double_faces"]) == 0 and len(report["unassigned_faces"]) == 0 and len(report.get("illegal_borders", [])) == 0 and len(report.get("missing_borders", [])) == 0
+
+        return report
+
+# Build the validator of a Blender mesh object with MCell regions
+def region_validator_from_object(ob):
+    reg_list = ob.mcell.regions.region_list
+    graph = face_graph.face_graph_from_mesh(ob.data)
+    return MN_region_validator(graph, [reg.name for reg in reg_list], [reg.get_region_faces(ob.data) for reg in reg_list])
+
+# Write a report as JSON
+def write_report(report, fname):
+    with open(fname, "w") as f:
+        json.dump(report, f, indent=2)
@@ -13,6 +13,135 @@ import os
 # To add objects to MCell
 from cellblender.cellblender_utils import preserve_selection_use_operator
 
+import numpy as np
+
+# Face -> region index
+from . import face_graph
+
+# Class for the arrays of a mesh object needed to assemble compartments, read once
+class MN_compartment_source:
+
+	# Init
+	def __init__(self, ob):
+		mesh = ob.data
+		n_faces = len(mesh.polygons)
+
+		loop_start = np.empty(n_faces, dtype=np.int32)
+		loop_total = np.empty(n_faces, dtype=np.int32)
+		loop_verts = np.empty(len(mesh.loops), dtype=np.int32)
+		co = np.empty(3*len(mesh.vertices), dtype=np.float32)
+		self.face_mat = np.empty(n_faces, dtype=np.int32)
+
+		mesh.polygons.foreach_get("loop_start", loop_start)
+		mesh.polygons.foreach_get("loop_total", loop_total)
+		mesh.loops.foreach_get("vertex_index", loop_verts)
+		mesh.vertices.foreach_get("co", co)
+		mesh.polygons.foreach_get("material_index", self.face_mat)
+
+		self.ob = ob
+		self.n_faces = n_faces
+		self.face_vert_ptr = np.zeros(n_faces+1, dtype=np.int64)
+		np.cumsum(loop_total, out=self.face_vert_ptr[1:])
+		self.face_vert_idx = loop_verts[face_graph.face_loops(loop_start.astype(np.int64), loop_total.astype(np.int64))].astype(np.int64)
+		self.co = co.reshape(-1,3)
+
+		# Materials of the slots
+		self.mats = [slot.material for slot in ob.material_slots]
+
+		# Faces of every region, fetched once
+		self.reg_names = [reg.name for reg in ob.mcell.regions.region_list]
+		self.reg_faces = [np.array(list(reg.get_region_faces(mesh)), dtype=np.int64) for reg in ob.mcell.regions.region_list]
+
+		# Face -> regions, as CSR
+		pair_face = np.concatenate(self.reg_faces + [np.zeros(0, dtype=np.int64)])
+		pair_reg = np.repeat(np.arange(len(self.reg_faces)), [len(f_list) for f_list in self.reg_faces])
+		self.face_reg_ptr, self.face_reg_idx = face_graph.csr_from_pairs(pair_face, pair_reg, n_faces)
+
+	# Vertices of faces, as lists
+	def face_verts(self, faces):
+		return [self.face_vert_idx[self.face_vert_ptr[f]:self.face_vert_ptr[f+1]].tolist() for f in faces.tolist()]
+
+# Compartment id from (part of) the name of a region
+# i_st = index of the name in the region name
+# SEGMENTS = False: sections only (sc_##_##), otherwise with segments (sc_##_##_sg_##)
+def comp_id_from_name(name, i_st, SEGMENTS):
+	if SEGMENTS:
+		return (int(name[i_st+3:i_st+5]),int(name[i_st+6:i_st+8]),int(name[i_st+12:i_st+14]))
+	else:
+		return (int(name[i_st+3:i_st+5]),int(name[i_st+6:i_st+8]))
+
+# Class to assemble the vertices, edges, faces of a compartment from faces of the surface and segment objects
+# Vertices of the surface are unique by index; vertices of the segment are merged with any vertex
+# with the same coordinates, with a dictionary
+class MN_compartment_builder:
+
+	# Init
+	def __init__(self):
+		self.v_new_list = []
+		self.v_co_dict = {}
+		self.f_new_list = []
+		self.edge_keys = []
+
+		# Sources and faces added from them, in order of the new faces
+		self.f_src_list = []
+
+	# Add faces of a source
+	# MERGE_BY_CO = False: every vertex index of the source is a new vertex
+	def add_faces(self, src, faces, MERGE_BY_CO):
+		faces = np.asarray(faces, dtype=np.int64)
+		verts = face_graph.csr_gather(src.face_vert_ptr, src.face_vert_idx, faces)
+		v_unique = np.unique(verts)
+
+		# Old vertex index -> new vertex index
+		v_map = {}
+		for v, vco in zip(v_unique.tolist(), map(tuple, src.co[v_unique].tolist())):
+			if MERGE_BY_CO and vco in self.v_co_dict:
+				v_map[v] = self.v_co_dict[vco]
+			else:
+				self.v_new_list.append(vco)
+				v_map[v] = len(self.v_new_list) - 1
+				self.v_co_dict.setdefault(vco, v_map[v])
+
+		# Faces and their edges
+		for fs in src.face_verts(faces):
+			nfs = [v_map[v] for v in fs]
+			self.f_new_list.append(nfs)
+			self.edge_keys += [(min(nfs[i-1],nfs[i]), max(nfs[i-1],nfs[i])) for i in range(len(nfs))]
+
+		self.f_src_list.append((src, faces))
+
+	# Unique edges
+	def edges(self):
+		return sorted(set(self.edge_keys))
+
+	# Regions of the new object: dictionary of region name -> new face indexes
+	def regions(self):
+		new_reg_dict = collections.OrderedDict()
+		f_new_st = 0
+		for src, faces in self.f_src_list:
+			n_regs = np.diff(src.face_reg_ptr)[faces]
+			regs = face_graph.csr_gather(src.face_reg_ptr, src.face_reg_idx, faces)
+			f_new = np.repeat(f_new_st + np.arange(len(faces)), n_regs)
+			for r, f in zip(regs.tolist(), f_new.tolist()):
+				new_reg_dict.setdefault(src.reg_names[r], []).append(f)
+			f_new_st += len(faces)
+		return new_reg_dict
+
+	# Materials of the new faces: (list of materials, material index of every new face)
+	def materials(self):
+		mat_list = []
+		face_mat = []
+		for src, faces in self.f_src_list:
+			# Slot of the source -> slot of the new object
+			slot_map = np.zeros(max(len(src.mats), int(src.face_mat.max(initial=-1))+1, 1), dtype=np.int32)
+			for i_slot in np.unique(src.face_mat[faces]).tolist():
+				if i_slot < len(src.mats) and src.mats[i_slot] != None:
+					if not src.mats[i_slot] in mat_list:
+						mat_list.append(src.mats[i_slot])
+					slot_map[i_slot] = mat_list.index(src.mats[i_slot])
+			face_mat.append(slot_map[src.face_mat[faces]])
+		return mat_list, np.concatenate(face_mat + [np.zeros(0, dtype=np.int32)])
+
 # Main
 
 def f_regions_to_compartments(context):
@@ -73,81 +202,26 @@ def f_regions_to_compartments(context):
 
 	############################
 	############################
-	# Go through, find the face lists of all materials on both objects
+	# Read both objects once: faces, vertices, materials, face -> regions
 	############################
 	############################
 
-	print("Making lists of all materials faces....")
-
-	# Material name to face indexes
-	mat_surf_dict = {}
-	mat_seg_dict = {}
-
-	# Deselect both objects
-	ob_surf.select = False
-	ob_seg.select = False
-
-	# Select the surface object
-	ob_surf.select = True
-	context.scene.objects.active = ob_surf
-
-	# Start with the first index
-	ob_surf.active_material_index = 0
-
-	# Go through all materials
-	while ob_surf.active_material_index < len(context.object.material_slots):
-		# Select
-		bpy.ops.object.mode_set(mode='EDIT')
-		bpy.ops.mesh.select_all(action='DESELECT')
-		bpy.ops.object.material_slot_select()
-		bpy.ops.object.mode_set(mode='OBJECT')
-
-		# Count
-		f_sel = []
-		for f in ob_surf.data.polygons:
-			if f.select == True:
-				f_sel.append(f.index)
-
-		# Store
-		mat = context.object.material_slots[ob_surf.active_material_index].material
-		mat_surf_dict[mat.name] = (f_sel,mat)
-
-		# Next!
-		ob_surf.active_material_index += 1
+	print("Reading the surface and segment objects....")
 
-	# Deselect this object
-	ob_surf.select = False
+	bpy.ops.object.mode_set(mode='OBJECT')
+	src_surf = MN_compartment_source(ob_surf)
+	src_seg = MN_compartment_source(ob_seg)
 
-	# Select the segment object
-	ob_seg.select = True
-	context.scene.objects.active = ob_seg
-
-	# Start with the first index
-	ob_seg.active_material_index = 0
-
-	# Go through all materials
-	while ob_seg.active_material_index < len(context.object.material_slots):
-		# Select
-		bpy.ops.object.mode_set(mode='EDIT')
-		bpy.ops.mesh.select_all(action='DESELECT')
-		bpy.ops.object.material_slot_select()
-		bpy.ops.object.mode_set(mode='OBJECT')
-
-		# Count
-		f_sel = []
-		for f in ob_seg.data.polygons:
-			if f.select == True:
-				f_sel.append(f.index)
-
-		# Store
-		mat = context.object.material_slots[ob_seg.active_material_index].material
-		mat_seg_dict[mat.name] = (f_sel,mat)
-
-		# Next!
-		ob_seg.active_material_index += 1
-
-	# Deselect this object
-	ob_seg.select = False
+	# Compartment -> segment regions bordering it
+	SEGMENTS = len_seg == 31
+	comp_seg_regs = {}
+	for r, name in enumerate(src_seg.reg_names):
+		if len(name) < 3 or name[:3] != "sc_":
+			continue
+		sc_id_1 = comp_id_from_name(name, 0, SEGMENTS)
+		sc_id_2 = comp_id_from_name(name, 17 if SEGMENTS else 11, SEGMENTS)
+		for sc_id in set([sc_id_1, sc_id_2]):
+			comp_seg_regs.setdefault(sc_id, []).append(r)
 
 	print("Done")
 
@@ -157,116 +231,19 @@ def f_regions_to_compartments(context):
 	############################
 	############################
 
-	# Turn on edit mode
-	bpy.ops.object.mode_set(mode='EDIT')
-
 	# Go through all the surface regions
-	for reg_surf in reg_list_surf:
-		name_surf = reg_surf.name
+	for r_surf, name_surf in enumerate(src_surf.reg_names):
 		if len(name_surf) < 3 or name_surf[:3] != "sc_":
 			continue
-		if len_surf == 15:
-			sc_id = (int(name_surf[3:5]),int(name_surf[6:8]))
-		elif len_surf == 21:
-			sc_id = (int(name_surf[3:5]),int(name_surf[6:8]),int(name_surf[12:14]))
+		sc_id = comp_id_from_name(name_surf, 0, len_surf == 21)
 
 		print("Making object for compartment: " + str(sc_id))
 
-		# Reset the vertex, edge, face lists
-		v_new_list = []
-		v_id_surf_dict = {} # From the surface idxs to the new vert list
-		v_id_seg_dict = {} # From the segment idxs to the new vert list
-		e_new_list = []
-		f_new_list = []
-
-		# Dictionary from face indexes in the old object to the new one
-		f_id_surf_dict = {}
-		f_id_seg_dict = {}
-
-		# Get the faces in this region
-		f_reg_surf_list = list(reg_surf.get_region_faces(ob_surf.data))
-
-		# Add to the lists
-
-		# Vertices
-		f_v_list = [ob_surf.data.polygons[item].vertices for item in f_reg_surf_list]
-		v_unique_list = [item for sublist in f_v_list for item in sublist]
-		v_unique_list = list(set(v_unique_list))
-		for v in v_unique_list:
-			v_new_list.append(tuple(ob_surf.data.vertices[v].co))
-			v_id_surf_dict[v] = len(v_new_list) - 1
-
-		# Edges, faces
-		for i_fs,fs in enumerate(f_v_list):
-			# Face
-			nfs = [v_id_surf_dict[v] for v in fs]
-			f_new_list.append(nfs)
-
-			# Face index mapping
-			f_id_surf_dict[f_reg_surf_list[i_fs]] = len(f_new_list)-1
-
-			# Edges
-			e1 = sorted([nfs[0],nfs[1]])
-			e2 = sorted([nfs[0],nfs[2]])
-			e3 = sorted([nfs[1],nfs[2]])
-			for ei in [e1,e2,e3]:
-				if not ei in e_new_list:
-					e_new_list.append(ei)
-
-		# Go through all segments
-		for reg_seg in reg_list_seg:
-			if len(reg_seg.name) < 3 or reg_seg.name[:3] != "sc_":
-				continue
-			if len_seg == 19:
-				sc_id_1 = (int(reg_seg.name[3:5]),int(reg_seg.name[6:8]))
-				sc_id_2 = (int(reg_seg.name[14:16]),int(reg_seg.name[17:19]))
-			elif len_seg == 31:
-				sc_id_1 = (int(reg_seg.name[3:5]),int(reg_seg.name[6:8]),int(reg_seg.name[12:14]))
-				sc_id_2 = (int(reg_seg.name[20:22]),int(reg_seg.name[23:25]),int(reg_seg.name[29:31]))
-
-			# Is this a boundary we care about?
-			if sc_id_1 == sc_id or sc_id_2 == sc_id:
-				# Yes it is...
-
-				# Get the faces in this region
-				f_reg_seg_list = list(reg_seg.get_region_faces(ob_seg.data))
-
-				# Add to the lists
-
-				# Vertices
-				f_v_list = [ob_seg.data.polygons[item].vertices for item in f_reg_seg_list]
-				v_unique_list = [item for sublist in f_v_list for item in sublist]
-				v_unique_list = list(set(v_unique_list))
-				v_unique_co_list = [tuple(ob_seg.data.vertices[v].co) for v in v_unique_list]
-				# Check if it already exists
-				for i_v, vco in enumerate(v_unique_co_list):
-					v = v_unique_list[i_v]
-					if not v in v_id_seg_dict:
-						# Search if the vertex already exists from the surface
-						try:
-							idx = v_new_list.index(vco)
-							v_id_seg_dict[v] = idx 
-						# Append it as a new vertex
-						except ValueError:
-							v_new_list.append(vco)
-							v_id_seg_dict[v] = len(v_new_list) - 1
-
-				# Edges, faces
-				for i_fs,fs in enumerate(f_v_list):
-					# Face
-					nfs = [v_id_seg_dict[v] for v in fs]
-					f_new_list.append(nfs)
-
-					# Face index mapping
-					f_id_seg_dict[f_reg_seg_list[i_fs]] = len(f_new_list)-1
-
-					# Edges
-					e1 = sorted([nfs[0],nfs[1]])
-					e2 = sorted([nfs[0],nfs[2]])
-					e3 = sorted([nfs[1],nfs[2]])
-					for ei in [e1,e2,e3]:
-						if not ei in e_new_list:
-							e_new_list.append(ei)
+		# Assemble: the surface faces of the region, then the faces of all bordering segment regions
+		builder = MN_compartment_builder()
+		builder.add_faces(src_surf, src_surf.reg_faces[r_surf], MERGE_BY_CO=False)
+		for r_seg in comp_seg_regs.get(sc_id, []):
+			builder.add_faces(src_seg, src_seg.reg_faces[r_seg], MERGE_BY_CO=True)
 
 		###################################
 		###################################
@@ -274,35 +251,12 @@ def f_regions_to_compartments(context):
 		###################################
 		###################################
 
-		# Verion 1:
-		# Make it using bmesh....
-		'''
-		bm = bmesh.new()
-		v_arr = []
-		for v in v_new_list:
-			v_arr.append(bm.verts.new(v))
-		f_arr = []
-		for f in f_new_list:
-			bm.faces.new((v_arr[f[0]], v_arr[f[1]], v_arr[f[2]]))
-
-		if len_seg == 19:
-			obj_new_name =  "sc_%02d_%02d_compartment" % sc_id
-		elif len_seg == 31:
-			obj_new_name = "sc_%02d_%02d_sg_%02d_compartment" % sc_id
-
-		mesh_new = bpy.data.meshes.new(obj_new_name  + "_mesh")
-		bm.to_mesh(mesh_new)
-		bm.free()
-		'''
-
-		# Verion 2:
-		# Make it using from_pydata....
 		if len_seg == 19:
 			obj_new_name =  "sc_%02d_%02d_compartment" % sc_id
 		elif len_seg == 31:
 			obj_new_name = "sc_%02d_%02d_sg_%02d_compartment" % sc_id
 		mesh_new = bpy.data.meshes.new(obj_new_name + "_mesh")
-		mesh_new.from_pydata(v_new_list,e_new_list,f_new_list)
+		mesh_new.from_pydata(builder.v_new_list,builder.edges(),builder.f_new_list)
 
 		# Validate and update
 		mesh_new.validate(verbose=False) # Important! and i dont know why
@@ -335,49 +289,13 @@ def f_regions_to_compartments(context):
 		###################################
 		# Copy over ALL MCell regions to the object
 		###################################
-		###################################	
-
-		# Dictionary of regions to make on the new object
-		# Name : face idxs
-		new_reg_dict = {}
-
-		# Go through all the surface regions
-		for reg_surf in reg_list_surf:
-			# Get the faces
-			f_surf_list = reg_surf.get_region_faces(ob_surf.data)
-
-			# Find if there are any faces in this original region that also exist on the new object
-			# Go through all faces
-			for f in f_surf_list:
-				if f in f_id_surf_dict:
-					# Add to the dict of regions to make
-					if reg_surf.name in new_reg_dict:
-						new_reg_dict[reg_surf.name].append(f_id_surf_dict[f])
-					else:
-						new_reg_dict[reg_surf.name] = [f_id_surf_dict[f]]
-
-		# Go through all the segment regions
-		for reg_seg in reg_list_seg:
-			# Get the faces
-			f_seg_list = reg_seg.get_region_faces(ob_seg.data)
-
-			# Find if there are any faces in this original region that also exist on the new object
-			# Go through all faces
-			for f in f_seg_list:
-				if f in f_id_seg_dict:
-					# Add to the dict of regions to make
-					if reg_seg.name in new_reg_dict:
-						new_reg_dict[reg_seg.name].append(f_id_seg_dict[f])
-					else:
-						new_reg_dict[reg_seg.name] = [f_id_seg_dict[f]]
-
-		# Make the regions
+		###################################
 
 		# Ensure again the new obj is active
 		context.scene.objects.active = obj_new
 
-		# Add each of the surfaces as a region
-		for reg_name, f_list in new_reg_dict.items():
+		# Add each of the regions of the faces, from the face -> region index
+		for reg_name, f_list in builder.regions().items():
 
 			# Make region
 			obj_new.mcell.regions.add_region_by_name(context,reg_name)
@@ -397,49 +315,15 @@ def f_regions_to_compartments(context):
 		###################################
 		###################################
 
-		# Ensure YET again the new obj is active
-		context.scene.objects.active = obj_new
-
-		# Go through all material face lists on both objects
-		for dct_tple in [(f_id_surf_dict,mat_surf_dict),(f_id_seg_dict,mat_seg_dict)]:
-			f_id_dict = dct_tple[0]
-			mat_dict = dct_tple[1]
-			for mat_name,tple in mat_dict.items():
-
-				# Get out of the tuple
-				mat_face_list = tple[0]
-				mat = tple[1]
-
-				# Deselect all vertices
-				bpy.ops.object.mode_set(mode='EDIT')
-				bpy.ops.mesh.select_all(action='DESELECT')
-
-				# Select all vertices
-				ANY_FLAG = False
-				for f in mat_face_list:
-					if f in f_id_dict:
-						obj_new.data.polygons[f_id_dict[f]].select = True
-						ANY_FLAG = True
-
-				bpy.ops.object.mode_set(mode='OBJECT')
-
-				# Only proceed if at least some faces of this material are on this object
-				if ANY_FLAG == True:
-
-					# Add a material slot
-					bpy.ops.object.material_slot_add()
-
-					# Assign a material to the last slot
-					context.object.material_slots[context.object.material_slots.__len__() - 1].material = mat
-
-					# Assign the material on the selected vertices
-					bpy.ops.object.material_slot_assign()
+		# One slot per material used by the faces, assigned by index
+		# Faces added by filling holes come after the assembled faces, and keep the first slot
+		mat_list, face_mat = builder.materials()
+		for mat in mat_list:
+			obj_new.data.materials.append(mat)
+		if len(mat_list) > 0:
+			mat_idx_arr = np.zeros(len(obj_new.data.polygons), dtype=np.int32)
+			mat_idx_arr[:len(face_mat)] = face_mat
+			obj_new.data.polygons.foreach_set("material_index", mat_idx_arr)
+			obj_new.data.update()
 
 	print("> Finished: f_regions_to_compartments")
-
-
-
-
-
-
-
@@ -0,0 +1,67 @@
+import numpy as np
+
+# Class for a uniform grid over a set of points, for fixed radius searches
+# Points are sorted by the linear index of the cell they fall in, so the points
+# of any cell are a contiguous range of self.order
+class MN_grid_index:
+
+    # Init
+    def __init__(self, pts, cell_size):
+        self.pts = np.asarray(pts, dtype=np.float64).reshape(-1,3)
+
+        if not cell_size > 0:
+            raise ValueError("Grid cell size must be positive.")
+        self.cell_size = float(cell_size)
+
+        if len(self.pts) == 0:
+            self.origin = np.zeros(3)
+            self.dims = np.ones(3, dtype=np.int64)
+        else:
+            self.origin = self.pts.min(axis=0)
+            self.dims = self.cell_coords(self.pts).max(axis=0) + 1
+
+        # Sort the points by cell
+        keys = self.cell_keys(self.cell_coords(self.pts))
+        self.order = np.argsort(keys, kind='stable')
+        self.sorted_keys = keys[self.order]
+
+    # Integer cell coordinates of points
+    def cell_coords(self, pts):
+        return np.floor((pts - self.origin) / self.cell_size).astype(np.int64)
+
+    # Linear cell index from integer cell coordinates
+    def cell_keys(self, cells):
+        return (cells[...,0]*self.dims[1] + cells[...,1])*self.dims[2] + cells[...,2]
+
+    # Indexes of all points within radius of ctr, in increasing order
+    def query_ball(self, ctr, radius):
+        ctr = np.asarray(ctr, dtype=np.float64)
+
+        # Range of cells overlapping the bounding box of the ball
+        lo = np.maximum(self.cell_coords(ctr - radius), 0)
+        hi = np.minimum(self.cell_coords(ctr + radius), self.dims - 1)
+        if np.any(hi < lo):
+            return np.zeros(0, dtype=np.int64)
+
+        # For very large balls it is cheaper to check every point
+        if np.prod(hi - lo + 1) >= len(self.pts):
+            cand = np.arange(len(self.pts))
+        else:
+            # Keys of all cells in the box
+            cells = np.stack(np.meshgrid(
+                np.arange(lo[0],hi[0]+1),
+                np.arange(lo[1],hi[1]+1),
+                np.arange(lo[2],hi[2]+1),
+                indexing='ij'), axis=-1).reshape(-1,3)
+            keys = self.cell_keys(cells)
+
+            # Ranges of sorted points in those cells
+            starts = np.searchsorted(self.sorted_keys, keys, side='left')
+            ends = np.searchsorted(self.sorted_keys, keys, side='right')
+            counts = ends - starts
+            offs = np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+            cand = np.sort(self.order[offs])
+
+        # Exact distance test
+        d2 = ((self.pts[cand] - ctr)**2).sum(axis=1)
+        return cand[d2 <= radius*radius]
@@ -17,6 +17,15 @@ import sys
 # To add objects to MCell
 from cellblender.cellblender_utils import preserve_selection_use_operator
 
+# Shared SWC loader
+from . import swc_morphology
+
+# Face adjacency for growing sections
+from . import face_graph
+
+# Spatial index over face centers
+from . import spatial_index
+
 # Function to project point onto line
 '''
 def project_pt_line(v, w, p):
@@ -38,53 +47,20 @@ def project_pt_line(v, w, p):
     return v + (v_to_w * t2)
 '''
 
-# Deep copy a list
-def unshared_copy(inList):
-    if isinstance(inList, list):
-        return list( map(unshared_copy, inList) )
-    return inList
-
 # Read in the swc file to know what's connected
 def get_connections(fname):
-    
-    # Store the swc data
-    swc_data = []
-    
-    # Read the file
-    f = open(fname,'r')
-    for i_line,line in enumerate(f):
-        line_s = line.split();
-        if len(line_s) > 0 and line_s[0] != "#":
-            line_data = []
-            line_data.append(int(float(line_s[0])))
-            line_data.append(int(float(line_s[1])))
-            line_data.append(float(line_s[2]))
-            line_data.append(float(line_s[3]))
-            line_data.append(float(line_s[4]))
-            line_data.append(float(line_s[5]))
-            line_data.append(int(float(line_s[6])))
-            swc_data.append(line_data)
 
-    # Vertex coordinates
-    vert_list = [Vector(item[2:5]) for item in swc_data]
-
-    # Radius list
-    r_list = [item[5] for item in swc_data]
+    # Load the morphology (cached on the file modification time)
+    morph = swc_morphology.load_swc(fname)
 
     # Find connections
-    pt_connect = []
-    for i in range(0,len(swc_data)):
-        pt_connect.append([])
-
-    for i,data in enumerate(swc_data):
-        if i > 0: # The first is the -1 index
-            pt_connect[data[6]-1].append(i+1)
+    pt_connect = morph.pt_connect()
 
-    pt_connect_dup = unshared_copy(pt_connect) # copy
+    # Vertex coordinates
+    vert_list = [Vector(item) for item in morph.vert_co_list()]
 
-    for i_list, sub_list in enumerate(pt_connect_dup):
-        for idx in sub_list:
-            pt_connect[idx-1].append(i_list+1)
+    # Radius list
+    r_list = morph.r_list()
 
     return pt_connect, vert_list, r_list
 
@@ -234,12 +210,12 @@ def f_surface_sections(context, swc_filepath):
     # Construct dividing planes
     normal_dict = construct_dividing_plane_normals(pt_connect, vert_co_list)
 
-    # List of vertices that are endpoints
-    endpoint_list = []
+    # Set of vertices that are endpoints
+    endpoint_set = set()
     for i_pt_0, conn_pts in enumerate(pt_connect):
         i_pt = i_pt_0 + 1
         if len(conn_pts) == 1:
-            endpoint_list.append(i_pt)
+            endpoint_set.add(i_pt)
 
     # List of sections
     sc_list = []
@@ -260,12 +236,29 @@ def f_surface_sections(context, swc_filepath):
     # Zipped sort
     sc_r_list, sc_list = (list(t) for t in zip(*sorted(zip(sc_r_list, sc_list),reverse=True)))
 
-    # Create a list of face indexes in ob.data.polygons that need to be assigned to sections
-    # As faces are assigned they are removed from this list
-    face_idx_list = list(range(0,len(ob.data.polygons)))
-
-    # zero vector
-    zv = Vector([0.0,0.0,0.0])
+    # Mask of face indexes in ob.data.polygons that need to be assigned to sections
+    # As faces are assigned they are removed from this mask
+    n_faces = len(ob.data.polygons)
+    n_verts = len(ob.data.vertices)
+    face_free_mask = np.ones(n_faces, dtype=bool)
+
+    # Face adjacency of the mesh, built once for all sections
+    # Mesh data must be up to date => object mode
+    bpy.ops.object.mode_set(mode='OBJECT')
+    graph = face_graph.face_graph_from_mesh(ob.data)
+
+    # Face centers
+    face_ctr_arr = np.empty(3*n_faces, dtype=np.float64)
+    ob.data.polygons.foreach_get("center", face_ctr_arr)
+    face_ctr_arr = face_ctr_arr.reshape(-1,3)
+
+    # Spatial index over the face centers, built once for all sections
+    # Cells are sized to the typical search radius
+    sc_max_dist_list = [1.5*(vert_co_list[sc[1]-1]-vert_co_list[sc[0]-1]).length for sc in sc_list]
+    cell_size = float(np.median(sc_max_dist_list)) if len(sc_max_dist_list) > 0 else 1.0
+    if not cell_size > 0:
+        cell_size = 1.0
+    grid = spatial_index.MN_grid_index(face_ctr_arr, cell_size)
 
     # Store the face idxs assigned to each section
     sc_face_dict = {}
@@ -277,9 +270,6 @@ def f_surface_sections(context, swc_filepath):
     for i_ctr,sc in enumerate(sc_list):
         print("Assigning faces for section " + str(sc) + " (" + str(i_ctr+1) + "/" + str(len(sc_list)) + ")...")
         
-        # Face selection mode
-        context.tool_settings.mesh_select_mode = (False, False, True)
-
         ### 
         # Step 1: Disregard faces that violate our bordering condition from the SWC file
         ###
@@ -298,8 +288,9 @@ def f_surface_sections(context, swc_filepath):
                 # Store to disregard
                 vert_disregard_list += vert_brdr_list
 
-        # Remove duplicates (is this necessary or superfluous?)
-        vert_disregard_list = list(set(vert_disregard_list))
+        # Mask of the vertices to disregard
+        vert_disregard_mask = np.zeros(n_verts, dtype=bool)
+        vert_disregard_mask[vert_disregard_list] = True
 
         ###
         # Step 2: find faces that are possible candidates for belonging to this section
@@ -323,188 +314,88 @@ def f_surface_sections(context, swc_filepath):
             else:
                 plane_normals_st.append(normal_tmp[sc[(i_vert+1)%2]])
 
+        # Endpoints get a free pass on the distance check
+        free_pass = (sc[1] in endpoint_set, sc[0] in endpoint_set)
+
         # First find all faces that are within max_dist
-        tri_list = []
-        for f in face_idx_list:
-    
-            # Distances from each vert
-            ctr = ob.data.polygons[f].center
+        # Only the faces in the ball around one of the vertices need to be checked
+        if not free_pass[0]:
+            f_batch = grid.query_ball(np.array(v_co_0), max_dist)
+        elif not free_pass[1]:
+            f_batch = grid.query_ball(np.array(v_co_1), max_dist)
+        else:
+            f_batch = np.arange(n_faces)
 
-            disps = []
-            if not sc[1] in endpoint_list:
-                disps.append(ctr - v_co_0)
-            else:
-                disps.append(zv) # Free pass for endpoint
-            if not sc[0] in endpoint_list:
-                disps.append(ctr - v_co_1)
+        # Only faces that are not yet assigned
+        f_batch = f_batch[face_free_mask[f_batch]]
+
+        # Displacements from each vert
+        ctrs = face_ctr_arr[f_batch]
+        disps = []
+        for i_vert, v_co in enumerate([v_co_0, v_co_1]):
+            if not free_pass[i_vert]:
+                disps.append(ctrs - np.array(v_co))
             else:
-                disps.append(zv) # Free pass for endpoint
-
-            # Check that distances are allowed
-            if disps[0].length <= max_dist and disps[1].length <= max_dist:
-                    
-                # Does this face share vertices with any of the illegal vertices? If so, disregard
-                vert_f_idxs = list(ob.data.polygons[f].vertices)
-                if not vert_f_idxs[0] in vert_disregard_list and not vert_f_idxs[1] in vert_disregard_list and not vert_f_idxs[2] in vert_disregard_list:
-
-                    # This is not sufficient - this just indicates that this face lies in the intersection region of two spheres!
-                    # Now use the normals of the planes that define the regions to further constrain which elements are allowed
-                    
-                    # Flag
-                    COUNT_FACE = True
-                    
-                    # Check each vertex
-                    for i_vert in [0,1]:
-
-                        # But don't check the endpoints
-                        if not sc[i_vert] in endpoint_list:
-                        
-                            # Check all the normals
-                            for normal in plane_normals_st[i_vert]:
-                        
-                                if normal.dot(disps[i_vert]) < 0:
-                                    COUNT_FACE = False
-                                    break
-                    
-                            # Don't keep search for this face if we already violated one of the vertices
-                            # i.e. break out of the i_vert = [0,1] loop
-                            if COUNT_FACE == False:
-                                break
-                                    
-                    # Append
-                    if COUNT_FACE == True:
-                        tri_list.append(f)
+                disps.append(np.zeros_like(ctrs)) # Free pass for endpoint
 
-        ###
-        # Step 3: Proceed using the "select more" = bpy.ops.mesh.select_more() function
-        ###
+        # Check that distances are allowed
+        count_mask = (np.sqrt((disps[0]**2).sum(axis=1)) <= max_dist) & (np.sqrt((disps[1]**2).sum(axis=1)) <= max_dist)
 
-        # First set the mode
-        bpy.ops.object.mode_set(mode='EDIT')
-        # Face selection mode
-        context.tool_settings.mesh_select_mode = (False, False, True)
-        # Deselect all
-        bpy.ops.mesh.select_all(action='DESELECT')
-        # Must be in object mode to select faces!
-        bpy.ops.object.mode_set(mode='OBJECT')
-
-        # Initially select the faces in tri_list which are closest to each of the vertices
-        min_f0 = -1
-        dist_f0 = -1
-        min_f1 = -1
-        dist_f1 = -1
-        for f in tri_list:
-            dist_v0 = (ob.data.polygons[f].center - v_co_0).length
-            if dist_v0 < dist_f0 or dist_f0 == -1:
-                min_f0 = f
-                dist_f0 = dist_v0
-            dist_v1 = (ob.data.polygons[f].center - v_co_1).length
-            if dist_v1 < dist_f1 or dist_f1 == -1:
-                min_f1 = f
-                dist_f1 = dist_v1
-
-        ob.data.polygons[min_f0].select = True
-        ob.data.polygons[min_f1].select = True
+        # Does this face share vertices with any of the illegal vertices? If so, disregard
+        if len(f_batch) > 0:
+            f_batch_verts = face_graph.csr_gather(graph.face_vert_ptr, graph.face_vert_idx, f_batch)
+            f_batch_n_verts = np.diff(graph.face_vert_ptr)[f_batch]
+            f_batch_starts = np.cumsum(f_batch_n_verts) - f_batch_n_verts
+            count_mask &= ~np.logical_or.reduceat(vert_disregard_mask[f_batch_verts], f_batch_starts)
 
-        # Search for faces that belong to this section
+        # This is not sufficient - this just indicates that this face lies in the intersection region of two spheres!
+        # Now use the normals of the planes that define the regions to further constrain which elements are allowed
+        for i_vert in [0,1]:
 
-        # Init list of faces that belong to this section
-        sc_face_dict[sc] = []
-        # Init list of indexes to delete from the face_idx_list to prevent double checking
-        delete_list = []
+            # But don't check the endpoints
+            if not sc[i_vert] in endpoint_set:
 
-        SEARCH = True
-        while SEARCH:
-            
-            # Use the select more function
-            # Must be in edit mode to use select more!
-            bpy.ops.object.mode_set(mode='EDIT')
-            bpy.ops.mesh.select_more()
-            bpy.ops.object.mode_set(mode='OBJECT')
-            
-            # Check each of the possible faces if it is selected
-            new_faces = []
-            delete_tri_list = []
-            
-            # Fast but worse
-            '''
-            for i_f,f in enumerate(tri_list):
-                if ob.data.polygons[f].select == True:
-            '''
-            # Slower but better
-            for f, f_face in enumerate(ob.data.polygons):
-                if f_face.select == True:
-                    if f in tri_list:
-                        i_f = tri_list.index(f)
-                        # Add it as a valid face
-                        new_faces.append(f)
-                        # Store for deletion from tri_list to prevent double counting at next iteration
-                        delete_tri_list.append(i_f)
-                    else:
-                        # Turn off the face selection so that we do not continue to "grow" in this direction using the select more function
-                        f_face.select = False
-
-            # Check that there was something new added
-            if len(new_faces) == 0:
-                SEARCH = False
-                break
-            
-            # Delete triangles from tri_list to prevent double counting in the future (+ faster!)
-            delete_tri_list.reverse()
-            for i_f in delete_tri_list:
-                del tri_list[i_f]
-
-            # Add the new faces
-            for f in new_faces:
-                sc_face_dict[sc].append(f)
-                delete_list.append(face_idx_list.index(f))
-
-        # Select the region
-        '''
-        # First set the mode
-        bpy.ops.object.mode_set(mode='EDIT')
-        # Face selection mode
-        context.tool_settings.mesh_select_mode = (False, False, True)
-        # Deselect all
-        bpy.ops.mesh.select_all(action='DESELECT')
-        # Must be in object mode to select faces!
-        bpy.ops.object.mode_set(mode='OBJECT')
-        # Select
-        for t in sc_face_dict[sc]:
-            ob.data.polygons[t].select = True
-        bpy.ops.object.mode_set(mode='EDIT')
-        '''
-
-        # Do the deletion
-        delete_list.sort()
-        delete_list.reverse()
-        for i_f in delete_list:
-            del face_idx_list[i_f]
+                # Check all the normals
+                for normal in plane_normals_st[i_vert]:
+                    count_mask &= disps[i_vert].dot(np.array(normal)) >= 0
+
+        tri_list = f_batch[count_mask]
 
         ###
-        # Step 4 - Get the vertices that make up the border of this section
+        # Step 3: Grow the section over the candidate faces
+        # Starting from the faces closest to each vertex, this is the same as repeatedly
+        # using the "select more" = bpy.ops.mesh.select_more() function
         ###
 
-        # First deselect all
-        bpy.ops.object.mode_set(mode='EDIT')
-        bpy.ops.mesh.select_all(action='DESELECT')
-        bpy.ops.object.mode_set(mode='OBJECT')
+        # Search for faces that belong to this section
+        if len(tri_list) > 0:
+
+            # Initially select the faces in tri_list which are closest to each of the vertices
+            tri_ctrs = face_ctr_arr[tri_list]
+            min_f0 = tri_list[np.argmin(((tri_ctrs - np.array(v_co_0))**2).sum(axis=1))]
+            min_f1 = tri_list[np.argmin(((tri_ctrs - np.array(v_co_1))**2).sum(axis=1))]
+
+            cand_mask = np.zeros(n_faces, dtype=bool)
+            cand_mask[tri_list] = True
+            sc_faces = graph.grow_region([min_f0,min_f1], cand_mask)
+        else:
+            sc_faces = np.zeros(0, dtype=np.int64)
 
-        # Next select the faces that belong to this section
-        for f in ob.data.polygons:
-            if f.index in sc_face_dict[sc]:
-                f.select = True
+        # Store the faces that belong to this section
+        sc_face_dict[sc] = sc_faces.tolist()
 
-        # Convert to edge loop
-        bpy.ops.object.mode_set(mode='EDIT')
-        bpy.ops.mesh.region_to_loop()
+        # Remove them from the faces to be assigned to prevent double checking
+        face_free_mask[sc_faces] = False
 
-        # Get the edges
-        bpy.ops.object.mode_set(mode='OBJECT')
-        edge_loop = [i.index for i in ob.data.edges if i.select]
+        # Mask of this section's faces
+        sc_face_mask = np.zeros(n_faces, dtype=bool)
+        sc_face_mask[sc_faces] = True
+
+        ###
+        # Step 4 - Get the vertices that make up the border of this section
+        ###
 
-        # Convert to vertices and store
-        sc_brdr_vert_vict[sc] = [item for edge in edge_loop for item in ob.data.edges[edge].vertices]
+        sc_brdr_vert_vict[sc] = graph.border_verts(sc_face_mask).tolist()
 
 
     ###
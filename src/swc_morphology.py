@@ -0,0 +1,154 @@
+import numpy as np
+
+import os
+
+# Cache of loaded SWC files
+# Key: absolute path of the SWC file
+# Value: tuple of (mtime, size, MN_morphology)
+swc_cache_dict = {}
+
+# Class for a morphology read from an SWC file
+# All per-point data is stored in arrays indexed by row in the file (0-based)
+# Point "ids" in the rest of Neuron Launcher are 1-based rows, i.e. row + 1
+class MN_morphology:
+
+    # Init
+    def __init__(self, ids, types, xyz, radius, parent):
+        # SWC sample ids as they appear in the file
+        self.ids = ids
+
+        # SWC structure types
+        self.types = types
+
+        # Coordinates, shape (n_pts,3)
+        self.xyz = xyz
+
+        # Radii
+        self.radius = radius
+
+        # Row index of the parent of each point, -1 for roots
+        self.parent = parent
+
+        # Construct the adjacency
+        self.construct_adjacency()
+
+    # Number of points
+    def __len__(self):
+        return len(self.ids)
+
+    # Construct CSR-style adjacency from the parent array
+    # The neighbors of row i are conn_idx[conn_ptr[i]:conn_ptr[i+1]]: first the
+    # children in file order, then the parent (if any) - the same ordering as the
+    # old pt_connect lists
+    def construct_adjacency(self):
+        n_pts = len(self.parent)
+
+        # Rows that have a parent
+        has_parent = self.parent >= 0
+        child_rows = np.nonzero(has_parent)[0]
+        child_parents = self.parent[child_rows]
+
+        # Invert parent -> child: group the children by parent, keeping file order
+        order = np.argsort(child_parents, kind='stable')
+        child_rows = child_rows[order]
+        child_parents = child_parents[order]
+
+        # Number of children and of neighbors of each point
+        self.n_children = np.bincount(child_parents, minlength=n_pts)
+        n_conn = self.n_children + has_parent
+
+        self.conn_ptr = np.zeros(n_pts+1, dtype=np.int64)
+        np.cumsum(n_conn, out=self.conn_ptr[1:])
+
+        self.conn_idx = np.empty(self.conn_ptr[-1], dtype=np.int64)
+
+        # Children: position within the group of each parent
+        child_ptr = np.zeros(n_pts+1, dtype=np.int64)
+        np.cumsum(self.n_children, out=child_ptr[1:])
+        rank = np.arange(len(child_rows)) - child_ptr[child_parents]
+        self.conn_idx[self.conn_ptr[child_parents] + rank] = child_rows
+
+        # Parent goes last
+        rows = np.nonzero(has_parent)[0]
+        self.conn_idx[self.conn_ptr[rows] + self.n_children[rows]] = self.parent[rows]
+
+        # Number of connections of each point
+        self.degree = n_conn
+
+    # Rows connected to the given row
+    def neighbors(self, row):
+        return self.conn_idx[self.conn_ptr[row]:self.conn_ptr[row+1]]
+
+    # Connections as a list of lists of 1-based point ids
+    # This is the pt_connect structure used throughout Neuron Launcher
+    def pt_connect(self):
+        conn_ids = (self.conn_idx + 1).tolist()
+        ptr = self.conn_ptr.tolist()
+        return [conn_ids[ptr[i]:ptr[i+1]] for i in range(0,len(ptr)-1)]
+
+    # Coordinates as a list of tuples
+    def vert_co_list(self):
+        return [tuple(item) for item in self.xyz.tolist()]
+
+    # Radii as a list
+    def r_list(self):
+        return self.radius.tolist()
+
+    # Sections as an array of 1-based point id pairs (pt1 < pt2), shape (n_sc,2)
+    # The order matches looping over pt_connect and keeping conn_pt > pt
+    def sections(self):
+        rows = np.repeat(np.arange(len(self.parent)), self.degree)
+        keep = self.conn_idx > rows
+        return np.stack([rows[keep], self.conn_idx[keep]], axis=1) + 1
+
+    # 1-based ids of the points with exactly one connection
+    def endpoints(self):
+        return np.nonzero(self.degree == 1)[0] + 1
+
+# Read the SWC file into an MN_morphology (no caching)
+def read_swc(fname):
+
+    # Read all columns; comment lines start with #
+    data = np.loadtxt(fname, comments='#', usecols=range(0,7), ndmin=2)
+
+    ids = data[:,0].astype(np.int64)
+    types = data[:,1].astype(np.int64)
+    xyz = np.ascontiguousarray(data[:,2:5])
+    radius = np.ascontiguousarray(data[:,5])
+    parent_ids = data[:,6].astype(np.int64)
+
+    # Convert the parent ids into rows
+    # Samples are usually numbered 1..N in order - in that case the row is simply id-1
+    if np.array_equal(ids, np.arange(1,len(ids)+1)):
+        parent = parent_ids - 1
+        parent[parent_ids < 1] = -1
+    else:
+        id_order = np.argsort(ids)
+        pos = np.searchsorted(ids, parent_ids, sorter=id_order)
+        pos = np.minimum(pos, len(ids)-1)
+        parent = id_order[pos]
+        parent[ids[parent] != parent_ids] = -1
+
+    return MN_morphology(ids, types, xyz, radius, parent)
+
+# Load an SWC file, reusing the previous result if the file has not changed
+def load_swc(fname):
+    global swc_cache_dict
+
+    fpath = os.path.abspath(fname)
+    st = os.stat(fpath)
+
+    if fpath in swc_cache_dict:
+        mtime, size, morph = swc_cache_dict[fpath]
+        if mtime == st.st_mtime_ns and size == st.st_size:
+            return morph
+
+    morph = read_swc(fpath)
+    swc_cache_dict[fpath] = (st.st_mtime_ns, st.st_size, morph)
+
+    return morph
+
+# Clear the cache of loaded SWC files
+def clear_swc_cache():
+    global swc_cache_dict
+    swc_cache_dict = {}
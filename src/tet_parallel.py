@@ -0,0 +1,238 @@
+# Tetrahedralize every section of a neuron separately, in parallel, and merge the results
+# into a single mesh that can be used in place of the output of a single TetGen call
+#
+# Independent of Blender: every section is meshed by running this file as a script
+# in a separate Python process (which must be able to import MeshPy):
+#   python tet_parallel.py plc.npz mesh.npz switches
+# A whole PLC can also be meshed in a separate process, passing the pickled meshpy.tet.MeshInfo:
+#   python tet_parallel.py --mesh-info mesh_info.pickle mesh_built.pickle
+#
+# The border planes between sections are shared facets of both sections. They are meshed
+# with the Y switch (no Steiner points on the boundary), so that both sides keep the
+# triangles of the facet and the merged mesh is conforming.
+
+import numpy as np
+
+import os
+
+import sys
+
+import subprocess
+
+import tempfile
+
+import concurrent.futures
+
+import pickle
+
+# TetGen switches for the sections: the Y switch is always added
+TET_PARALLEL_SWITCHES = 'pq'
+
+# Faces of a tet opposite to each of its corners
+# TetGen convention: neighbor i of a tet is opposite to corner i
+tet_face_opp_idxs = np.array([[1,2,3],[0,2,3],[0,1,3],[0,1,2]])
+
+# Class for the PLC (closed surface) of a single section
+class MN_section_plc:
+
+    # Init
+    # vert_co_arr = global point list
+    # facets = triangles of this section in global point ids
+    # markers = face marker of every triangle
+    def __init__(self, sc_id, vert_co_arr, facets, markers):
+        self.sc_id = sc_id
+        facets = np.asarray(facets, dtype=np.int64).reshape(-1,3)
+
+        # Only keep the points used by this section, and re-index the facets
+        self.vert_ids, local_facets = np.unique(facets, return_inverse=True)
+        self.points = np.asarray(vert_co_arr, dtype=np.float64)[self.vert_ids]
+        self.facets = local_facets.reshape(-1,3)
+        self.markers = np.asarray(markers, dtype=np.int64).reshape(-1)
+
+# Class for a tet mesh merged from the meshes of all sections
+# Has the same attributes as the output of meshpy.tet.build that are used by f_compartmentize_tet
+class MN_merged_mesh:
+
+    # Init
+    def __init__(self, points, elements, neighbors, faces, face_markers, element_attributes):
+        self.points = points
+        self.elements = elements
+        self.neighbors = neighbors
+        self.faces = faces
+        self.face_markers = face_markers
+        self.element_attributes = element_attributes
+
+# Tetrahedralize a PLC with MeshPy
+# Returns a dict of arrays of the resulting mesh
+def tetrahedralize_plc(points, facets, markers, switches):
+    from meshpy.tet import MeshInfo, build, Options
+    from meshpy.common import foreign_array_as_numpy
+
+    mesh_info = MeshInfo()
+    mesh_info.set_points(points)
+    mesh_info.set_facets(facets, markers=markers)
+
+    opts = Options(switches=switches, neighout=True, facesout=True)
+    mesh_built = build(mesh_info, options=opts)
+
+    return {
+        "points": np.array(foreign_array_as_numpy(mesh_built.points), dtype=np.float64).reshape(-1,3),
+        "elements": np.array(foreign_array_as_numpy(mesh_built.elements), dtype=np.int64).reshape(-1,4),
+        "neighbors": np.array(foreign_array_as_numpy(mesh_built.neighbors), dtype=np.int64).reshape(-1,4),
+        "faces": np.array(foreign_array_as_numpy(mesh_built.faces), dtype=np.int64).reshape(-1,3),
+        "face_markers": np.array(foreign_array_as_numpy(mesh_built.face_markers), dtype=np.int64).reshape(-1)
+    }
+
+# Tetrahedralize a single section in a separate Python process
+def tetrahedralize_section_process(plc, switches, python_exe, tmp_dir):
+    fname_in = os.path.join(tmp_dir, "plc_%02d_%02d.npz"%plc.sc_id)
+    fname_out = os.path.join(tmp_dir, "mesh_%02d_%02d.npz"%plc.sc_id)
+    np.savez(fname_in, points=plc.points, facets=plc.facets, markers=plc.markers)
+
+    proc = subprocess.run([python_exe, os.path.abspath(__file__), fname_in, fname_out, switches], stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    if proc.returncode != 0 or not os.path.isfile(fname_out):
+        raise SystemError("TetGen failed for section: " + str(plc.sc_id) + "\n" + proc.stdout.decode(errors='replace'))
+
+    with np.load(fname_out) as data:
+        return {key: data[key] for key in data.files}
+
+# Tetrahedralize all sections in parallel
+# Returns the mesh of every section, in the order of plc_list
+def tetrahedralize_sections(plc_list, switches=TET_PARALLEL_SWITCHES, n_workers=None, python_exe=None):
+    if not 'Y' in switches:
+        switches += 'Y'
+    if python_exe == None:
+        python_exe = sys.executable
+    if n_workers == None:
+        n_workers = os.cpu_count()
+
+    tmp_dir = tempfile.mkdtemp(prefix="nrnlauncher_tet_")
+    try:
+        # The work is done in the child processes - threads are enough to wait on them
+        with concurrent.futures.ThreadPoolExecutor(max_workers=n_workers) as executor:
+            future_list = [executor.submit(tetrahedralize_section_process, plc, switches, python_exe, tmp_dir) for plc in plc_list]
+            mesh_list = [future.result() for future in future_list]
+    finally:
+        remove_tmp_dir(tmp_dir)
+
+    return mesh_list
+
+# Tetrahedralize a PLC given as a meshpy.tet.MeshInfo in a separate Python process
+# The MeshInfo goes there and back pickled, so a crash of TetGen does not take down this process
+# options = keyword arguments for meshpy.tet.Options
+# Returns the meshpy.tet.MeshInfo built by TetGen
+def build_process(mesh_info, switches, options=None, python_exe=None):
+    options = {} if options is None else options
+    if python_exe == None:
+        python_exe = sys.executable
+
+    tmp_dir = tempfile.mkdtemp(prefix="nrnlauncher_tet_")
+    try:
+        fname_in = os.path.join(tmp_dir, "mesh_info.pickle")
+        fname_out = os.path.join(tmp_dir, "mesh_built.pickle")
+        with open(fname_in, "wb") as f:
+            pickle.dump((mesh_info, switches, options), f, protocol=pickle.HIGHEST_PROTOCOL)
+
+        proc = subprocess.run([python_exe, os.path.abspath(__file__), "--mesh-info", fname_in, fname_out], stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        print(proc.stdout.decode(errors='replace'))
+        if proc.returncode != 0 or not os.path.isfile(fname_out):
+            raise SystemError("TetGen failed with return code: " + str(proc.returncode))
+
+        with open(fname_out, "rb") as f:
+            return pickle.load(f)
+    finally:
+        remove_tmp_dir(tmp_dir)
+
+# Remove a temporary directory and the files in it
+def remove_tmp_dir(tmp_dir):
+    for fname in os.listdir(tmp_dir):
+        os.remove(os.path.join(tmp_dir, fname))
+    os.rmdir(tmp_dir)
+
+# Merge the meshes of all sections into a single mesh
+# vert_co_arr = points of the global PLC - the points of the sections' PLCs keep
+# their global ids, points added by TetGen are appended after them
+def merge_section_meshes(plc_list, mesh_list, vert_co_arr):
+    vert_co_arr = np.asarray(vert_co_arr, dtype=np.float64).reshape(-1,3)
+    n_verts = len(vert_co_arr)
+
+    points_list = [vert_co_arr]
+    elements_list = []
+    neighbors_list = []
+    faces_list = []
+    face_markers_list = []
+    att_list = []
+
+    n_tets = 0
+    for i_sc, (plc, mesh) in enumerate(zip(plc_list, mesh_list)):
+
+        # Local point id -> global point id
+        # TetGen keeps the input points first and in order
+        n_in = len(plc.vert_ids)
+        n_new = len(mesh["points"]) - n_in
+        local_to_global = np.concatenate((plc.vert_ids, n_verts + np.arange(n_new)))
+        points_list.append(mesh["points"][n_in:])
+        n_verts += n_new
+
+        elements_list.append(local_to_global[mesh["elements"]])
+        neighbors_list.append(np.where(mesh["neighbors"] >= 0, mesh["neighbors"] + n_tets, -1))
+        faces_list.append(local_to_global[mesh["faces"]])
+        face_markers_list.append(mesh["face_markers"])
+
+        # Every section is its own region
+        att_list.append(np.full(len(mesh["elements"]), i_sc+1, dtype=np.int64))
+
+        n_tets += len(mesh["elements"])
+
+    points = np.concatenate(points_list)
+    elements = np.concatenate(elements_list) if len(elements_list) > 0 else np.zeros((0,4), dtype=np.int64)
+    neighbors = np.concatenate(neighbors_list) if len(neighbors_list) > 0 else np.zeros((0,4), dtype=np.int64)
+    faces = np.concatenate(faces_list) if len(faces_list) > 0 else np.zeros((0,3), dtype=np.int64)
+    face_markers = np.concatenate(face_markers_list) if len(face_markers_list) > 0 else np.zeros(0, dtype=np.int64)
+    element_attributes = np.concatenate(att_list) if len(att_list) > 0 else np.zeros(0, dtype=np.int64)
+
+    # Stitch the sections: tets on either side of a shared facet become neighbors
+    open_tets, open_slots = np.nonzero(neighbors == -1)
+    if len(open_tets) > 0:
+        open_faces = np.sort(elements[open_tets[:,None], tet_face_opp_idxs[open_slots]], axis=1)
+        _, inverse, counts = np.unique(open_faces, axis=0, return_inverse=True, return_counts=True)
+        inverse = inverse.reshape(-1)
+
+        # Faces that are open on both sides
+        shared = counts[inverse] == 2
+        order = np.argsort(inverse[shared], kind='stable')
+        pair_idx = np.nonzero(shared)[0][order].reshape(-1,2)
+        t0, s0 = open_tets[pair_idx[:,0]], open_slots[pair_idx[:,0]]
+        t1, s1 = open_tets[pair_idx[:,1]], open_slots[pair_idx[:,1]]
+        neighbors[t0,s0] = t1
+        neighbors[t1,s1] = t0
+
+    # Shared facets occur once for each section
+    _, first_idx = np.unique(np.sort(faces, axis=1), axis=0, return_index=True)
+    first_idx = np.sort(first_idx)
+    faces = faces[first_idx]
+    face_markers = face_markers[first_idx]
+
+    return MN_merged_mesh(points, elements, neighbors, faces, face_markers, element_attributes)
+
+# Run as a script: tetrahedralize one section, or a pickled MeshInfo
+if __name__ == "__main__":
+    if sys.argv[1] == "--mesh-info":
+        from meshpy.tet import build, Options
+
+        fname_in, fname_out = sys.argv[2:4]
+        with open(fname_in, "rb") as f:
+            mesh_info, switches, options = pickle.load(f)
+
+        mesh_built = build(mesh_info, options=Options(switches=switches, **options))
+
+        with open(fname_out, "wb") as f:
+            pickle.dump(mesh_built, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    else:
+        fname_in, fname_out, switches = sys.argv[1:4]
+
+        with np.load(fname_in) as data:
+            mesh = tetrahedralize_plc(data["points"], data["facets"], data["markers"], switches)
+
+        np.savez(fname_out, **mesh)
@@ -9,20 +9,16 @@ import sys
 
 import cellblender
 
-# Function to read a single data file
-def read_voltage_data(fname, v_dict):
-	f = open(fname, 'r')
+import numpy as np
 
-	for i, line in enumerate(f):
-		line_s = line.split();
-		if len(line_s) == 4:
-			key = (int(line_s[0]),int(line_s[1]),int(line_s[2]))
-			v_dict[key] = float(line_s[3])
+# Memory mapped store of the voltages of all frames
+from . import voltage_store
 
-	f.close()
-
-	return
+# Vertex color mode
+from . import color_regions
 
+# Voltages streamed from a running simulation
+from . import voltage_stream
 
 '''
 # Set colors of the molecule glyphs
@@ -58,6 +54,155 @@ def set_mol_cols():
 				mat.diffuse_color = col_dict[mol_name]
 '''
 
+# Max and min voltages for colors
+MIN_V = -80.0
+MAX_V = 20.0
+
+# Class for the plan of updating the materials of an object every frame, compiled once
+# The materials of compartments are looked up by name once, and ordered by their voltage column,
+# so that every frame is one gather + normalization over the whole frame, and only the
+# materials whose color changed are written
+class MN_frame_plan:
+
+	# Init
+	# comp_index = dictionary of compartment id -> voltage column
+	# source = what the columns refer to (the voltage store, or the voltage directory)
+	def __init__(self, ob, comp_index, source):
+		self.source = source
+		self.n_mats = len(ob.data.materials)
+
+		mats = []
+		cols = []
+		reg_ids = []
+		for mat in ob.data.materials:
+			if mat == None:
+				continue
+			mn = mat.name
+			if len(mn) == 23 and mn[-9:] == "_material":
+				reg_id = (int(mn[3:5]),int(mn[6:8]),int(mn[12:14]))
+				col = comp_index.get(reg_id)
+				if col != None:
+					mats.append(mat)
+					cols.append(col)
+					reg_ids.append(reg_id)
+
+		# In the order of the voltage columns
+		order = np.argsort(np.array(cols, dtype=np.int64), kind='stable')
+		self.mats = [mats[i] for i in order.tolist()]
+		self.reg_ids = [reg_ids[i] for i in order.tolist()]
+		self.cols = np.array(cols, dtype=np.int64)[order]
+
+		# Fraction shown by every material, NaN = not set yet
+		self.frac_last = np.full(len(self.mats), np.nan)
+
+	# Is the plan still valid for an object and a voltage source
+	def is_valid(self, ob, source):
+		return self.source == source and self.n_mats == len(ob.data.materials) and not color_regions.uses_vertex_colors(ob)
+
+	# Color the materials by the voltages of a frame (an array of all columns) of the object
+	# Returns the number of materials written
+	def apply(self, v_frame, ob):
+		frac = np.clip((np.asarray(v_frame)[self.cols] - MIN_V)/abs(MAX_V - MIN_V), 0.0, 1.0)
+
+		# Compartments missing from a frame are NaN, and skipped
+		changed = np.nonzero(~np.isnan(frac) & (frac != self.frac_last))[0]
+		for i, f in zip(changed.tolist(), frac[changed].tolist()):
+			self.mats[i].diffuse_color = (f,0.0,1.0-f)
+		self.frac_last[changed] = frac[changed]
+
+		return len(changed)
+
+# Class for the plan of updating the vertex colors of an object every frame, compiled once
+# (for objects set up by color_regions.f_mcell_reg_to_vcol)
+# The region of every loop is read once from the face layer, so that every frame is one gather
+# + normalization over the regions, and one foreach_set of the colors of all loops
+class MN_vcol_plan:
+
+	# Init
+	# comp_index = dictionary of compartment id -> voltage column
+	# source = what the columns refer to (the voltage store, or the voltage directory)
+	def __init__(self, ob, comp_index, source):
+		self.source = source
+		mesh = ob.data
+		self.n_loops = len(mesh.loops)
+
+		# Columns of the regions, -1 = no voltage
+		comp_ids = np.array(ob[color_regions.VCOL_COMP_IDS], dtype=np.int64).reshape(-1,3)
+		self.reg_ids = [tuple(comp_id) for comp_id in comp_ids.tolist()]
+		self.cols = np.array([comp_index.get(reg_id, -1) for reg_id in self.reg_ids], dtype=np.int64)
+		n_regs = len(self.reg_ids)
+
+		# Region of every loop, faces without a region get the extra last row of colors
+		n_faces = len(mesh.polygons)
+		face_reg = np.empty(n_faces, dtype=np.int32)
+		loop_start = np.empty(n_faces, dtype=np.int32)
+		loop_total = np.empty(n_faces, dtype=np.int32)
+		mesh.polygon_layers_int[color_regions.VCOL_REG_LAYER].data.foreach_get("value", face_reg)
+		mesh.polygons.foreach_get("loop_start", loop_start)
+		mesh.polygons.foreach_get("loop_total", loop_total)
+		face_reg[face_reg < 0] = n_regs
+		loops = np.repeat(loop_start - np.cumsum(loop_total) + loop_total, loop_total) + np.arange(loop_total.sum())
+		self.loop_reg = np.full(self.n_loops, n_regs, dtype=np.int64)
+		self.loop_reg[loops] = np.repeat(face_reg, loop_total)
+
+		# Colors of the regions, with 3 or 4 channels as the layer has
+		vcol = mesh.vertex_colors[color_regions.VCOL_LAYER]
+		n_ch = len(vcol.data[0].color) if len(vcol.data) > 0 else 3
+		self.reg_col = np.ones((n_regs+1, n_ch), dtype=np.float32)
+		self.reg_col[:,:3] = color_regions.VCOL_GRAY
+
+		# Fraction shown by every region, NaN = not set yet
+		self.frac_last = np.full(n_regs, np.nan)
+
+	# Is the plan still valid for an object and a voltage source
+	def is_valid(self, ob, source):
+		return self.source == source and self.n_loops == len(ob.data.loops) and color_regions.uses_vertex_colors(ob)
+
+	# Color the loops by the voltages of a frame (an array of all columns)
+	# Returns the number of regions whose color changed
+	def apply(self, v_frame, ob):
+		v_frame = np.asarray(v_frame)
+		has_v = (self.cols >= 0) & (self.cols < len(v_frame))
+		frac = np.full(len(self.cols), np.nan)
+		frac[has_v] = np.clip((v_frame[self.cols[has_v]] - MIN_V)/abs(MAX_V - MIN_V), 0.0, 1.0)
+
+		# Compartments missing from a frame are NaN, and keep their color
+		changed = np.nonzero(~np.isnan(frac) & (frac != self.frac_last))[0]
+		if len(changed) == 0:
+			return 0
+		self.reg_col[changed,0] = frac[changed]
+		self.reg_col[changed,1] = 0.0
+		self.reg_col[changed,2] = 1.0 - frac[changed]
+		self.frac_last[changed] = frac[changed]
+
+		# All loops at once
+		mesh = ob.data
+		mesh.vertex_colors[color_regions.VCOL_LAYER].data.foreach_set("color", self.reg_col[self.loop_reg].ravel())
+		mesh.update()
+
+		return len(changed)
+
+# Compiled plans, by object name
+_frame_plans = {}
+
+# Drop all compiled plans, e.g. after an undo or loading a file, when the materials may have changed
+def clear_frame_plans():
+	_frame_plans.clear()
+
+# Get the plan of an object, compiling it if there is none or it is out of date
+def get_frame_plan(ob, comp_index, source):
+	plan = _frame_plans.get(ob.name)
+	if plan == None or not plan.is_valid(ob, source):
+		if color_regions.uses_vertex_colors(ob):
+			plan = MN_vcol_plan(ob, comp_index, source)
+		else:
+			plan = MN_frame_plan(ob, comp_index, source)
+		_frame_plans[ob.name] = plan
+	return plan
+
+# Last frame shown, for the direction of playback
+_last_frame = [None]
+
 # Main
 
 def f_timeline_voltage(scene, frame):
@@ -65,6 +210,13 @@ def f_timeline_voltage(scene, frame):
 	# Print to console to delimit
 	# print("> Running f_timeline_voltage")
 
+	# Direction of playback, for reading ahead
+	direction = -1 if _last_frame[0] != None and frame < _last_frame[0] else 1
+	_last_frame[0] = frame
+
+	# Frames to read ahead, once per voltage directory shared by several objects
+	prefetch_dict = {}
+
 	# Go through all the objects
 	for mesh_obj in scene.nrnlauncher.mesh_obj_list:
 
@@ -72,7 +224,24 @@ def f_timeline_voltage(scene, frame):
 		v_dir = mesh_obj.v_dir
 		v_zero_pad = mesh_obj.v_zero_pad
 		v_n_files = mesh_obj.v_n_files
-		if v_dir != "":
+		if v_dir != "" and voltage_stream.is_stream(v_dir):
+
+			# Streamed: the frame if it has arrived, else the latest, never waiting
+			# Only streams started by StreamVoltageTimeline, none are started from here
+			stream = voltage_stream.get_stream(v_dir)
+			if stream == None:
+				continue
+			v_frame, comp_index, source = stream.frame_with_index(frame)
+			if v_frame is None:
+				continue
+			ob = bpy.data.objects[mesh_obj.name]
+			plan = get_frame_plan(ob, comp_index, source)
+			try:
+				plan.apply(v_frame, ob)
+			except ReferenceError:
+				_frame_plans.pop(ob.name, None)
+
+		elif v_dir != "":
 
 			# The voltage file no we want to read
 			v_file_no = int(frame) % v_n_files
@@ -80,28 +249,40 @@ def f_timeline_voltage(scene, frame):
 			# Get the object
 			ob = bpy.data.objects[mesh_obj.name]
 
-			# Read the data for this object at this frame
-			v_dict = {}
-			read_voltage_data((v_dir+"v_%0"+str(v_zero_pad)+"d.txt")%v_file_no, v_dict)
-
-			# Check that there is some voltage data to proceed
-			if not len(v_dict) > 0:
-				raise SystemError("No voltage data read!")
-
-			# Max and min voltages for colors
-			min_v = -80
-			max_v = 20
-
-			# Go through all materials        
-			# mat_list = [item.material for item in bpy.context.object.material_slots]
-			for mat in ob.data.materials:
-				mn = mat.name
-				if len(mn) == 23 and mn[-9:] == "_material":
-					reg_id = (int(mn[3:5]),int(mn[6:8]),int(mn[12:14]))
-					if reg_id in v_dict:
-						# Change color
-						frac = min(1.0,max(0.0,(v_dict[reg_id] - min_v)/abs(max_v - min_v)))
-						mat.diffuse_color = (frac,0.0,1.0-frac)
+			# Read the data for this object at this frame, through the frame cache shared by all objects
+			# From the store if the directory has been converted, else from the text file
+			store, data = voltage_store.get_frame(v_dir, v_file_no, v_zero_pad)
+			prefetch_dict[v_dir] = (voltage_store.frames_ahead(v_file_no, v_n_files, direction), v_zero_pad)
 
-	# print("> Finished f_timeline_voltage")
+			if store != None:
+				plan = get_frame_plan(ob, store.index, store)
+				v_frame = data
+			else:
+				ids, vals = data
+
+				# Check that there is some voltage data to proceed
+				if not len(vals) > 0:
+					raise SystemError("No voltage data read!")
 
+				# Columns in the order of the first file read
+				plan = _frame_plans.get(ob.name)
+				if plan == None or not plan.is_valid(ob, v_dir):
+					plan = get_frame_plan(ob, dict([(tuple(key), i) for i, key in enumerate(ids.tolist())]), v_dir)
+				v_dict = dict(zip(map(tuple, ids.tolist()), vals.tolist()))
+				v_frame = np.full(int(plan.cols.max(initial=-1))+1, np.nan)
+				for reg_id, col in zip(plan.reg_ids, plan.cols.tolist()):
+					if col >= 0:
+						v_frame[col] = v_dict.get(reg_id, np.nan)
+
+			# Color the materials, or the vertex colors
+			try:
+				plan.apply(v_frame, ob)
+			except ReferenceError:
+				# A material was removed: compile again
+				_frame_plans.pop(ob.name, None)
+
+	# Read the next frames in the background while this one is drawn
+	for v_dir, (frames, v_zero_pad) in prefetch_dict.items():
+		voltage_store.prefetcher.request(v_dir, frames, v_zero_pad)
+
+	# print("> Finished f_timeline_voltage")
@@ -0,0 +1,336 @@
+# Store of the voltages of all frames of a voltage directory in a single binary file,
+# read as a memory mapped (frames x compartments) float32 array
+#
+# Independent of Blender: a voltage directory can be converted ahead of time with
+#   python voltage_store.py v_dir
+#
+# The voltage directory holds one text file per frame, v_<frame>.txt, with lines of
+#   section point 1, section point 2, segment, voltage
+# The store file starts with a header:
+#   magic (8 bytes), version, number of frames, number of compartments (uint32 each)
+# followed by the compartment ids (number of compartments x 3 int32), in the order of the
+# columns, and then the voltages, starting at a multiple of DATA_ALIGN bytes
+
+import numpy as np
+
+import os
+
+import sys
+
+import re
+
+import struct
+
+import collections
+
+import threading
+
+# Name of the store file in the voltage directory
+STORE_FNAME = "voltage_store.bin"
+
+# Header
+STORE_MAGIC = b"NLVSTORE"
+STORE_VERSION = 1
+HEADER_FMT = "<8sIII"
+
+# Alignment of the voltages in the file
+DATA_ALIGN = 64
+
+# Size of the frame cache shared by all objects
+CACHE_MAX_BYTES = 256*1024*1024
+
+# Number of frames read ahead of the current frame during playback
+PREFETCH_FRAMES = 16
+
+# Voltage text files
+VOLTAGE_FNAME_RE = re.compile(r"^v_(\d+)\.txt$")
+
+# Read a voltage text file
+# Returns (compartment ids as (n,3) int32, voltages as float32)
+def read_voltage_file(fname):
+    ids = []
+    vals = []
+    with open(fname, "r") as f:
+        for line in f:
+            line_s = line.split()
+            if len(line_s) == 4:
+                ids.append((int(line_s[0]),int(line_s[1]),int(line_s[2])))
+                vals.append(float(line_s[3]))
+    return np.array(ids, dtype=np.int32).reshape(-1,3), np.array(vals, dtype=np.float32)
+
+# Voltage text files of a directory
+# Returns a dictionary of frame number -> file name
+def voltage_files(v_dir):
+    f_dict = {}
+    for entry in os.scandir(v_dir):
+        m = VOLTAGE_FNAME_RE.match(entry.name)
+        if m:
+            f_dict[int(m.group(1))] = entry.path
+    return f_dict
+
+# File name of the store of a voltage directory
+def store_fname(v_dir):
+    return os.path.join(v_dir, STORE_FNAME)
+
+# Is the store of a voltage directory missing or older than any of its text files
+def store_is_stale(v_dir):
+    fname = store_fname(v_dir)
+    if not os.path.isfile(fname):
+        return True
+    t_store = os.path.getmtime(fname)
+    f_dict = voltage_files(v_dir)
+    if len(f_dict) == 0:
+        return False
+    if any([os.path.getmtime(f) > t_store for f in f_dict.values()]):
+        return True
+
+    # Frames added or removed
+    store = MN_voltage_store(fname)
+    return store.n_frames != max(f_dict.keys()) + 1
+
+# Offset of the voltages in a store file
+def data_offset(n_comps):
+    n_bytes = struct.calcsize(HEADER_FMT) + 3*4*n_comps
+    return ((n_bytes + DATA_ALIGN - 1) // DATA_ALIGN) * DATA_ALIGN
+
+# Pack all text files of a voltage directory into a store
+# The compartments are those of the first frame; compartments missing from a frame are NaN
+# Frames are numbered by the file names, missing frames are all NaN
+# Returns the file name of the store
+def convert_voltage_dir(v_dir, fname=None):
+    if fname == None:
+        fname = store_fname(v_dir)
+
+    f_dict = voltage_files(v_dir)
+    if len(f_dict) == 0:
+        raise SystemError("No voltage files v_<frame>.txt in: " + str(v_dir))
+    frames = sorted(f_dict.keys())
+    n_frames = frames[-1] + 1
+
+    # Compartments and their columns
+    comp_ids, _ = read_voltage_file(f_dict[frames[0]])
+    n_comps = len(comp_ids)
+    col_dict = dict([(tuple(comp_id), i) for i, comp_id in enumerate(comp_ids.tolist())])
+
+    print("> Converting " + str(len(frames)) + " voltage files of " + str(n_comps) + " compartments to: " + str(fname))
+
+    # Header, then the voltages written frame by frame through a memory map
+    # Written to a temporary file first, so that a reader never sees a half written store
+    offset = data_offset(n_comps)
+    fname_tmp = fname + "." + str(os.getpid()) + ".tmp"
+    try:
+        with open(fname_tmp, "wb") as f:
+            f.write(struct.pack(HEADER_FMT, STORE_MAGIC, STORE_VERSION, n_frames, n_comps))
+            f.write(comp_ids.astype("<i4").tobytes())
+            f.truncate(offset + 4*n_frames*n_comps)
+
+        data = np.memmap(fname_tmp, dtype="<f4", mode="r+", offset=offset, shape=(n_frames, n_comps))
+        data[:] = np.nan
+        n_unknown = 0
+        for frame in frames:
+            ids, vals = read_voltage_file(f_dict[frame])
+            cols = np.array([col_dict.get(comp_id, -1) for comp_id in map(tuple, ids.tolist())], dtype=np.int64).reshape(-1)
+            known = cols >= 0
+            n_unknown += int(np.sum(~known))
+            data[frame, cols[known]] = vals[known]
+        data.flush()
+        del data
+    except OSError:
+        # No half written temporary file left behind
+        if os.path.isfile(fname_tmp):
+            os.remove(fname_tmp)
+        raise
+
+    os.replace(fname_tmp, fname)
+
+    if n_unknown > 0:
+        print("> Ignored " + str(n_unknown) + " voltages of compartments not in the first frame")
+
+    return fname
+
+# Class for reading a voltage store
+class MN_voltage_store:
+
+    # Init
+    def __init__(self, fname):
+        self.fname = fname
+        with open(fname, "rb") as f:
+            header = f.read(struct.calcsize(HEADER_FMT))
+            magic, version, self.n_frames, self.n_comps = struct.unpack(HEADER_FMT, header)
+            if magic != STORE_MAGIC or version != STORE_VERSION:
+                raise SystemError("Not a voltage store of version " + str(STORE_VERSION) + ": " + str(fname))
+            self.comp_ids = np.frombuffer(f.read(3*4*self.n_comps), dtype="<i4").reshape(-1,3)
+
+        # Compartment id -> column
+        self.index = dict([(tuple(comp_id), i) for i, comp_id in enumerate(self.comp_ids.tolist())])
+
+        self.data = np.memmap(fname, dtype="<f4", mode="r", offset=data_offset(self.n_comps), shape=(self.n_frames, self.n_comps))
+
+    # Voltages of all compartments at a frame, wrapping around the number of frames
+    # A view of the memory map: nothing is read until it is used
+    def frame(self, frame):
+        return self.data[int(frame) % self.n_frames]
+
+    # Voltages of all compartments at a frame, copied out of the memory map into a new array
+    # Unlike frame, the pages are read here (NumPy copies without holding the interpreter lock),
+    # so that it can be done ahead of time on another thread
+    def read_frame(self, frame):
+        return np.array(self.frame(frame))
+
+# Class for a cache of frames, by frame_key, evicting the least recently used
+# frames beyond a number of bytes
+# Shared by all objects and by the prefetch thread: every frame is read at most once, also when
+# the main thread asks for a frame that is being read ahead
+class MN_frame_cache:
+
+    # Init
+    def __init__(self, max_bytes=CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.frames = collections.OrderedDict()
+        self.n_bytes = 0
+        self.n_hits = 0
+        self.n_misses = 0
+
+        # Frames being read, by key, with an event set when they are in the cache
+        self.loading = {}
+        self.lock = threading.Lock()
+
+    # Is a frame in the cache
+    def __contains__(self, key):
+        with self.lock:
+            return key in self.frames
+
+    # Get a frame, calling load() to read it if it is not in the cache
+    # load returns (frame, number of bytes)
+    def get(self, key, load):
+        while True:
+            with self.lock:
+                if key in self.frames:
+                    self.frames.move_to_end(key)
+                    self.n_hits += 1
+                    return self.frames[key][0]
+                event = self.loading.get(key)
+                if event == None:
+                    # Read by this thread
+                    event = threading.Event()
+                    self.loading[key] = event
+                    self.n_misses += 1
+                    break
+            # Being read by another thread: wait for it, then look again
+            event.wait()
+
+        try:
+            val, n_bytes = load()
+            self.put(key, val, n_bytes)
+        finally:
+            with self.lock:
+                del self.loading[key]
+            event.set()
+        return val
+
+    # Add a frame, evicting the least recently used ones if over the size
+    def put(self, key, val, n_bytes):
+        with self.lock:
+            if key in self.frames:
+                self.n_bytes -= self.frames.pop(key)[1]
+            self.frames[key] = (val, n_bytes)
+            self.n_bytes += n_bytes
+            while self.n_bytes > self.max_bytes and len(self.frames) > 1:
+                self.n_bytes -= self.frames.popitem(last=False)[1][1]
+
+    # Drop the frames of a voltage directory (or all frames)
+    def drop(self, v_dir=None):
+        with self.lock:
+            for key in [key for key in self.frames if v_dir == None or key[0] == v_dir]:
+                self.n_bytes -= self.frames.pop(key)[1]
+
+# Class for a thread reading frames into a cache ahead of playback
+# Only the latest request is kept: when the frame changes, frames not read yet for the previous
+# frame are forgotten
+class MN_prefetcher:
+
+    # Init
+    def __init__(self, cache):
+        self.cache = cache
+        self.pending = collections.deque()
+        self.cond = threading.Condition()
+        self.thread = None
+
+    # Read the given frames of a voltage directory ahead, replacing any earlier request for it
+    def request(self, v_dir, frames, v_zero_pad=1):
+        with self.cond:
+            self.pending = collections.deque([item for item in self.pending if item[0] != v_dir])
+            self.pending.extend([(v_dir, frame, v_zero_pad) for frame in frames])
+            if self.thread == None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.run, name="voltage_prefetch", daemon=True)
+                self.thread.start()
+            self.cond.notify()
+
+    # Forget all requests
+    def cancel(self):
+        with self.cond:
+            self.pending.clear()
+
+    # Thread loop
+    def run(self):
+        while True:
+            with self.cond:
+                while len(self.pending) == 0:
+                    self.cond.wait()
+                v_dir, frame, v_zero_pad = self.pending.popleft()
+            if frame_key(v_dir, frame, open_store(v_dir)) in self.cache:
+                continue
+            try:
+                get_frame(v_dir, frame, v_zero_pad)
+            except (OSError, ValueError, SystemError) as e:
+                # Reported when the frame is shown
+                print("Prefetch of frame " + str(frame) + " of " + str(v_dir) + " failed: " + str(e))
+
+# Open stores, by file name, with the time they were modified
+_open_stores = {}
+
+# Open the store of a voltage directory, reusing it while the file is unchanged
+# Returns None if the directory has no store
+def open_store(v_dir):
+    fname = store_fname(v_dir)
+    if not os.path.isfile(fname):
+        return None
+    mtime = os.path.getmtime(fname)
+    if not fname in _open_stores or _open_stores[fname][0] != mtime:
+        # Frames cached from the text files or from the previous store are out of date
+        frame_cache.drop(v_dir)
+        _open_stores[fname] = (mtime, MN_voltage_store(fname))
+    return _open_stores[fname][1]
+
+# Frame cache and prefetch thread shared by all objects
+frame_cache = MN_frame_cache()
+prefetcher = MN_prefetcher(frame_cache)
+
+# Key of a frame in the cache: frames of the store and of the text files are kept apart,
+# as they are different kinds of data
+def frame_key(v_dir, frame, store):
+    return (v_dir, "text" if store == None else "store", frame)
+
+# Read one frame of a voltage directory, from its store if given, else from its text file
+# Returns an array of the voltages of all columns of the store, or (compartment ids, voltages)
+# of the text file, and the number of bytes
+def load_frame(v_dir, frame, store, v_zero_pad=1):
+    if store != None:
+        v_frame = store.read_frame(frame)
+        return v_frame, v_frame.nbytes
+    ids, vals = read_voltage_file(os.path.join(v_dir, ("v_%0" + str(v_zero_pad) + "d.txt") % frame))
+    return (ids, vals), ids.nbytes + vals.nbytes
+
+# Get one frame of a voltage directory through the cache, reading it once
+# Returns (the store, or None if read from the text file, the frame as load_frame gives it)
+def get_frame(v_dir, frame, v_zero_pad=1):
+    store = open_store(v_dir)
+    return store, frame_cache.get(frame_key(v_dir, frame, store), lambda: load_frame(v_dir, frame, store, v_zero_pad))
+
+# Frames to read ahead of a frame, in the direction of playback, wrapping around
+def frames_ahead(frame, n_frames, direction=1, n_ahead=PREFETCH_FRAMES):
+    n_ahead = min(n_ahead, n_frames - 1)
+    return [(frame + direction*k) % n_frames for k in range(1, n_ahead + 1)]
+
+if __name__ == "__main__":
+    convert_voltage_dir(sys.argv[1])
@@ -0,0 +1,283 @@
+# Stream of the voltages of a running simulation, received on a local socket into a ring buffer
+# of the latest frames, read by the timeline like a voltage store
+#
+# Independent of Blender: the sending side (MN_stream_sender) can be used from the NEURON process,
+# and a stand-in producer replays a voltage directory, or made up voltages, for testing:
+#   python voltage_stream.py [host:port] [v_dir] [frames per second]
+#
+# The sender connects and sends a header:
+#   magic (8 bytes), version, number of compartments (uint32 each)
+# followed by the compartment ids (number of compartments x 3 int32), as in the voltage store,
+# and then every frame as:
+#   frame number (uint32), voltages of all compartments in the order of the ids (float32)
+
+import numpy as np
+
+import sys
+
+import time
+
+import socket
+
+import struct
+
+import threading
+
+# Voltage text files, and the compartments of a voltage directory
+# Imported as a package module in Blender, as a plain module when run as a script
+try:
+    from . import voltage_store
+except ImportError:
+    import voltage_store
+
+# Address given to the timeline as the voltage directory of a streamed object: stream://host:port
+STREAM_PREFIX = "stream://"
+DEFAULT_ADDRESS = "127.0.0.1:5555"
+
+# Header
+STREAM_MAGIC = b"NLVSTREM"
+STREAM_VERSION = 1
+HEADER_FMT = "<8sII"
+FRAME_FMT = "<I"
+
+# Number of frames kept in the ring buffer
+STREAM_CAPACITY = 1000
+
+# Is a voltage directory the address of a stream
+def is_stream(v_dir):
+    return v_dir.startswith(STREAM_PREFIX)
+
+# (host, port) of an address host:port, with or without the prefix
+def parse_address(address):
+    if is_stream(address):
+        address = address[len(STREAM_PREFIX):]
+    host, port = address.rsplit(":", 1)
+    return host, int(port)
+
+# Fill a buffer from a socket
+# Returns False if the connection was closed
+def recv_exact(sock, buf):
+    view = memoryview(buf).cast("B")
+    while len(view) > 0:
+        n = sock.recv_into(view)
+        if n == 0:
+            return False
+        view = view[n:]
+    return True
+
+# Class for receiving a stream, listening on host:port on a background thread
+# Frames are only copied into the ring buffer and out of it under the lock: the timeline never waits
+# for the network, and shows the latest frame received when asked for one that has not arrived
+class MN_voltage_stream:
+
+    # Init
+    def __init__(self, address, capacity=STREAM_CAPACITY):
+        self.address = address
+        self.capacity = capacity
+        self.lock = threading.Lock()
+
+        # Set from the header of every new sender
+        self.index = None
+        self.comp_ids = None
+        self.n_comps = 0
+        self.generation = 0
+
+        # Ring buffer: voltages and frame number of every slot, frames in [first, last] are kept
+        self.data = None
+        self.slot_frame = None
+        self.first = -1
+        self.last = -1
+
+        # Listen
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind(parse_address(address))
+        self.sock.listen(1)
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name="voltage_stream", daemon=True)
+        self.thread.start()
+
+        print("> Listening for voltages on: " + str(address))
+
+    # Number of frames received so far (for the frame numbers of the timeline)
+    @property
+    def n_frames(self):
+        return self.last + 1
+
+    # Key of the compartments of the stream, changing with every new sender
+    def source_key(self):
+        return (self.address, self.generation)
+
+    # Voltages of all compartments at a frame, without waiting
+    # The latest frame received if the frame has not arrived, the oldest kept if it is gone
+    # Returns None if no frame has arrived
+    def frame(self, frame):
+        return self.frame_with_index(frame)[0]
+
+    # Voltages at a frame as frame does, with the compartment index and source key they belong to,
+    # taken together so that a new sender in between cannot mix them up
+    # Returns (voltages or None, compartment id -> column, source key)
+    def frame_with_index(self, frame):
+        with self.lock:
+            if self.last < 0:
+                return None, self.index, self.source_key()
+            frame = min(max(int(frame), self.first), self.last)
+
+            # Frames may be skipped by the sender: the latest one received up to the frame
+            slot = frame % self.capacity
+            while self.slot_frame[slot] != frame and frame > self.first:
+                frame -= 1
+                slot = frame % self.capacity
+            return self.data[slot].copy(), self.index, self.source_key()
+
+    # Thread loop: one sender at a time
+    def run(self):
+        while self.running:
+            try:
+                conn, addr = self.sock.accept()
+            except OSError:
+                # Closed by stop
+                break
+            print("Voltage stream connected from: " + str(addr))
+            try:
+                self.receive(conn)
+            except (OSError, SystemError) as e:
+                print("Voltage stream failed: " + str(e))
+            finally:
+                conn.close()
+            print("Voltage stream disconnected from: " + str(addr))
+
+    # Read the header and the frames of one sender
+    def receive(self, conn):
+        header = bytearray(struct.calcsize(HEADER_FMT))
+        if not recv_exact(conn, header):
+            return
+        magic, version, n_comps = struct.unpack(HEADER_FMT, header)
+        if magic != STREAM_MAGIC or version != STREAM_VERSION:
+            raise SystemError("Not a voltage stream of version " + str(STREAM_VERSION))
+        comp_ids = np.empty((n_comps,3), dtype="<i4")
+        if not recv_exact(conn, comp_ids):
+            return
+
+        with self.lock:
+            # A new set of compartments: start again
+            if self.comp_ids is None or not np.array_equal(comp_ids, self.comp_ids):
+                self.comp_ids = comp_ids
+                self.n_comps = n_comps
+                self.index = dict([(tuple(comp_id), i) for i, comp_id in enumerate(comp_ids.tolist())])
+                self.generation += 1
+                self.data = np.full((self.capacity, n_comps), np.nan, dtype=np.float32)
+                self.slot_frame = np.full(self.capacity, -1, dtype=np.int64)
+                self.first = -1
+                self.last = -1
+
+        # Frames, received outside of the lock, then copied into their slot
+        frame_no = bytearray(struct.calcsize(FRAME_FMT))
+        v_frame = np.empty(n_comps, dtype="<f4")
+        while self.running:
+            if not recv_exact(conn, frame_no) or not recv_exact(conn, v_frame):
+                return
+            frame = struct.unpack(FRAME_FMT, frame_no)[0]
+            with self.lock:
+                # Restarted sender: frames start again
+                if frame < self.last:
+                    self.slot_frame[:] = -1
+                    self.first = -1
+                slot = frame % self.capacity
+                self.data[slot] = v_frame
+                self.slot_frame[slot] = frame
+                self.last = frame
+                if self.first < 0:
+                    self.first = frame
+                self.first = max(self.first, frame - self.capacity + 1)
+
+    # Stop listening
+    def stop(self):
+        self.running = False
+        self.sock.close()
+
+# Streams being received, by address
+_streams = {}
+
+# Address host:port of a stream, with or without the prefix
+def stream_address(v_dir):
+    return v_dir[len(STREAM_PREFIX):] if is_stream(v_dir) else v_dir
+
+# Start listening on an address (stream://host:port), or get the stream already listening there
+def start_stream(v_dir):
+    address = stream_address(v_dir)
+    if not address in _streams:
+        _streams[address] = MN_voltage_stream(address)
+    return _streams[address]
+
+# Get the stream of an address without starting one
+# Returns None if nothing is listening there (e.g. after a file load)
+def get_stream(v_dir):
+    return _streams.get(stream_address(v_dir))
+
+# Stop all streams
+def stop_streams():
+    for stream in _streams.values():
+        stream.stop()
+    _streams.clear()
+
+# Class for sending voltages, e.g. from the NEURON process every time step to show
+class MN_stream_sender:
+
+    # Init
+    # comp_ids = (section point 1, section point 2, segment) of every compartment, in the order
+    # of the voltages sent
+    def __init__(self, address, comp_ids):
+        self.comp_ids = np.asarray(comp_ids, dtype="<i4").reshape(-1,3)
+        self.sock = socket.create_connection(parse_address(address))
+        self.sock.sendall(struct.pack(HEADER_FMT, STREAM_MAGIC, STREAM_VERSION, len(self.comp_ids)))
+        self.sock.sendall(self.comp_ids.tobytes())
+
+    # Send the voltages of all compartments at a frame
+    def send(self, frame, vals):
+        vals = np.asarray(vals, dtype="<f4")
+        if len(vals) != len(self.comp_ids):
+            raise SystemError("Expected " + str(len(self.comp_ids)) + " voltages, got " + str(len(vals)))
+        self.sock.sendall(struct.pack(FRAME_FMT, frame) + vals.tobytes())
+
+    # Close
+    def close(self):
+        self.sock.close()
+
+# Stand-in producer: replay the frames of a voltage directory, or send a made up wave of voltages
+# over 100 compartments, forever
+def run_producer(address=DEFAULT_ADDRESS, v_dir=None, fps=24.0):
+    if v_dir != None:
+        f_dict = voltage_store.voltage_files(v_dir)
+        if len(f_dict) == 0:
+            raise SystemError("No voltage files v_<frame>.txt in: " + str(v_dir))
+        frames = sorted(f_dict.keys())
+        comp_ids, _ = voltage_store.read_voltage_file(f_dict[frames[0]])
+        col_dict = dict([(tuple(comp_id), i) for i, comp_id in enumerate(comp_ids.tolist())])
+    else:
+        comp_ids = np.stack([np.arange(100), np.arange(100) + 1, np.zeros(100)], axis=1)
+
+    sender = MN_stream_sender(address, comp_ids)
+    print("> Sending voltages of " + str(len(comp_ids)) + " compartments to: " + str(address))
+
+    frame = 0
+    try:
+        while True:
+            if v_dir != None:
+                ids, vals = voltage_store.read_voltage_file(f_dict[frames[frame % len(frames)]])
+                v_frame = np.full(len(comp_ids), np.nan, dtype=np.float32)
+                for comp_id, v in zip(map(tuple, ids.tolist()), vals.tolist()):
+                    if comp_id in col_dict:
+                        v_frame[col_dict[comp_id]] = v
+            else:
+                v_frame = -30.0 + 50.0*np.sin(0.2*frame - 0.1*np.arange(len(comp_ids)))
+            sender.send(frame, v_frame)
+            frame += 1
+            time.sleep(1.0/fps)
+    finally:
+        sender.close()
+
+if __name__ == "__main__":
+    run_producer(sys.argv[1] if len(sys.argv) > 1 else DEFAULT_ADDRESS,
+                 sys.argv[2] if len(sys.argv) > 2 else None,
+                 float(sys.argv[3]) if len(sys.argv) > 3 else 24.0)
@@ -0,0 +1,55 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import cap_triangulation
+
+
+# Planar figure-8 of n points, crossing itself at the origin between points n//2 and n//2+1,
+# and between n-1 and 0
+def figure_8(n=21):
+    t = 2.0*np.pi*(np.arange(n) + 0.25)/n
+    return np.stack([np.sin(t), np.sin(t)*np.cos(t), np.zeros(n)], axis=1)
+
+
+def circle(n=12):
+    t = 2.0*np.pi*np.arange(n)/n
+    return np.stack([np.cos(t), np.sin(t), np.zeros(n)], axis=1)
+
+
+def test_keeps_loop_edges_of_fan():
+    pts = circle()
+    pts_new, tris = cap_triangulation.triangulate_loop_fan(pts)
+    assert len(pts_new) == 1
+    assert cap_triangulation.keeps_loop_edges(tris, len(pts))
+
+
+def test_crossing_loop_with_steiner_point_is_rejected():
+    # What Triangle makes of the figure-8: a Steiner point s at the crossing, each lobe a fan around
+    # it, n-2 triangles in all, and the crossing loop edges (10,11) and (20,0) missing
+    n = 21
+    s = n
+    tris = [[s, i, i+1] for i in range(0, 10)] + [[s, i, i+1] for i in range(11, 20)]
+    assert len(tris) == n - 2
+    assert not cap_triangulation.keeps_loop_edges(tris, n)
+
+
+def test_crossing_loop_falls_back_to_fan():
+    pytest.importorskip("meshpy.triangle")
+    pts = figure_8()
+    for refine in [False, True]:
+        pts_new, tris = cap_triangulation.triangulate_loop(pts, refine)
+        assert cap_triangulation.keeps_loop_edges(tris, len(pts))
+        assert len(pts_new) == 1 and len(tris) == len(pts)
+
+
+def test_simple_loop_is_triangulated():
+    pytest.importorskip("meshpy.triangle")
+    pts = circle()
+    pts_new, tris = cap_triangulation.triangulate_loop(pts)
+    assert len(pts_new) == 0 and len(tris) == len(pts) - 2
+    assert cap_triangulation.keeps_loop_edges(tris, len(pts))
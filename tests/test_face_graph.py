@@ -0,0 +1,102 @@
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import face_graph
+
+
+# Grid of nx x ny quads in the z=0 plane, counterclockwise seen from +z
+# Returns (vertex coordinates, list of the vertex ids of every face)
+def quad_grid(nx=6, ny=4):
+    xs, ys = np.meshgrid(np.arange(nx+1), np.arange(ny+1), indexing="ij")
+    co = np.stack([xs.ravel(), ys.ravel(), np.zeros(xs.size)], axis=1).astype(float)
+    vid = lambda i, j: i*(ny+1) + j
+    faces = [[vid(i,j), vid(i+1,j), vid(i+1,j+1), vid(i,j+1)] for i in range(nx) for j in range(ny)]
+    return co, faces
+
+
+# Loop arrays of the faces, with the loops of the faces stored in a shuffled order, so that
+# loop_start is not increasing
+def shuffled_loops(faces, seed=3):
+    perm = np.random.RandomState(seed).permutation(len(faces))
+    loop_total = np.array([len(f) for f in faces])
+    block_start = np.zeros(len(faces), dtype=np.int64)
+    np.cumsum(loop_total[perm][:-1], out=block_start[1:])
+    loop_start = np.zeros(len(faces), dtype=np.int64)
+    loop_start[perm] = block_start
+    loop_verts = np.zeros(loop_total.sum(), dtype=np.int64)
+    for f, start in enumerate(loop_start):
+        loop_verts[start:start+loop_total[f]] = faces[f]
+    return loop_start, loop_total, loop_verts
+
+
+def grid_graph(faces, n_verts):
+    return face_graph.MN_face_graph(*shuffled_loops(faces), n_verts=n_verts)
+
+
+def test_neighbors_of_shuffled_loops():
+    co, faces = quad_grid()
+    g = grid_graph(faces, len(co))
+    assert np.array_equal(g.face_vert_idx, np.concatenate(faces))
+
+    face_sets = [set(f) for f in faces]
+    for f in range(len(faces)):
+        n_shared = [len(face_sets[f] & s) for s in face_sets]
+        by_vert = set([h for h in range(len(faces)) if n_shared[h] > 0])
+        by_edge = set([h for h in range(len(faces)) if n_shared[h] == 2])
+        assert set(g.neighbors([f]).tolist()) == by_vert
+        assert set(g.neighbors([f], face_step=False).tolist()) == by_edge
+
+
+def test_label_components():
+    nx, ny = 6, 4
+    co, faces = quad_grid(nx, ny)
+    g = grid_graph(faces, len(co))
+    col = np.repeat(np.arange(nx), ny)
+    row = np.tile(np.arange(ny), nx)
+
+    # Column 2 left out: the columns left and right of it are two components
+    labels, n = g.label_components(col != 2)
+    assert n == 2
+    assert np.all(labels[col == 2] == -1)
+    assert len(np.unique(labels[col < 2])) == 1 and len(np.unique(labels[col > 2])) == 1
+    assert labels[0] != labels[-1]
+
+    # Checkerboard: faces only touch at a vertex, every face is a component of its own
+    mask = (col + row) % 2 == 0
+    labels, n = g.label_components(mask)
+    assert n == mask.sum()
+    assert np.array_equal(np.sort(labels[mask]), np.arange(n))
+
+
+# Signed area of a loop in the z=0 plane, positive if counterclockwise
+def signed_area(co, loop):
+    x, y = co[loop,0], co[loop,1]
+    return 0.5*np.sum(x*np.roll(y,-1) - np.roll(x,-1)*y)
+
+
+def test_boundary_loops():
+    nx, ny = 6, 4
+    co, faces = quad_grid(nx, ny)
+
+    # A hole in the middle
+    hole = faces.pop(2*ny + 1)
+    g = grid_graph(faces, len(co))
+
+    loops = sorted(g.boundary_loops(), key=len)
+    assert len(loops) == 2
+    inner, outer = loops
+
+    # Every boundary edge once, consecutive verts of a loop are boundary edges
+    bnd_edges = set([tuple(sorted(e)) for e in g.edge_verts[g.edge_degree == 1].tolist()])
+    loop_edges = [tuple(sorted(e)) for loop in loops for e in zip(loop.tolist(), np.roll(loop,-1).tolist())]
+    assert len(loop_edges) == len(bnd_edges) and set(loop_edges) == bnd_edges
+    assert set(inner.tolist()) == set(hole) and len(outer) == 2*(nx + ny)
+
+    # Against the direction of the faces (counterclockwise): a cap over the hole is
+    # counterclockwise, the outer loop is walked clockwise
+    assert signed_area(co, inner) > 0
+    assert signed_area(co, outer) < 0
@@ -0,0 +1,48 @@
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import mesh_intersect
+
+
+# n small triangles scattered in the unit cube, each with its own 3 vertices
+def random_triangles(n, seed, size=0.15):
+    rng = np.random.RandomState(seed)
+    co = (rng.rand(n,1,3) + size*(rng.rand(n,3,3) - 0.5)).reshape(-1,3)
+    return co, np.arange(3*n).reshape(-1,3)
+
+
+# Intersecting pairs of all pairs of triangles, without the tree
+def brute_force(co_a, tris_a, co_b, tris_b):
+    i, j = np.meshgrid(np.arange(len(tris_a)), np.arange(len(tris_b)), indexing="ij")
+    i, j = i.ravel(), j.ravel()
+    hit = mesh_intersect.triangles_intersect(co_a[tris_a][i], co_b[tris_b][j])
+    return np.stack([i[hit], j[hit]], axis=1)
+
+
+def test_two_meshes_match_brute_force():
+    co_a, tris_a = random_triangles(150, 1)
+    co_b, tris_b = random_triangles(120, 2)
+    expected = brute_force(co_a, tris_a, co_b, tris_b)
+    assert len(expected) > 0
+    found = mesh_intersect.find_intersections(co_a, tris_a, co_b, tris_b, leaf_size=4)
+    assert np.array_equal(found, expected)
+
+
+def test_self_intersections_match_brute_force():
+    co, tris = random_triangles(200, 3)
+    expected = brute_force(co, tris, co, tris)
+    expected = expected[expected[:,0] < expected[:,1]]
+    assert len(expected) > 0
+    found = mesh_intersect.find_intersections(co, tris, leaf_size=4)
+    assert np.array_equal(found, expected)
+
+
+def test_fold_at_shared_vertex():
+    # Triangle 1 shares vertex 0 with triangle 0 and passes through it; triangle 2 shares an edge
+    co = np.array([[0,0,0], [2,0,0], [0,2,0], [1,0.5,-1], [1,0.5,1], [-1,-1,0]], dtype=float)
+    tris = np.array([[0,1,2], [0,3,4], [0,2,5]])
+    assert np.array_equal(mesh_intersect.find_intersections(co, tris), [[0,1]])
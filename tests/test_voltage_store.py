@@ -0,0 +1,66 @@
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import voltage_store
+
+
+COMP_IDS = [(0,1,1), (1,2,1), (1,2,2)]
+
+
+def write_voltage_file(v_dir, frame, volts):
+    with open(os.path.join(str(v_dir), "v_%d.txt" % frame), "w") as f:
+        for comp_id, v in volts:
+            f.write("%d %d %d %g\n" % (comp_id + (v,)))
+
+
+def test_convert_and_read_round_trip(tmp_path):
+    # Frame 2 is missing, frame 3 lacks a compartment and has one not in the first frame
+    write_voltage_file(tmp_path, 0, [(c, -65.0 + i) for i, c in enumerate(COMP_IDS)])
+    write_voltage_file(tmp_path, 1, [(c, -60.0 + i) for i, c in enumerate(COMP_IDS)])
+    write_voltage_file(tmp_path, 3, [(COMP_IDS[2], 10.0), (COMP_IDS[0], 12.5), ((5,6,1), 3.0)])
+
+    v_dir = str(tmp_path)
+    assert voltage_store.store_is_stale(v_dir)
+    fname = voltage_store.convert_voltage_dir(v_dir)
+    assert fname == voltage_store.store_fname(v_dir)
+    assert not voltage_store.store_is_stale(v_dir)
+    assert [f for f in os.listdir(v_dir) if f.endswith(".tmp")] == []
+
+    store = voltage_store.open_store(v_dir)
+    assert store.n_frames == 4 and store.n_comps == len(COMP_IDS)
+    assert [store.index[c] for c in COMP_IDS] == [0, 1, 2]
+
+    for frame in [0, 1]:
+        ids, vals = voltage_store.read_voltage_file(os.path.join(v_dir, "v_%d.txt" % frame))
+        cols = [store.index[tuple(c)] for c in ids.tolist()]
+        assert np.array_equal(store.frame(frame)[cols], vals)
+    assert np.all(np.isnan(store.frame(2)))
+    assert np.array_equal(store.frame(3), [12.5, np.nan, 10.0], equal_nan=True)
+
+    # Wrapping around the number of frames
+    assert np.array_equal(store.frame(5), store.frame(1))
+
+
+def test_get_frame_from_store_and_text_files(tmp_path):
+    write_voltage_file(tmp_path, 0, [(c, -65.0 + i) for i, c in enumerate(COMP_IDS)])
+    write_voltage_file(tmp_path, 1, [(c, -60.0 + i) for i, c in enumerate(COMP_IDS)])
+    v_dir = str(tmp_path)
+
+    # No store: the text file
+    store, (ids, vals) = voltage_store.get_frame(v_dir, 1)
+    assert store == None
+    assert ids.tolist() == [list(c) for c in COMP_IDS]
+    assert np.array_equal(vals, [-60.0, -59.0, -58.0])
+
+    # Once there is a store, the frames cached from the text files are not used
+    voltage_store.convert_voltage_dir(v_dir)
+    store, v_frame = voltage_store.get_frame(v_dir, 1)
+    assert store is voltage_store.open_store(v_dir)
+    assert isinstance(v_frame, np.ndarray)
+    assert np.array_equal(v_frame, [-60.0, -59.0, -58.0])
+    assert voltage_store.frame_key(v_dir, 1, store) in voltage_store.frame_cache
+    assert not voltage_store.frame_key(v_dir, 1, None) in voltage_store.frame_cache